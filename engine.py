@@ -26,9 +26,6 @@ from tank.log import LogManager
 from tank.platform import Engine
 from tank.platform.constants import SHOTGUN_ENGINE_NAME
 
-import BlackmagicFusion as bmd
-fusion = bmd.scriptapp("Fusion")
-
 __author__ = "Diego Garcia Huerta"
 __email__ = "diegogh2000@gmail.com"
 
@@ -37,6 +34,14 @@ __email__ = "diegogh2000@gmail.com"
 # when Fusion software version is above the tested one.
 SHOW_COMP_DLG = "SGTK_COMPATIBILITY_DIALOG_SHOWN"
 
+# env variable forcing the engine to run without UI, for instance on render
+# nodes launched with a full Fusion install
+BATCH_MODE_ENV = "SGTK_FUSION_BATCH_MODE"
+
+# names of the Fusion executables that have no UI, matched against the
+# lower case file name Fusion reports for itself
+HEADLESS_EXECUTABLES = ("fusionrendernode", "fusionconsole")
+
 
 def show_error(msg):
     t = time.asctime(time.localtime())
@@ -120,7 +125,7 @@ class FusionEngine(Engine):
         # note: we make an exception for the shotgun engine which is a
         # special case.
         """
-        if self.name != SHOTGUN_ENGINE_NAME:
+        if self.name != SHOTGUN_ENGINE_NAME and self.has_ui:
             icon_path = self.__get_platform_resource_path("folder_256.png")
 
             self.register_command(
@@ -140,6 +145,9 @@ class FusionEngine(Engine):
         Registers a "Reload and Restart" command with the engine if any
         running apps are registered via a dev descriptor.
         """
+        if not self.has_ui:
+            return
+
         from tank.platform import restart
         self.register_command(
             "Reload and Restart",
@@ -149,6 +157,560 @@ class FusionEngine(Engine):
              "type": "context_menu"}
         )
 
+    def __register_render_command(self):
+        """
+        Registers a "Render Comp Locally" command rendering the current comp
+        in chunks, using all the cores of the machine, a "Check Render
+        Capacity" command, and a "Transfer Rendered Frames" command if Savers
+        can render to a scratch folder.
+        """
+        if not self.has_ui:
+            return
+
+        self.register_command(
+            "Check Render Capacity",
+            self.__check_current_comp_capacity,
+            {"short_name": "check_render_capacity",
+             "description": ("Checks that the volumes the Savers write to "
+                             "have room for the render."),
+             "type": "context_menu"}
+        )
+
+        if self.get_setting("render_scratch_root"):
+            self.register_command(
+                "Transfer Rendered Frames",
+                self.transfer_rendered_frames,
+                {"short_name": "transfer_frames",
+                 "description": ("Moves the frames rendered to the local "
+                                 "scratch folder to the network."),
+                 "type": "context_menu"}
+            )
+
+        self.register_command(
+            "Render Comp Locally",
+            self.__render_current_comp,
+            {"short_name": "render_locally",
+             "description": ("Renders the saved current comp in chunks of "
+                             "frames rendered in parallel."),
+             "type": "context_menu"}
+        )
+
+    def __render_current_comp(self):
+        """
+        Starts a local render of the current comp in the background.
+        """
+        if not self.check_render_capacity():
+            return
+
+        try:
+            dispatcher = self.create_render_dispatcher()
+        except (ValueError, tank.TankError) as e:
+            self.logger.warning("%s", e)
+            return
+
+        self._render_dispatchers = [
+            d for d in self._render_dispatchers if d.is_running]
+        self._render_dispatchers.append(dispatcher)
+        dispatcher.start()
+
+    def __check_current_comp_capacity(self):
+        """
+        Logs whether the volumes of the current comp Savers have room for
+        the render.
+        """
+        if self.get_setting("render_capacity_check", "warn") == "off":
+            self.logger.info(
+                "The render capacity check is off, see the "
+                "'render_capacity_check' setting.")
+        elif self.check_render_capacity():
+            self.logger.info("The Saver volumes have room for the render.")
+
+    def check_render_capacity(self, comp=None):
+        """
+        Checks that the volumes the Savers of the comp write to have room
+        for the render, according to the 'render_capacity_check' setting:
+        'warn' logs a warning for the volumes short of space, 'block' also
+        stops the render, 'off' skips the check.
+
+        :param comp: Fusion comp, defaults to the current comp.
+        :returns: False if the render should not go ahead.
+        """
+        mode = self.get_setting("render_capacity_check", "warn")
+        if mode == "off":
+            return True
+
+        tk_fusion = self.import_module("tk_fusion")
+
+        if comp is None:
+            comp = self.fusion.GetCurrentComp()
+
+        has_room = True
+        for volume in tk_fusion.check_render_capacity(comp):
+            if volume.error is not None:
+                self.logger.debug(
+                    "Could not get the free space of '%s': %s",
+                    volume.folder, volume.error)
+            elif not volume.has_room:
+                has_room = False
+                self.logger.warning(
+                    "The render needs about %d MB on the volume of '%s' "
+                    "but only %d MB are free.",
+                    volume.required // 2 ** 20, volume.folder,
+                    volume.available // 2 ** 20)
+
+        return has_room or mode != "block"
+
+    def create_render_dispatcher(self, comp=None, command_builder=None,
+                                 **kwargs):
+        """
+        Creates a dispatcher rendering a saved comp in chunks of frames, with
+        a pool of local render processes.
+
+        :param comp: Fusion comp, defaults to the current comp.
+        :param command_builder: Callable returning the command line rendering
+                                a chunk, defaults to running the executable
+                                of the 'render_node_path' setting, or Fusion
+                                itself.
+        :param kwargs: Other :class:`tk_fusion.RenderDispatcher` parameters,
+                       the chunk size and number of processes default to the
+                       'render_chunk_size' and 'render_workers' settings.
+        :returns: :class:`tk_fusion.RenderDispatcher`
+        :raises ValueError: If the comp is not saved.
+        :raises TankError: If the clip of a Saver cannot be resolved.
+        """
+        tk_fusion = self.import_module("tk_fusion")
+
+        if comp is None:
+            comp = self.fusion.GetCurrentComp()
+
+        if command_builder is None:
+            executable = (self.get_setting("render_node_path") or
+                          self.fusion.GetAttrs("FUSIONS_FileName"))
+            command_builder = tk_fusion.render_node_command(executable)
+
+        kwargs.setdefault(
+            "chunk_size", self.get_setting("render_chunk_size"))
+        kwargs.setdefault("workers", self.__render_workers())
+
+        # frames rendered to the scratch folder are moved to the network as
+        # soon as their chunk is complete
+        local_clips = self.__read_local_clips(comp)
+        if local_clips and "on_chunk_complete" not in kwargs:
+            def transfer_chunk(chunk):
+                frames = set(chunk.frames)
+                for (local_clip, network_clip) in local_clips:
+                    # movies are rendered as a single chunk, so are complete
+                    tk_fusion.transfer_rendered_frames(
+                        self.frame_transfer_pool, local_clip, network_clip,
+                        None if tk_fusion.is_movie(local_clip) else frames)
+            kwargs["on_chunk_complete"] = transfer_chunk
+
+        return tk_fusion.create_render_dispatcher(
+            self, comp, command_builder, **kwargs)
+
+    def __render_workers(self):
+        """
+        Returns the number of render processes run at the same time, None
+        for one per core. Without a render node every process is a full
+        Fusion, only one is run unless the 'render_workers' setting asks for
+        more.
+        """
+        workers = self.get_setting("render_workers")
+        if workers:
+            return workers
+        if self.get_setting("render_node_path"):
+            return None
+        return 1
+
+    @property
+    def frame_transfer_pool(self):
+        """
+        Pool of threads moving the frames rendered to the local scratch
+        folder to their network location.
+
+        :returns: :class:`tk_fusion.FrameTransferPool`
+        """
+        if getattr(self, "_frame_transfer_pool", None) is None:
+            tk_fusion = self.import_module("tk_fusion")
+            self._frame_transfer_pool = tk_fusion.FrameTransferPool(
+                logger=self.logger)
+        return self._frame_transfer_pool
+
+    def __read_local_clips(self, comp):
+        """
+        Returns a list of (local clip, network clip) for the Savers of the
+        comp rendering to the local scratch folder.
+        """
+        tk_fusion = self.import_module("tk_fusion")
+        local_outputs = tk_fusion.read_local_outputs(comp)[1]
+        if not local_outputs:
+            return []
+        clips = tk_fusion.read_saver_clips(comp)
+        return [
+            (clips[name], network_clip)
+            for (name, network_clip) in local_outputs.items()
+            if name in clips
+        ]
+
+    def transfer_rendered_frames(self, comp=None):
+        """
+        Queues the frames rendered so far by the Savers rendering to the
+        local scratch folder, to be moved to their network location. The
+        render must be finished.
+
+        :param comp: Fusion comp, defaults to the current comp.
+        :returns: List of the network clips new frames were queued for,
+                  which can be waited on with the frame transfer pool.
+        """
+        tk_fusion = self.import_module("tk_fusion")
+
+        if comp is None:
+            comp = self.fusion.GetCurrentComp()
+
+        network_clips = []
+        for (local_clip, network_clip) in self.__read_local_clips(comp):
+            if tk_fusion.transfer_rendered_frames(
+                    self.frame_transfer_pool, local_clip, network_clip):
+                network_clips.append(network_clip)
+        return network_clips
+
+    def __on_render_started(self, comp):
+        """
+        Called when Fusion itself started a render, stops it if its Savers
+        lack space and the 'render_capacity_check' setting is 'block'.
+        """
+        try:
+            if not self.check_render_capacity(comp):
+                comp.AbortRender()
+                self.logger.warning(
+                    "The render was stopped, the Saver volumes lack space.")
+        except Exception as e:
+            self.logger.warning("Could not check the render capacity: %s", e)
+
+    def __on_render_finished(self, comp):
+        """
+        Called when a render run by Fusion itself ended, queues the frames
+        it rendered to the scratch folder.
+        """
+        try:
+            network_clips = self.transfer_rendered_frames(comp)
+        except Exception as e:
+            self.logger.warning(
+                "Could not queue the frames rendered to the scratch folder: "
+                "%s", e)
+            return
+        if network_clips:
+            self.logger.info(
+                "Moving the rendered frames to %s.", ", ".join(network_clips))
+
+    def register_command(self, name, callback, properties=None):
+        """
+        Registers a new command with the engine and marks the command
+        registry index as stale.
+        """
+        super(FusionEngine, self).register_command(name, callback, properties)
+
+        command_registry = getattr(self, "_command_registry", None)
+        if command_registry is not None:
+            command_registry.invalidate()
+
+    @property
+    def command_registry(self):
+        """
+        Index over the registered commands, used by the menu and the Shotgun
+        panel to dispatch commands without scanning all of them.
+
+        :returns: :class:`tk_fusion.CommandRegistry`
+        """
+        if getattr(self, "_command_registry", None) is None:
+            tk_fusion = self.import_module("tk_fusion")
+            self._command_registry = tk_fusion.CommandRegistry(self)
+        return self._command_registry
+
+    @property
+    def command_search_index(self):
+        """
+        Search index over the registered commands, used by the command
+        palette. It follows the command registry when it is rebuilt.
+
+        :returns: :class:`tk_fusion.CommandSearchIndex`
+        """
+        if getattr(self, "_command_search_index", None) is None:
+            tk_fusion = self.import_module("tk_fusion")
+            self._command_search_index = tk_fusion.CommandSearchIndex(self)
+        return self._command_search_index
+
+    @property
+    def template_resolver(self):
+        """
+        Resolves the template matching a path by only testing the templates
+        whose static parts match it, used instead of
+        ``self.sgtk.template_from_path`` by the Fusion hooks.
+
+        :returns: :class:`tk_fusion.TemplateResolver`
+        """
+        if getattr(self, "_template_resolver", None) is None:
+            tk_fusion = self.import_module("tk_fusion")
+            self._template_resolver = tk_fusion.TemplateResolver(self.sgtk)
+        return self._template_resolver
+
+    @property
+    def media_cache(self):
+        """
+        Local cache of the media read by the Loaders, None if it is not
+        enabled or without UI.
+
+        :returns: :class:`tk_fusion.MediaCache`
+        """
+        if getattr(self, "_media_cache", None) is None:
+            root = self.get_setting("media_cache_root", "")
+            if not root or not self.has_ui:
+                return None
+            tk_fusion = self.import_module("tk_fusion")
+            self._media_cache = tk_fusion.MediaCache(
+                os.path.expanduser(os.path.expandvars(root)),
+                self.get_setting("media_cache_size", 100) * 1024 ** 3,
+                logger=self.logger, on_cached=self.__on_media_cached)
+        return self._media_cache
+
+    def cache_comp_media(self, comp):
+        """
+        Copies the media of the Loaders of the comp to the local cache in the
+        background, and points the Loaders whose media is already cached to
+        the local copy. Loaders pointing to a local copy missing on this
+        machine go back to the network.
+
+        Does nothing if the media cache is not enabled.
+
+        :param comp: Fusion comp.
+        """
+        media_cache = self.media_cache
+        if media_cache is None or comp is None:
+            return
+
+        tk_fusion = self.import_module("tk_fusion")
+        cached_media = tk_fusion.read_cached_media(comp)
+        clips = tk_fusion.read_loader_clips(comp)
+        network_clips = self.path_mapper.translate_all(list(clips.values()))
+
+        switches = {}
+        for (name, network_clip) in zip(list(clips.keys()), network_clips):
+            local_clip = media_cache.request(network_clip)
+            if local_clip is not None:
+                if name not in cached_media:
+                    switches[name] = (local_clip, network_clip)
+            elif name in cached_media:
+                switches[name] = (network_clip, None)
+        # not an edit of the artist, it is not undone and leaves the comp
+        # unmodified
+        tk_fusion.switch_loader_clips(
+            comp, switches, undo_name=None, keep_modified=True)
+
+    @property
+    def media_prefetcher(self):
+        """
+        Reads ahead the first frames of the Loaders of the comps opened,
+        None if it is disabled or without UI.
+
+        :returns: :class:`tk_fusion.MediaPrefetcher`
+        """
+        if getattr(self, "_media_prefetcher", None) is None:
+            frames = self.get_setting("prefetch_frames", 24)
+            if frames <= 0 or not self.has_ui:
+                return None
+            tk_fusion = self.import_module("tk_fusion")
+            self._media_prefetcher = tk_fusion.MediaPrefetcher(
+                frames, self.get_setting("prefetch_budget", 2048) * 1024 ** 2,
+                logger=self.logger)
+        return self._media_prefetcher
+
+    def prefetch_comp_media(self, path):
+        """
+        Reads ahead the first frames of the Loaders of a saved comp in the
+        background, cancelling the read-ahead of the previous comp. Can be
+        called before Fusion loads the comp.
+
+        Does nothing if the read-ahead is disabled.
+
+        :param path: Path of the comp.
+        """
+        prefetcher = self.media_prefetcher
+        if prefetcher is None:
+            return
+        if path:
+            prefetcher.prefetch(path)
+        else:
+            prefetcher.cancel()
+
+    @property
+    def proxy_generator(self):
+        """
+        Makes proxies of the sequences loaded in the background, None if it
+        is disabled.
+
+        :returns: :class:`tk_fusion.ProxyGenerator`
+        """
+        if getattr(self, "_proxy_generator", None) is None:
+            if not self.get_setting("generate_proxies", False):
+                return None
+            if (self.get_template("template_proxy") is None and
+                    not self.get_setting("proxy_root")):
+                self.logger.debug(
+                    "Neither 'template_proxy' nor 'proxy_root' is set, no "
+                    "proxies are made.")
+                return None
+            tk_fusion = self.import_module("tk_fusion")
+            executable = (self.get_setting("render_node_path") or
+                          self.fusion.GetAttrs("FUSIONS_FileName"))
+            self._proxy_generator = tk_fusion.ProxyGenerator(
+                tk_fusion.render_node_command(executable),
+                workers=self.__render_workers(),
+                chunk_size=self.get_setting("render_chunk_size"),
+                logger=self.logger, on_ready=self.__on_proxies_ready)
+        return self._proxy_generator
+
+    def generate_proxies(self, clip):
+        """
+        Makes the proxies of a sequence in the background, or finds them
+        again, and sets them as the proxy clip of the Loaders of the active
+        comp reading the sequence once ready. The proxies are made in the
+        folder of the 'template_proxy' setting, or under the 'proxy_root'
+        folder.
+
+        Does nothing if proxy generation is disabled, or if the sequence has
+        no proxy folder.
+
+        :param clip: Path of the first frame of the sequence.
+        """
+        proxy_generator = self.proxy_generator
+        if proxy_generator is None:
+            return
+
+        clip = self.path_mapper.translate(clip)
+        root_folder = None
+        proxy_template = self.get_template("template_proxy")
+        if proxy_template is not None:
+            try:
+                (template, fields) = \
+                    self.template_resolver.template_and_fields_from_path(clip)
+                if template is not None:
+                    root_folder = proxy_template.apply_fields(fields)
+            except tank.TankError as e:
+                self.logger.debug(
+                    "No proxy template folder for '%s': %s", clip, e)
+
+        proxy_root = self.get_setting("proxy_root")
+        if root_folder is None and proxy_root:
+            tk_fusion = self.import_module("tk_fusion")
+            root_folder = tk_fusion.local_output_path(
+                os.path.expanduser(os.path.expandvars(proxy_root)),
+                os.path.dirname(clip))
+        if root_folder is None:
+            self.logger.debug(
+                "No proxy folder for '%s', its proxies are not made.", clip)
+            return
+        proxy_generator.request(clip, root_folder)
+
+    def __on_proxies_ready(self, clip, proxy_clips):
+        """
+        Called from the background thread once the proxies of a sequence are
+        ready, sets the first proxy on the Loaders of the active comp.
+        """
+        tk_fusion = self.import_module("tk_fusion")
+        proxy_clip = proxy_clips[tk_fusion.PROXY_SCALES[0]]
+
+        def use_proxies():
+            comp = self.fusion.GetCurrentComp()
+            if comp is not None:
+                tk_fusion.set_loader_proxies(
+                    comp, clip, proxy_clip, self.path_mapper)
+        self.async_execute_in_main_thread(use_proxies)
+
+    def __on_media_cached(self, clip, local_clip):
+        """
+        Called from a copy thread once a sequence is cached, switches the
+        Loaders of the active comp to the local copy.
+        """
+        def use_cached_media():
+            self.cache_comp_media(self.fusion.GetCurrentComp())
+        self.async_execute_in_main_thread(use_cached_media)
+
+    def __on_comp_changed(self, path):
+        """
+        Called when the artist settled on another comp.
+        """
+        self.prefetch_comp_media(path)
+        self.cache_comp_media(self.fusion.GetCurrentComp())
+        self.watch_comp_renders()
+
+    @property
+    def render_watcher(self):
+        """
+        Live index of the frames rendered to the output folders of the
+        Savers of the open comps, None if it is not enabled or without UI.
+
+        :returns: :class:`tk_fusion.RenderWatcher`
+        """
+        if getattr(self, "_render_watcher", None) is None:
+            if not self.get_setting("watch_renders", False) or not self.has_ui:
+                return None
+            tk_fusion = self.import_module("tk_fusion")
+            self._render_watcher = tk_fusion.RenderWatcher(
+                self.sequence_scanner, logger=self.logger)
+        return self._render_watcher
+
+    def watch_comp_renders(self):
+        """
+        Watches the output folders of the Savers of the open comps, when the
+        render watcher is enabled.
+        """
+        watcher = self.render_watcher
+        if watcher is None:
+            return
+        tk_fusion = self.import_module("tk_fusion")
+        clips = []
+        for comp in self.fusion.GetCompList().values():
+            clips.extend(tk_fusion.read_output_clips(comp).values())
+        watcher.set_folders(
+            os.path.dirname(clip)
+            for clip in self.path_mapper.translate_all(clips))
+
+    @property
+    def path_mapper(self):
+        """
+        Translates the paths saved on any platform under the roots of the
+        pipeline configuration to the roots of the current platform.
+
+        :returns: :class:`tk_fusion.PathMapper`
+        """
+        if getattr(self, "_path_mapper", None) is None:
+            tk_fusion = self.import_module("tk_fusion")
+            self._path_mapper = tk_fusion.create_path_mapper(self.sgtk)
+        return self._path_mapper
+
+    @property
+    def sequence_scanner(self):
+        """
+        Lists the image sequences of the render and publish folders, sharing
+        the scans with the other sessions through manifests.
+
+        :returns: :class:`tk_fusion.SequenceScanner`
+        """
+        tk_fusion = self.import_module("tk_fusion")
+        return tk_fusion.get_sequence_scanner()
+
+    @property
+    def fusion(self):
+        """
+        Connection to the running Fusion, shared by the engine, the Shotgun
+        panel and the hooks. It is opened the first time it is needed and
+        opened again if Fusion stopped answering.
+        """
+        if getattr(self, "_fusion_connection", None) is None:
+            tk_fusion = self.import_module("tk_fusion")
+            self._fusion_connection = tk_fusion.FusionConnection()
+        return self._fusion_connection.get()
+
     @property
     def context_change_allowed(self):
         """
@@ -179,7 +741,7 @@ class FusionEngine(Engine):
 
         host_info = {"name": "Fusion", "version": "unknown"}
         try:
-            fusion_ver = fusion.Version
+            fusion_ver = self.fusion.Version
             host_info["version"] = fusion_ver
         except:
             # Fallback to 'Fusion' initialized above
@@ -217,23 +779,41 @@ class FusionEngine(Engine):
         else:
             os.environ["SSL_CERT_FILE"] = ssl_cert_file
 
+    def _define_qt_base(self):
+        """
+        Skips importing Qt altogether in batch mode.
+        """
+        if not self.has_ui:
+            self.logger.debug("Batch mode, Qt is not loaded.")
+            return {"qt_core": None, "qt_gui": None, "dialog_base": None}
+
+        return super(FusionEngine, self)._define_qt_base()
+
     def pre_app_init(self):
         """
         Runs after the engine is set up but before any apps have been
         initialized.
         """
-        # unicode characters returned by the shotgun api need to be converted
-        # to display correctly in all of the app windows
-        from tank.platform.qt import QtCore
+        if self.has_ui:
+            # unicode characters returned by the shotgun api need to be
+            # converted to display correctly in all of the app windows
+            from tank.platform.qt import QtCore
 
-        # tell QT to interpret C strings as utf-8
-        utf8 = QtCore.QTextCodec.codecForName("utf-8")
-        QtCore.QTextCodec.setCodecForCStrings(utf8)
-        self.logger.debug("set utf-8 codec for widget text")
+            # tell QT to interpret C strings as utf-8
+            utf8 = QtCore.QTextCodec.codecForName("utf-8")
+            QtCore.QTextCodec.setCodecForCStrings(utf8)
+            self.logger.debug("set utf-8 codec for widget text")
 
         self.logger.debug("Installing certificate file from shotgun_api3")
         self._install_cacert_file()
 
+        # the scans of the sequences are shared by the hooks, the media
+        # cache, the read-ahead and the proxies. The package is imported here
+        # and not in init_engine, as its widgets need Qt to be set up
+        scanner = self.import_module("tk_fusion").get_sequence_scanner()
+        scanner.write_manifests = self.get_setting("sequence_manifests", True)
+        scanner.logger = self.logger
+
     def init_engine(self):
         """
         Initializes the Fusion engine.
@@ -247,7 +827,7 @@ class FusionEngine(Engine):
                                  " Supported platforms "
                                  "are Mac, Linux 64 and Windows 64.")
 
-        fusion_build_version = str(fusion.Version)
+        fusion_build_version = str(self.fusion.Version)
         fusion_ver = float(".".join(fusion_build_version.split(".")[:2]))
 
         if fusion_ver < 9.0:
@@ -306,13 +886,22 @@ class FusionEngine(Engine):
                 os.environ["SHOTGUN_SKIP_QTWEBENGINEWIDGETS_IMPORT"] = "1"
 
         # add qt paths and dlls
-        self._init_pyside()
+        if self.has_ui:
+            self._init_pyside()
 
         # default menu name is Shotgun but this can be overriden
         # in the configuration to be Sgtk in case of conflicts
         self._menu_name = "Shotgun"
         if self.get_setting("use_sgtk_as_menu_name", False):
             self._menu_name = "Sgtk"
+        self._menu_generator = None
+        self._context_watcher = None
+        self._render_monitor = None
+        self._render_dispatchers = []
+
+        # the Shotgun panel is created by the Shotgun startup script and kept
+        # here so the same instance is shown every time the script runs
+        self.shotgun_panel = None
 
     def create_shotgun_menu(self, disabled=False):
         """
@@ -324,15 +913,26 @@ class FusionEngine(Engine):
         # only create the shotgun menu if not in batch mode and menu doesn't
         # already exist
         if self.has_ui:
-            # create our menu handler
-            tk_fusion = self.import_module("tk_fusion")
-        #     self._menu_generator = tk_fusion.MenuGenerator(
-        #         self, self._menu_name)
-        #     self._menu_generator.create_menu(disabled=disabled)
+            # create our menu handler once, later calls only update the
+            # existing menu to match the current context and commands
+            if self._menu_generator is None:
+                tk_fusion = self.import_module("tk_fusion")
+                self._menu_generator = tk_fusion.MenuGenerator(
+                    self, self._menu_name)
+            self._menu_generator.create_menu(disabled=disabled)
             return True
 
         return False
 
+    @property
+    def shotgun_menu(self):
+        """
+        The QMenu holding the Shotgun menu, or None if it was not created.
+        """
+        if self._menu_generator is None:
+            return None
+        return self._menu_generator.menu_handle
+
     def _initialise_qapplication(self):
         """
         Ensure the QApplication is initialized
@@ -357,21 +957,55 @@ class FusionEngine(Engine):
         """
         Called when all apps have initialized
         """
-        self._initialise_qapplication()
+        if self.has_ui:
+            self._initialise_qapplication()
 
         # for some readon this engine command get's lost so we add it back
         self.__register_reload_command()
+        self.__register_render_command()
+        self.command_registry.rebuild()
         self.create_shotgun_menu()
 
         # Run a series of app instance commands at startup.
         self._run_app_instance_commands()
 
+        # follow the active comp, switching context when needed
+        if (self.has_ui and self._context_watcher is None and
+                self.get_setting("automatic_context_switch", True)):
+            tk_fusion = self.import_module("tk_fusion")
+            self._context_watcher = tk_fusion.ContextWatcher(self)
+            self._context_watcher.comp_changed.connect(
+                self.__on_comp_changed)
+            self._context_watcher.start()
+
+        # the renders Fusion runs itself are checked for capacity when they
+        # start, and the frames they render to the scratch folder are queued
+        # for the transfer once they end
+        if (self.has_ui and self._render_monitor is None and (
+                self.get_setting("render_scratch_root") or
+                self.get_setting("render_capacity_check", "warn") != "off")):
+            tk_fusion = self.import_module("tk_fusion")
+            self._render_monitor = tk_fusion.RenderMonitor(self)
+            self._render_monitor.render_started.connect(
+                self.__on_render_started)
+            self._render_monitor.render_finished.connect(
+                self.__on_render_finished)
+            self._render_monitor.start()
+
+        if self.media_cache is not None or self.media_prefetcher is not None:
+            comp = self.fusion.GetCurrentComp()
+            if comp is not None:
+                tk_fusion = self.import_module("tk_fusion")
+                self.prefetch_comp_media(tk_fusion.comp_path(comp))
+                self.cache_comp_media(comp)
+        self.watch_comp_renders()
+
         # self._qt_app.exec_()
 
     def post_context_change(self, old_context, new_context):
         """
-        Runs after a context change. The Fusion event watching will be stopped
-        and new callbacks registered containing the new context information.
+        Runs after a context change. The menu and the Shotgun panel are
+        updated to show the new context and its commands.
 
         :param old_context: The context being changed away from.
         :param new_context: The new context being changed to.
@@ -381,20 +1015,17 @@ class FusionEngine(Engine):
         # a context is changed
         self.__register_open_log_folder_command()
         self.__register_reload_command()
+        self.__register_render_command()
 
-        # if self.get_setting("automatic_context_switch", True):
-        #     fusion.shotgun._engine_instance = self.instance_name
-        #     fusion.shotgun._menu_name = self._menu_name
-        #     fusion.shotgun._new_context = new_context
-
-        #     self.logger.debug(
-        #         "Registered new open and save callbacks before "
-        #         "changing context."
-        #     )
+        # apps have been reloaded for the new context, so index the new set
+        # of commands
+        self.command_registry.rebuild()
 
-        #     # finally create the menu with the new context if needed
-        #     if old_context != new_context:
-        #         self.create_shotgun_menu()
+        # finally update the menu and the panel with the new context and
+        # commands
+        self.create_shotgun_menu()
+        if self.shotgun_panel is not None:
+            self.shotgun_panel.refresh()
 
     def _run_app_instance_commands(self):
         """
@@ -402,18 +1033,6 @@ class FusionEngine(Engine):
         'run_at_startup' setting of the environment configuration yaml file.
         """
 
-        # Build a dictionary mapping app instance names to dictionaries of
-        # commands they registered with the engine.
-        app_instance_commands = {}
-        for (cmd_name, value) in self.commands.iteritems():
-            app_instance = value["properties"].get("app")
-            if app_instance:
-                # Add entry 'command name: command function' to the command
-                # dictionary of this app instance.
-                cmd_dict = app_instance_commands.setdefault(
-                    app_instance.instance_name, {})
-                cmd_dict[cmd_name] = value["callback"]
-
         # Run the series of app instance commands listed in the
         # 'run_at_startup' setting.
         for app_setting_dict in self.get_setting("run_at_startup", []):
@@ -424,9 +1043,12 @@ class FusionEngine(Engine):
             setting_cmd_name = app_setting_dict["name"]
 
             # Retrieve the command dictionary of the given app instance.
-            cmd_dict = app_instance_commands.get(app_instance_name)
+            cmd_dict = dict(
+                (cmd_name, command.callback) for (cmd_name, command) in
+                self.command_registry.get_app_commands(
+                    app_instance_name).items())
 
-            if cmd_dict is None:
+            if not cmd_dict:
                 self.logger.warning(
                     "%s configuration setting 'run_at_startup' requests app"
                     " '%s' that is not installed.",
@@ -462,14 +1084,42 @@ class FusionEngine(Engine):
 
     def destroy_engine(self):
         """
-        Remove the callback scene events.
-        TODO: restore and preserve the existing ones.
+        Stops watching the active comp and closes the Shotgun panel.
         """
         self.logger.debug("%s: Destroying...", self)
 
-        # if self.get_setting("automatic_context_switch", True):
-        #     fusion.setOnProjectCreatedCallback("")
-        #     fusion.setOnProjectLoadedCallback("")
+        if self.shotgun_panel is not None:
+            self.shotgun_panel.close()
+            self.shotgun_panel = None
+
+        if self._context_watcher is not None:
+            self._context_watcher.stop()
+            self._context_watcher = None
+
+        if self._render_monitor is not None:
+            self._render_monitor.stop()
+            self._render_monitor = None
+
+        for dispatcher in self._render_dispatchers:
+            dispatcher.cancel()
+        self._render_dispatchers = []
+
+        if getattr(self, "_media_prefetcher", None) is not None:
+            self._media_prefetcher.cancel()
+
+        if getattr(self, "_proxy_generator", None) is not None:
+            self._proxy_generator.cancel()
+
+        if getattr(self, "_render_watcher", None) is not None:
+            self._render_watcher.stop()
+            self._render_watcher = None
+
+        if getattr(self, "_frame_transfer_pool", None) is not None:
+            pending = self._frame_transfer_pool.pending()
+            if pending:
+                self.logger.warning(
+                    "%d rendered frames are left in the scratch folder.",
+                    pending)
 
         # fineally restore the cacert certificate we replaced if there was one
         # in the first place
@@ -560,7 +1210,34 @@ class FusionEngine(Engine):
     def has_ui(self):
         """
         Detect and return if fusion is running in batch mode
+
+        Fusion runs without UI when the SGTK_FUSION_BATCH_MODE environment
+        variable is set, or when Fusion reports being a render node or a
+        console session. The result is computed once per session.
         """
+        if getattr(self, "_has_ui", None) is None:
+            self._has_ui = self.__detect_ui()
+        return self._has_ui
+
+    def __detect_ui(self):
+        if os.environ.get(BATCH_MODE_ENV, "0") not in ("", "0"):
+            return False
+
+        # the Fusion toolkit runs in is asked, scripts run through FuScript
+        # drive an interactive Fusion whose UI is there
+        try:
+            if self.fusion.GetAttrs("FUSIONB_IsRenderNode"):
+                return False
+            executable = self.fusion.GetAttrs("FUSIONS_FileName")
+        except Exception:
+            # no Fusion to ask, assume the usual interactive session
+            executable = None
+
+        if executable:
+            name = os.path.splitext(os.path.basename(executable))[0].lower()
+            if name in HEADLESS_EXECUTABLES:
+                return False
+
         return True
 
     def _emit_log_message(self, handler, record):
@@ -599,7 +1276,11 @@ class FusionEngine(Engine):
             fct = display_debug
 
         # Display the message in Fusion script editor in a thread safe manner.
-        self.async_execute_in_main_thread(fct, msg)
+        # Without UI there is no Qt event loop to hand the message to.
+        if self.has_ui:
+            self.async_execute_in_main_thread(fct, msg)
+        else:
+            fct(msg)
 
     def close_windows(self):
         """
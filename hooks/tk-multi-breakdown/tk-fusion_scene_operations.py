@@ -12,9 +12,6 @@ from tank import Hook
 import os
 import re
 
-import BlackmagicFusion as bmd
-fusion = bmd.scriptapp("Fusion")
-
 
 class BreakdownSceneOperations(Hook):
     """
@@ -52,15 +49,20 @@ class BreakdownSceneOperations(Hook):
 
         refs = []
         
-        comp = fusion.GetCurrentComp()
+        engine = self.parent.engine
+        tk_fusion = engine.import_module("tk_fusion")
+        comp = engine.fusion.GetCurrentComp()
         comp.Lock()
-        for tool in comp.GetToolList(False, "Loader").values():
-            ref_path = tool.GetAttrs("TOOLST_Clip_Name").values()
-            if ref_path:
-                ref_path[0].replace("/", os.path.sep)
-                refs.append({"node": tool.GetAttrs("TOOLS_Name"), "type": "file", "path": ref_path[0]})
+        for (name, ref_path) in tk_fusion.read_loader_clips(comp).items():
+            refs.append({"node": name, "type": "file", "path": ref_path})
         comp.Unlock()
 
+        # comps saved on another platform point to its roots
+        ref_paths = engine.path_mapper.translate_all(
+            [ref["path"] for ref in refs])
+        for (ref, ref_path) in zip(refs, ref_paths):
+            ref["path"] = ref_path
+
         return refs
 
     def update(self, items):
@@ -75,12 +77,14 @@ class BreakdownSceneOperations(Hook):
         the that each attribute should be updated *to* rather than the current
         path.
         """
-        comp = fusion.GetCurrentComp()
         engine = self.parent.engine
+        comp = engine.fusion.GetCurrentComp()
+
+        tk_fusion = engine.import_module("tk_fusion")
 
         loaders = {}
         for x in comp.GetToolList(False, "Loader").values():
-            loaders[x.GetAttrs("TOOLS_Name")] = x
+            loaders[tk_fusion.get_attr(x, "TOOLS_Name")] = x
 
         for i in items:
             engine.log_debug(
@@ -107,3 +111,11 @@ class BreakdownSceneOperations(Hook):
                     loader.ClipTimeStart = trimIn
                     loader.ClipTimeEnd = trimOut              
                     comp.Unlock()
+
+        # the updated Loaders read the network, the media cache copies their
+        # new media when enabled
+        tk_fusion.forget_cached_media(comp, [
+            i["node"] for i in items
+            if i["type"] == "file" and i["node"] in loaders
+        ])
+        engine.cache_comp_media(comp)
@@ -13,8 +13,6 @@ Hook that loads defines all the available actions, broken down by publish type.
 """
 
 import os
-import re
-import glob
 import sgtk
 from sgtk.errors import TankError
 
@@ -148,7 +146,8 @@ class FusionActions(HookBaseClass):
         # toolkit uses utf-8 encoded strings internally and Natron API expects
         # unicode so convert the path to ensure filenames containing complex
         # characters are supported
-        path = self.get_publish_path(sg_publish_data).replace(os.path.sep, "/")
+        path = self.parent.engine.path_mapper.translate(
+            self.get_publish_path(sg_publish_data), "/")
 
         if name == "read_node":
             self._create_read_node(path, sg_publish_data)
@@ -165,10 +164,7 @@ class FusionActions(HookBaseClass):
                                 publish fields.
         """
 
-        import BlackmagicFusion as bmd
-
-        fusion = bmd.scriptapp("Fusion")
-        comp = fusion.GetCurrentComp()
+        comp = self.parent.engine.fusion.GetCurrentComp()
 
         (_, ext) = os.path.splitext(path)
 
@@ -206,6 +202,12 @@ class FusionActions(HookBaseClass):
             comp.Loader({"Clip": path})
         comp.Unlock()
 
+        # copy the media to the local cache and make its proxies, when
+        # enabled
+        self.parent.engine.cache_comp_media(comp)
+        if seq_range:
+            self.parent.engine.generate_proxies(path)
+
 
 
 
@@ -223,43 +225,10 @@ class FusionActions(HookBaseClass):
         :returns: None if no range could be determined, otherwise (min, max)
         :rtype: tuple or None
         """
-        # This pattern will match the following at the end of a string and
-        # retain the frame number or frame token as group(1) in the resulting
-        # match object:
-        #
-        # 0001
-        # ####
-        # %04d
-        #
-        # The number of digits or hashes does not matter; we match as many as
-        # exist.
-        frame_pattern = re.compile(r"([0-9#]+|[%]0\dd)$")
-        root, ext = os.path.splitext(path)
-        match = re.search(frame_pattern, root)
-
-        # If we did not match, we don't know how to parse the file name, or
-        # there is no frame number to extract.
-        if not match:
-            return None
-
-        # We need to get all files that match the pattern from disk so that we
-        # can determine what the min and max frame number is.
-        glob_path = "%s%s" % (
-            re.sub(frame_pattern, "*", root),
-            ext,
-        )
-        files = glob.glob(glob_path)
-
-        # Our pattern from above matches against the file root, so we need
-        # to chop off the extension at the end.
-        file_roots = [os.path.splitext(f)[0] for f in files]
-
-        # We know that the search will result in a match at this point,.
-        # otherwise the glob wouldn't have found the file. We can search and
-        # pull group 1 to get the integer frame number from the file root name.
-        frames = [int(re.search(frame_pattern, f).group(1))
-                  for f in file_roots]
-        return (min(frames), max(frames))
+        # The frames are listed from the manifest of the folder when it is
+        # up to date, shared by everyone loading from the folder, the folder
+        # is scanned otherwise.
+        return self.parent.engine.sequence_scanner.frame_range(path)
 
     def _find_sequence_range(self, path):
         """
@@ -275,7 +244,8 @@ class FusionActions(HookBaseClass):
         # find a template that matches the path:
         template = None
         try:
-            template = self.parent.sgtk.template_from_path(path)
+            template = self.parent.engine.template_resolver.template_from_path(
+                path)
         except sgtk.TankError:
             pass
 
@@ -290,18 +260,5 @@ class FusionActions(HookBaseClass):
         if not "SEQ" in fields:
             return None
 
-        files = self.parent.sgtk.paths_from_template(
-            template, fields, ["SEQ", "eye"])
-
-        # find frame numbers from these files:
-        frames = []
-        for file in files:
-            fields = template.get_fields(file)
-            frame = fields.get("SEQ")
-            if frame != None:
-                frames.append(frame)
-        if not frames:
-            return None
-
-        # return the range
-        return (min(frames), max(frames))
+        # find the frames of the sequence from the manifest of its folder
+        return self.parent.engine.sequence_scanner.frame_range(path)
@@ -8,16 +8,17 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
-import glob
 import os
+import time
 import sgtk
 
-import BlackmagicFusion as bmd
-fusion = bmd.scriptapp("Fusion")
-
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
+# seconds the collection waits for the frames still being moved from the
+# local scratch folder to the network
+TRANSFER_WAIT = 10.0
+
 
 class FusionSessionCollector(HookBaseClass):
     """
@@ -141,32 +142,72 @@ class FusionSessionCollector(HookBaseClass):
 
     def collect_sg_savernodes(self, parent_item):
 
-        comp = fusion.GetCurrentComp()
-
         publisher = self.parent
         engine = publisher.engine
-
-        path = comp.GetAttrs()['COMPS_FileName']
-        work_template = engine.sgtk.template_from_path(path)
-        work_version = work_template.get_fields(path).get('version')
-
-        savers = comp.GetToolList(False, "Saver").values()
-        for saver in savers:
-            path = saver.GetAttrs()['TOOLST_Clip_Name'].values()[0]
-
-            template = engine.sgtk.template_from_path(path)
+        comp = engine.fusion.GetCurrentComp()
+        tk_fusion = engine.import_module("tk_fusion")
+
+        path = tk_fusion.comp_path(comp)
+        (work_template, work_fields) = \
+            engine.template_resolver.template_and_fields_from_path(path)
+        work_version = work_fields.get('version')
+
+        # frames rendered to the local scratch folder are moved to the network
+        # as their chunks complete, or once a render run by Fusion ends. The
+        # sequences still being moved are only collected once they are all
+        # there.
+        transferring = set()
+        local_outputs = tk_fusion.read_local_outputs(comp)[1]
+        network_clips = set(local_outputs.values())
+        if network_clips and tk_fusion.get_attr(comp, "COMPB_Rendering"):
+            self.logger.warning(
+                "The comp is rendering, the Savers rendering to the scratch "
+                "folder will be collected once the render is done.")
+            transferring.update(network_clips)
+        elif network_clips:
+            # frames of a render the engine did not see end
+            for network_clip in engine.transfer_rendered_frames(comp):
+                self.logger.warning(
+                    "Frames of '%s' were left in the scratch folder, they are "
+                    "being moved now." % network_clip)
+
+        pool = engine.frame_transfer_pool
+        waiting = [
+            network_clip for network_clip in network_clips - transferring
+            if not pool.is_done(network_clip)
+        ]
+        if waiting:
+            self.logger.info(
+                "Waiting for the frames of %d sequences to be transferred." %
+                len(waiting))
+            # a single wait shared by all the sequences
+            deadline = time.time() + TRANSFER_WAIT
+            for network_clip in waiting:
+                if not pool.wait(network_clip,
+                                 max(deadline - time.time(), 0)):
+                    self.logger.warning(
+                        "The frames of '%s' are still being transferred, it "
+                        "will be collected once done." % network_clip)
+                    transferring.add(network_clip)
+
+        output_clips = engine.path_mapper.translate_all([
+            clip for clip in tk_fusion.read_output_clips(comp).values()
+            if clip not in transferring
+        ])
+        for path in output_clips:
+            (template, fields) = \
+                engine.template_resolver.template_and_fields_from_path(path)
             if template:
-                fields = template.get_fields(path)
                 template_version = fields.get('version')
-                if template_version is work_version:                
+                if template_version == work_version:
                     frames = template.apply_fields(fields)
                     base, ext = os.path.splitext(frames)
                     if '.mov' not in ext:
-                        rendered_paths = glob.glob("%s*%s" % (base, ext))
-                        if rendered_paths:
+                        first_frame = self._find_first_frame(engine, frames)
+                        if first_frame:
                             super(FusionSessionCollector, self)._collect_file(
                                 parent_item,
-                                rendered_paths[0],
+                                first_frame,
                                 frame_sequence=True
                             )
                     else:
@@ -176,18 +217,43 @@ class FusionSessionCollector(HookBaseClass):
                                 frames
                             )
 
+    def _find_first_frame(self, engine, frames):
+        """
+        Returns the path of the first frame rendered of a sequence, None if
+        it has no frames or is still being rendered.
+
+        :param engine: Fusion engine.
+        :param frames: Path of the sequence, with a frame token.
+        """
+        watcher = engine.render_watcher
+        if watcher is None or not watcher.is_watched(os.path.dirname(frames)):
+            sequence = engine.sequence_scanner.find(frames)
+            return sequence.files()[0] if sequence is not None else None
+
+        # the render state is known without listing the folder
+        state = watcher.state(frames)
+        if state is None or not state.frame_count:
+            return None
+        if state.is_writing:
+            self.logger.info(
+                "'%s' is still being rendered, it will be collected once "
+                "done." % frames)
+            return None
+        if state.missing_count:
+            self.logger.warning(
+                "'%s' is missing %d frames between %d and %d." % (
+                    frames, state.missing_count, state.first_frame,
+                    state.last_frame))
+        return state.path(state.first_frame)
+
+
 def _session_path():
     """
     Return the path to the current session
     :return:
     """
-    comp = fusion.GetCurrentComp()
-    
-    path = comp.GetAttrs()['COMPS_FileName']
-
-    if isinstance(path, unicode):
-        path = path.encode("utf-8")
-
-    return path
+    engine = sgtk.platform.current_engine()
+    tk_fusion = engine.import_module("tk_fusion")
+    return tk_fusion.comp_path(engine.fusion.GetCurrentComp())
 
 
@@ -0,0 +1,144 @@
+# Copyright (c) 2017 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import sgtk
+
+HookBaseClass = sgtk.get_hook_baseclass()
+
+# number of bad frames listed in the validation messages
+MAX_FRAMES_LISTED = 20
+
+
+class FusionFramesPublishPlugin(HookBaseClass):
+    """
+    Plugin checking every frame of the rendered sequences before they are
+    published, so the empty and truncated frames of crashed renders are not
+    published.
+
+    This hook relies on functionality found in the base file publisher hook in
+    the publish2 app and should inherit from it in the configuration. The hook
+    setting for this plugin should look something like this::
+
+        hook: "{self}/publish_file.py:{engine}/tk-multi-publish2/basic/publish_frames.py"
+
+    """
+
+    # NOTE: The plugin icon, name and description are defined by the base file
+    # plugin.
+
+    @property
+    def settings(self):
+        """
+        Dictionary defining the settings that this plugin expects to receive
+        through the settings parameter in the accept, validate, publish and
+        finalize methods.
+
+        A dictionary on the following form::
+
+            {
+                "Settings Name": {
+                    "type": "settings_type",
+                    "default": "default_value",
+                    "description": "One line description of the setting"
+            }
+
+        The type string should be one of the data types that toolkit accepts as
+        part of its environment configuration.
+        """
+
+        # inherit the settings from the base publish plugin
+        base_settings = super(FusionFramesPublishPlugin, self).settings or {}
+
+        # settings specific to this class
+        fusion_frames_settings = {
+            "Verify Frames": {
+                "type": "bool",
+                "default": True,
+                "description": "Check the header and the end of every frame "
+                               "of the image sequences, failing the "
+                               "validation for empty or truncated frames.",
+            }
+        }
+
+        # update the base settings
+        base_settings.update(fusion_frames_settings)
+
+        return base_settings
+
+    def validate(self, settings, item):
+        """
+        Validates the given item to check that it is ok to publish. Returns a
+        boolean to indicate validity.
+
+        :param settings: Dictionary of Settings. The keys are strings, matching
+            the keys returned in the settings property. The values are `Setting`
+            instances.
+        :param item: Item to process
+        :returns: True if item is valid, False otherwise.
+        """
+
+        verify_setting = settings.get("Verify Frames")
+        if ((verify_setting is None or verify_setting.value) and
+                item.properties.get("sequence_paths")):
+            self._verify_frames(item)
+
+        # run the base class validation
+        return super(FusionFramesPublishPlugin, self).validate(settings, item)
+
+    def _verify_frames(self, item):
+        """
+        Checks every frame of the sequence of the item, raising an exception
+        if some are broken.
+        """
+        engine = sgtk.platform.current_engine()
+        tk_fusion = engine.import_module("tk_fusion")
+
+        path = item.properties["path"]
+        sequence = engine.sequence_scanner.find(path)
+        if sequence is None:
+            # the base plugin reports the missing files
+            return
+
+        problems = tk_fusion.verify_frames(sequence.files())
+        errors = [problem for problem in problems if problem.is_error]
+        warnings = [problem for problem in problems if not problem.is_error]
+
+        if warnings:
+            self.logger.warning(
+                "%d frames of '%s' are much smaller than the others." % (
+                    len(warnings), item.name),
+                extra=_frames_info(warnings)
+            )
+
+        if errors:
+            error_msg = "%d frames of '%s' are empty or truncated." % (
+                len(errors), item.name)
+            self.logger.error(error_msg, extra=_frames_info(errors))
+            raise Exception(error_msg)
+
+        self.logger.debug(
+            "Verified the %d frames of '%s'." % (
+                len(sequence.frames), item.name))
+
+
+def _frames_info(problems):
+    """
+    Return the logging extra listing the frames with problems.
+    """
+    lines = [str(problem) for problem in problems[:MAX_FRAMES_LISTED]]
+    if len(problems) > MAX_FRAMES_LISTED:
+        lines.append("... and %d more." % (len(problems) - MAX_FRAMES_LISTED))
+    return {
+        "action_show_more_info": {
+            "label": "Show Frames",
+            "tooltip": "Show the frames",
+            "text": "<pre>%s</pre>" % "\n".join(lines)
+        }
+    }
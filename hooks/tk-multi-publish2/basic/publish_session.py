@@ -12,9 +12,6 @@ import os
 import sgtk
 from sgtk.util.filesystem import ensure_folder_exists
 
-import BlackmagicFusion as bmd
-fusion = bmd.scriptapp("Fusion")
-
 HookBaseClass = sgtk.get_hook_baseclass()
 
 
@@ -357,13 +354,9 @@ def _session_path():
     Return the path to the current session
     :return:
     """
-    comp = fusion.GetCurrentComp()
-    path = comp.GetAttrs()['COMPS_FileName']
-
-    if isinstance(path, unicode):
-        path = path.encode("utf-8")
-
-    return path
+    engine = sgtk.platform.current_engine()
+    tk_fusion = engine.import_module("tk_fusion")
+    return tk_fusion.comp_path(engine.fusion.GetCurrentComp())
 
 
 def _save_session(path):
@@ -375,8 +368,9 @@ def _save_session(path):
     folder = os.path.dirname(path)
     ensure_folder_exists(folder)
 
-    comp = fusion.GetCurrentComp()
-    comp.Save(path)
+    engine = sgtk.platform.current_engine()
+    tk_fusion = engine.import_module("tk_fusion")
+    tk_fusion.save_comp(engine.fusion.GetCurrentComp(), path)
 
 
 # TODO: method duplicated in all the fusion hooks
@@ -405,11 +399,10 @@ def _get_save_as_action():
 
 
 def _save_as():
-    comp = fusion.GetCurrentComp()
-    path = comp.GetAttrs()['COMPS_FileName']
-
-    if isinstance(path, unicode):
-        path = path.encode("utf-8")
+    engine = sgtk.platform.current_engine()
+    tk_fusion = engine.import_module("tk_fusion")
+    comp = engine.fusion.GetCurrentComp()
+    path = tk_fusion.comp_path(comp)
 
     if path:
-        comp.Save(path)
+        tk_fusion.save_comp(comp, path)
@@ -12,7 +12,6 @@ import os
 import pprint
 import sys
 import sgtk
-import BlackmagicFusion as bmd
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
@@ -210,9 +209,9 @@ class UploadVersionPlugin(HookBaseClass):
         publisher = self.parent
         path_to_frames = item.properties["path"]
 
-        fusion = bmd.scriptapp("Fusion")
-        comp = fusion.GetCurrentComp()
-        first_frame = int(comp.GetAttrs()["COMPN_GlobalStart"])
+        comp = publisher.engine.fusion.GetCurrentComp()
+        tk_fusion = publisher.engine.import_module("tk_fusion")
+        first_frame = int(tk_fusion.get_attr(comp, "COMPN_GlobalStart"))
         
         try:
             seq_data = self.__render_movie_from_sequence(path_to_frames.encode('utf-8'))
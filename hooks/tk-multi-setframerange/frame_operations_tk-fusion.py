@@ -9,7 +9,6 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 import sgtk
 from sgtk import TankError
-import BlackmagicFusion as bmd
 
 
 __author__ = "Diego Garcia Huerta"
@@ -25,7 +24,8 @@ class FrameOperation(HookBaseClass):
     current scene
     """
 
-    def execute(self, operation, head_in_frame=None, in_frame=None, out_frame=None, tail_out_frame=None, **kwargs):
+    def execute(self, operation, head_in_frame=None, in_frame=None, out_frame=None, tail_out_frame=None,
+                sync_tools=None, all_comps=None, **kwargs):
         """
         Main hook entry point
 
@@ -40,23 +40,43 @@ class FrameOperation(HookBaseClass):
                     out_frame for the current context (e.g. the current shot, 
                                                       current asset etc)
 
+        :sync_tools: bool
+                    Whether the Loaders and Savers are moved to the new range
+                    along with the comp, defaults to the
+                    frame_range_sync_tools engine setting
+
+        :all_comps: bool
+                    Whether the range is set on every open comp rather than
+                    on the current one only, defaults to the
+                    frame_range_all_comps engine setting
+
         :returns:   Depends on operation:
                     'set_frame_range' - Returns if the operation was succesfull
                     'get_frame_range' - Returns the frame range in the form
                                         (in_frame, out_frame)
         """
-        fusion = bmd.scriptapp("Fusion")
-        comp = fusion.GetCurrentComp()
+        tk_fusion = self.parent.engine.import_module("tk_fusion")
+        fusion = self.parent.engine.fusion
 
         if operation == "get_frame_range":
-            current_in = int(comp.GetAttrs()["COMPN_GlobalStart"])
-            current_out = int(comp.GetAttrs()["COMPN_GlobalEnd"])
-            return (current_in, current_out)
+            return tk_fusion.get_frame_range(fusion.GetCurrentComp())
  
         elif operation == "set_frame_range":
-            # set frame ranges for plackback
-            comp.SetAttrs({'COMPN_GlobalEnd' : out_frame})
-            comp.SetAttrs({'COMPN_RenderEnd': tail_out_frame})
-            comp.SetAttrs({'COMPN_GlobalStart' : in_frame})
-            comp.SetAttrs({'COMPN_RenderStart': head_in_frame})
+            if sync_tools is None:
+                sync_tools = self.parent.engine.get_setting(
+                    "frame_range_sync_tools", False)
+            if all_comps is None:
+                all_comps = self.parent.engine.get_setting(
+                    "frame_range_all_comps", False)
+
+            # set frame ranges for plackback and rendering
+            if all_comps:
+                comps = fusion.GetCompList().values()
+            else:
+                comps = [fusion.GetCurrentComp()]
+
+            for comp in comps:
+                tk_fusion.set_frame_range(
+                    comp, in_frame, out_frame, head_in_frame, tail_out_frame,
+                    sync_tools=sync_tools)
             return True
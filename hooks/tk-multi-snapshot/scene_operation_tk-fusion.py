@@ -14,9 +14,6 @@ import tank
 from tank import Hook
 from tank import TankError
 
-import BlackmagicFusion as bmd
-fusion = bmd.scriptapp("Fusion")
-
 
 __author__ = "Diego Garcia Huerta"
 __email__ = "diegogh2000@gmail.com"
@@ -44,13 +41,16 @@ class SceneOperation(Hook):
                                      file path as a String
                     all others     - None
         """
+        fusion = self.parent.engine.fusion
         comp = fusion.GetCurrentComp()
 
         if operation == "current_path":
-            return comp.GetAttrs()['COMPS_FileName']
+            tk_fusion = self.parent.engine.import_module("tk_fusion")
+            return tk_fusion.comp_path(comp)
 
         elif operation == "open":
             fusion.LoadComp(file_path)
 
         elif operation == "save":
-            comp.Save(file_path)
+            tk_fusion = self.parent.engine.import_module("tk_fusion")
+            tk_fusion.save_comp(comp, file_path)
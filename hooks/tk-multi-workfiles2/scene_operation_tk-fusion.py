@@ -11,9 +11,6 @@ import os
 import sgtk
 from sgtk.platform.qt import QtGui
 
-import BlackmagicFusion as bmd
-fusion = bmd.scriptapp("Fusion")
-
 
 __author__ = "Diego Garcia Huerta"
 __email__ = "diegogh2000@gmail.com"
@@ -73,19 +70,24 @@ class SceneOperation(HookClass):
         app.log_debug('file_version: %s' % file_version)
         app.log_debug('read_only: %s' % read_only)
 
+        fusion = self.parent.engine.fusion
         comp = fusion.GetCurrentComp()
 
         comp.Lock()
         if operation == "current_path":
-            return comp.GetAttrs()['COMPS_FileName']
+            tk_fusion = self.parent.engine.import_module("tk_fusion")
+            return tk_fusion.comp_path(comp)
         elif operation == "open":
             if comp:
                 comp.Close()
+            # the read-ahead of the media starts while Fusion loads the comp
+            self.parent.engine.prefetch_comp_media(file_path)
             fusion.LoadComp(file_path)
-        elif operation == "save":
-            comp.Save(file_path)
-        elif operation == "save_as":
-            comp.Save(file_path)
+        elif operation in ("save", "save_as"):
+            # the Loaders reading the media cache are saved with their
+            # network clip
+            tk_fusion = self.parent.engine.import_module("tk_fusion")
+            tk_fusion.save_comp(comp, file_path)
         elif operation == "reset":
             if comp:
                 comp.Close()
@@ -8,4 +8,45 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
-from .menu_generation import MenuGenerator
\ No newline at end of file
+from .command_registry import CommandRegistry, RegisteredCommand
+from .command_search import CommandSearchIndex
+from .command_palette import CommandPalette
+from .comp_parser import (
+    CompInfo, ToolInfo, iter_comp_values, parse_comp, read_comp)
+from .comp_rewriter import (
+    ClipRule, PlatformRoots, RootRemap, VersionUp, rewrite_comp,
+    rewrite_comp_lines, rewrite_comps)
+from .connection import FusionConnection
+from .context_watcher import ContextWatcher
+from .frame_range import get_frame_range, set_frame_range
+from .frame_transfer import FrameTransferPool, transfer_rendered_frames
+from .frame_verify import FrameProblem, verify_frame, verify_frames
+from .fusion_attrs import (
+    comp_path, get_attr, get_attrs, get_pref, get_prefs, tool_clip)
+from .lru_cache import LRUCache
+from .media_cache import (
+    MediaCache, forget_cached_media, read_cached_media, read_loader_clips,
+    save_comp, sequence_files, switch_loader_clips)
+from .menu_generation import MenuGenerator
+from .path_mapping import PathMapper, create_path_mapper
+from .prefetch import MediaPrefetcher, warm_file
+from .proxies import (
+    PROXY_SCALES, ProxyGenerator, set_loader_proxies, source_fingerprint)
+from .reference_report import (
+    FolderListings, Reference, find_comps, find_versions,
+    resolve_latest_versions, scan_comps, write_report)
+from .render_capacity import (
+    VolumeCheck, check_render_capacity, check_volumes, estimate_output_size)
+from .render_dispatcher import (
+    RenderChunk, RenderDispatcher, create_render_dispatcher, is_movie,
+    render_node_command)
+from .render_monitor import RenderMonitor
+from .render_watcher import RenderState, RenderWatcher
+from .savers import (
+    SaverChange, apply_saver_changes, create_savers, fusion_clip_path,
+    local_output_path, plan_saver_updates, read_local_outputs,
+    read_output_clips, read_saver_clips)
+from .sequence_manifest import (
+    SequenceInfo, SequenceScanner, find_sequence, get_sequence_scanner,
+    sequence_key, sequence_range)
+from .template_resolver import TemplateResolver
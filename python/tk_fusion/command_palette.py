@@ -0,0 +1,101 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Command palette widget listing every command registered with the engine.
+
+"""
+
+from tank.platform import qt
+
+from .lazy_qt import LazyQtClass
+
+
+# maximum number of commands listed at once
+MAX_RESULTS = 50
+
+
+class CommandPalette(LazyQtClass):
+    """
+    Search field and list of the engine commands, filtered as the user types.
+    Running a command from the list records it as recently used.
+
+    The palette is a QWidget, it can only be created once the engine set up
+    Qt.
+    """
+
+    qt_base_class = "QtGui.QWidget"
+    # command_executed is emitted with the command name once a command has
+    # been run
+    qt_signals = {"command_executed": (str,)}
+
+    def __init__(self, engine, parent=None):
+        super(CommandPalette, self).__init__(parent)
+        self._engine = engine
+
+        self._search = qt.QtGui.QLineEdit(self)
+        self._search.setPlaceholderText("Search commands...")
+        self._search.textChanged.connect(self._refresh)
+        self._search.returnPressed.connect(self._run_current)
+        self._search.installEventFilter(self)
+
+        self._results = qt.QtGui.QListWidget(self)
+        self._results.itemActivated.connect(self._run_item)
+
+        layout = qt.QtGui.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self._search)
+        layout.addWidget(self._results)
+
+        self._refresh()
+
+    def refresh(self):
+        """
+        Updates the list, for instance after a context change.
+        """
+        self._refresh()
+
+    def _refresh(self, text=None):
+        if text is None:
+            text = self._search.text()
+
+        names = self._engine.command_search_index.search(
+            text, limit=MAX_RESULTS)
+
+        self._results.clear()
+        self._results.addItems(names)
+        if names:
+            self._results.setCurrentRow(0)
+
+    def _run_current(self):
+        item = self._results.currentItem()
+        if item is not None:
+            self._run_item(item)
+
+    def _run_item(self, item):
+        name = item.text()
+        self._engine.command_search_index.record_use(name)
+        if self._engine.command_registry.execute(name):
+            self.command_executed.emit(name)
+
+    def eventFilter(self, obj, event):
+        """
+        Lets the arrow keys move through the results while typing.
+        """
+        if obj is self._search and event.type() == qt.QtCore.QEvent.KeyPress:
+            if event.key() in (qt.QtCore.Qt.Key_Up, qt.QtCore.Qt.Key_Down):
+                row = self._results.currentRow()
+                if event.key() == qt.QtCore.Qt.Key_Up:
+                    row = max(row - 1, 0)
+                else:
+                    row = min(row + 1, self._results.count() - 1)
+                self._results.setCurrentRow(row)
+                return True
+        return super(CommandPalette, self).eventFilter(obj, event)
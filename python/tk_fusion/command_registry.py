@@ -0,0 +1,175 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Lookup index over the commands registered with the engine.
+
+"""
+
+
+class RegisteredCommand(object):
+    """
+    A single entry of the command registry.
+    """
+
+    def __init__(self, name, callback, properties, app_instance_name):
+        self.name = name
+        self.callback = callback
+        self.properties = properties
+        self.app = properties.get("app")
+        self.app_instance_name = app_instance_name
+        self.short_name = properties.get("short_name")
+
+    def get_type(self):
+        """
+        Returns the command type, defaults to 'default'
+        """
+        return self.properties.get("type", "default")
+
+    def __repr__(self):
+        return "<RegisteredCommand %s (%s)>" % (self.name,
+                                                self.app_instance_name)
+
+
+class CommandRegistry(object):
+    """
+    Maps command names, short names and app instance names to the commands
+    registered with the engine, so lookups do not have to scan
+    engine.commands or engine.apps.
+
+    The index is built lazily on first access and discarded with
+    invalidate(), which the engine does whenever commands are registered
+    or the context changes.
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._built = False
+        self._generation = 0
+        self._by_name = {}
+        self._by_short_name = {}
+        self._by_app_instance = {}
+        self._app_instance_names = {}
+
+    def invalidate(self):
+        """
+        Marks the index as stale, it will be rebuilt on next access.
+        """
+        self._built = False
+
+    def rebuild(self):
+        """
+        Rebuilds the index from the engine's apps and commands.
+        """
+        # app instances are compared by identity, the same way
+        # engine.apps hands them out
+        app_instance_names = {}
+        for (app_instance_name, app) in self._engine.apps.items():
+            app_instance_names[id(app)] = app_instance_name
+
+        by_name = {}
+        by_short_name = {}
+        by_app_instance = {}
+
+        for (cmd_name, cmd_details) in self._engine.commands.items():
+            properties = cmd_details["properties"]
+            app = properties.get("app")
+            app_instance_name = None
+            if app is not None:
+                app_instance_name = app_instance_names.get(id(app))
+
+            command = RegisteredCommand(cmd_name,
+                                        cmd_details["callback"],
+                                        properties,
+                                        app_instance_name)
+            by_name[cmd_name] = command
+
+            # first registered wins, short names are not guaranteed to be
+            # unique across apps
+            if command.short_name:
+                by_short_name.setdefault(command.short_name, command)
+
+            if app_instance_name:
+                by_app_instance.setdefault(app_instance_name,
+                                           {})[cmd_name] = command
+
+        self._app_instance_names = app_instance_names
+        self._by_name = by_name
+        self._by_short_name = by_short_name
+        self._by_app_instance = by_app_instance
+        self._generation += 1
+        self._built = True
+
+    def _ensure_built(self):
+        if not self._built:
+            self.rebuild()
+
+    @property
+    def generation(self):
+        """
+        Number incremented every time the index is rebuilt, so dependent
+        indexes can tell when they are stale.
+        """
+        self._ensure_built()
+        return self._generation
+
+    @property
+    def commands(self):
+        """
+        List of all the registered commands
+        """
+        self._ensure_built()
+        return list(self._by_name.values())
+
+    def get(self, name):
+        """
+        Returns the command registered under the exact name given, falling
+        back to a command with that short name.
+
+        :param name: Command name or short name.
+        :returns: :class:`RegisteredCommand` or None
+        """
+        self._ensure_built()
+        command = self._by_name.get(name)
+        if command is None:
+            command = self._by_short_name.get(name)
+        return command
+
+    def get_app_instance_name(self, app):
+        """
+        Returns the name of the app instance, as defined in the environment.
+        Returns None if not found.
+        """
+        self._ensure_built()
+        return self._app_instance_names.get(id(app))
+
+    def get_app_commands(self, app_instance_name):
+        """
+        Returns a dictionary of command name to :class:`RegisteredCommand`
+        for all the commands of the given app instance.
+        """
+        self._ensure_built()
+        return self._by_app_instance.get(app_instance_name, {})
+
+    def execute(self, name):
+        """
+        Runs the callback of the command registered under the given name.
+
+        :param name: Command name or short name.
+        :returns: True if a command was found and run, False otherwise.
+        """
+        command = self.get(name)
+        if command is None:
+            self._engine.logger.warning("No command registered as '%s'.",
+                                        name)
+            return False
+
+        command.callback()
+        return True
@@ -0,0 +1,166 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Fuzzy search index over the engine commands, used by the command palette.
+
+"""
+
+import re
+
+
+# minimum fraction of the query trigrams a command name needs to share with
+# the query to be considered a match
+MIN_TRIGRAM_SCORE = 0.6
+
+# number of recently used commands remembered by the index
+MAX_RECENT_COMMANDS = 10
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+def _trigrams(words):
+    """
+    Returns the set of trigrams of the given words. Words are padded at the
+    start only, so a partially typed word shares all its trigrams with the
+    full word.
+    """
+    trigrams = set()
+    for word in words:
+        padded = "  %s" % word
+        for index in range(len(padded) - 2):
+            trigrams.add(padded[index:index + 3])
+    return trigrams
+
+
+class CommandSearchIndex(object):
+    """
+    Trigram and prefix index over the commands of a
+    :class:`CommandRegistry`.
+
+    The index is rebuilt automatically when the registry is rebuilt, the
+    list of recently used commands is kept across rebuilds.
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._generation = None
+        self._names = []
+        self._lower_names = []
+        self._prefixes = {}
+        self._trigrams = {}
+        self._favourites = set()
+        self._recent = []
+
+    def _ensure_built(self):
+        registry = self._engine.command_registry
+        if self._generation == registry.generation:
+            return
+
+        favourite_keys = set()
+        for fav in self._engine.get_setting("menu_favourites", []):
+            favourite_keys.add((fav["app_instance"], fav["name"]))
+
+        names = sorted(command.name for command in registry.commands)
+        prefixes = {}
+        trigrams = {}
+        favourites = set()
+
+        for (index, name) in enumerate(names):
+            command = registry.get(name)
+            if (command.app_instance_name, name) in favourite_keys:
+                favourites.add(index)
+
+            words = _words(name)
+            for word in words:
+                # short queries are answered from word prefixes, longer ones
+                # from the trigrams
+                for length in (1, 2):
+                    if len(word) >= length:
+                        prefixes.setdefault(word[:length], set()).add(index)
+
+            for trigram in _trigrams(words):
+                trigrams.setdefault(trigram, []).append(index)
+
+        self._names = names
+        self._lower_names = [name.lower() for name in names]
+        self._prefixes = prefixes
+        self._trigrams = trigrams
+        self._favourites = favourites
+        self._generation = registry.generation
+
+    def record_use(self, name):
+        """
+        Marks the given command as the most recently used one.
+        """
+        if name in self._recent:
+            self._recent.remove(name)
+        self._recent.insert(0, name)
+        del self._recent[MAX_RECENT_COMMANDS:]
+
+    def search(self, text, limit=None):
+        """
+        Returns the names of the commands matching the text, best matches
+        first. Favourite and recently used commands rank higher, an empty
+        text returns all the commands.
+
+        :param str text: Text typed by the user.
+        :param int limit: Maximum number of names to return.
+        :returns: List of command names.
+        """
+        self._ensure_built()
+
+        query = text.strip().lower()
+        words = _words(query)
+
+        if not words:
+            scores = dict((index, 1.0) for index in range(len(self._names)))
+
+        elif len(words) == 1 and len(words[0]) < 3:
+            scores = dict((index, 1.0) for index in
+                          self._prefixes.get(words[0], ()))
+
+        else:
+            query_trigrams = _trigrams(words)
+            counts = {}
+            for trigram in query_trigrams:
+                for index in self._trigrams.get(trigram, ()):
+                    counts[index] = counts.get(index, 0) + 1
+
+            scores = {}
+            for (index, count) in counts.items():
+                score = float(count) / len(query_trigrams)
+                if score >= MIN_TRIGRAM_SCORE:
+                    scores[index] = score
+
+        recent_rank = dict((name, rank)
+                           for (rank, name) in enumerate(self._recent))
+        no_rank = len(recent_rank)
+
+        def sort_key(index):
+            name = self._names[index]
+            return (
+                -scores[index],
+                not self._lower_names[index].startswith(query),
+                index not in self._favourites,
+                recent_rank.get(name, no_rank),
+                len(name),
+                name,
+            )
+
+        indices = sorted(scores, key=sort_key)
+        if limit is not None:
+            indices = indices[:limit]
+
+        return [self._names[index] for index in indices]
@@ -0,0 +1,409 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Reads the tools and the media of a .comp file without Fusion.
+
+A comp file is a Lua table. It is read line by line and turned into a
+stream of values, each with the path of keys leading to it, from which
+the tools, their clips and their ranges are picked. Nothing else of the
+file is kept in memory, and the tables that are of no interest, like the
+inputs of the tools other than Loaders and Savers, are skipped by only
+counting their braces.
+
+"""
+
+import os
+import re
+
+
+# Lua tokens, in the order they are tried
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+      (?P<op>[{}=,;()\]])
+    | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<num>-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    | (?P<str>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    | (?P<comment>--.*)
+    | (?P<long>\[=*\[)
+    | (?P<bracket>\[)
+    | (?P<other>.)
+    )?
+""", re.VERBOSE)
+
+_LONG_BRACKET_RE = re.compile(r"\[=*\[")
+_STRINGS_RE = re.compile(r"""("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')""")
+
+_ESCAPE_RE = re.compile(r"\\(.)")
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+_SCALAR_NAMES = {"true": True, "false": False, "nil": None}
+
+# path prefix Fusion uses for the paths relative to the comp
+_COMP_PATH_MAP = "Comp:"
+
+# tools whose content is read, the others are skipped
+_MEDIA_TOOLS = ("Loader", "Saver")
+_GROUP_TOOLS = ("GroupOperator", "MacroOperator")
+
+# comp level tables that are read
+_COMP_TABLES = ("Tools", "GlobalRange", "RenderRange")
+
+
+class _TokenState(object):
+    """
+    State shared by the tokenizer and its reader: the depth of the table
+    being skipped, zero when nothing is skipped, and the position in its
+    line of the last string read, None for long strings.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.span = None
+
+
+def _brace_count(line):
+    """
+    Returns the number of opening minus closing braces of the line, or None
+    if the line has to be tokenized to tell, as it may start a long string
+    or a comment.
+    """
+    if "[" in line or "-" in line:
+        if "[[" in line or "[=" in line or "--" in line:
+            return None
+    if '"' in line or "'" in line:
+        line = _STRINGS_RE.sub("", line)
+    return line.count("{") - line.count("}")
+
+
+def _unescape(text):
+    return _ESCAPE_RE.sub(
+        lambda match: _ESCAPES.get(match.group(1), match.group(1)), text)
+
+
+def _tokens(lines, state=None):
+    """
+    Yields the (kind, value) tokens of the Lua source lines, long strings
+    spanning several lines included. Comments are skipped.
+
+    While state.depth is set, the tokens are dropped up to the closing brace
+    of the skipped table, which is yielded. Lines without strings or
+    comments are then only searched for braces.
+    """
+    if state is None:
+        state = _TokenState()
+
+    # closing bracket of the long string or comment being read
+    long_end = None
+    long_parts = None
+    long_is_comment = False
+
+    for line in lines:
+        if state.depth and long_end is None:
+            count = _brace_count(line)
+            if count is not None and state.depth + count > 0:
+                state.depth += count
+                continue
+
+        pos = 0
+        while True:
+            if long_end is not None:
+                end = line.find(long_end, pos)
+                if end < 0:
+                    long_parts.append(line[pos:])
+                    break
+                long_parts.append(line[pos:end])
+                if not long_is_comment:
+                    state.span = None
+                    yield ("str", "".join(long_parts))
+                pos = end + len(long_end)
+                long_end = None
+
+            for match in _TOKEN_RE.finditer(line, pos):
+                kind = match.lastgroup
+                if kind is None:
+                    # trailing spaces
+                    continue
+                value = match.group(kind)
+                if kind == "bracket":
+                    kind = "op"
+                if kind == "comment":
+                    long_match = _LONG_BRACKET_RE.match(
+                        line, match.start(kind) + 2)
+                    if long_match is None:
+                        # the comment runs to the end of the line
+                        continue
+                    long_is_comment = True
+                elif kind == "long":
+                    long_match = _LONG_BRACKET_RE.match(
+                        line, match.start(kind))
+                    long_is_comment = False
+                elif state.depth:
+                    if kind == "op":
+                        if value == "{":
+                            state.depth += 1
+                        elif value == "}":
+                            state.depth -= 1
+                            if not state.depth:
+                                yield (kind, value)
+                    continue
+                else:
+                    if kind == "str":
+                        value = _unescape(value[1:-1])
+                        state.span = match.span(kind)
+                    elif kind == "num":
+                        value = float(value)
+                    yield (kind, value)
+                    continue
+
+                # long string or comment, read up to its closing bracket
+                long_end = "]" + long_match.group()[1:-1] + "]"
+                long_parts = []
+                pos = long_match.end()
+                break
+            else:
+                # end of the line
+                break
+
+
+def iter_comp_values(lines, skip_table=None, state=None):
+    """
+    Yields the values of a comp file as (path, type, value) tuples.
+
+    The path is a tuple of the keys leading to the value, numbers for the
+    entries of arrays. Tables are yielded when they start, with value None
+    and type their constructor, like 'Loader' or 'Input', or None. Other
+    values are yielded with a None type.
+
+    :param lines: Iterable over the lines of the comp file.
+    :param skip_table: Callable taking the path and the type of a table,
+                       returning True if the content of the table should
+                       be skipped.
+    :param state: Tokenizer state, giving the position of the strings.
+    """
+    if state is None:
+        state = _TokenState()
+    path = []
+    # next array index of each open table
+    indices = [1]
+    key = None
+    constructor = None
+    # last name read, may turn out to be a key, a constructor or a value
+    name = None
+    expect_key = False
+
+    def entry_key():
+        if key is not None:
+            return key
+        index = indices[-1]
+        indices[-1] += 1
+        return index
+
+    for (kind, value) in _tokens(lines, state):
+        if name is not None:
+            # settle the pending name now the next token is known
+            if kind == "op" and value == "=":
+                key = name
+                name = None
+                continue
+            if kind == "op" and value in "({":
+                constructor = name
+                name = None
+                if value == "(":
+                    # ordered() or other call, the table follows the call
+                    continue
+            else:
+                yield (tuple(path) + (entry_key(),), None,
+                       _SCALAR_NAMES.get(name, name))
+                key = None
+                name = None
+
+        if kind == "name":
+            name = value
+        elif kind in ("str", "num"):
+            if expect_key:
+                key = value if kind == "str" else int(value)
+                continue
+            yield (tuple(path) + (entry_key(),), None, value)
+            key = None
+        elif kind == "op":
+            if value == "{":
+                table_key = entry_key()
+                path.append(table_key)
+                indices.append(1)
+                table_path = tuple(path)
+                yield (table_path, constructor, None)
+                if skip_table is not None and skip_table(
+                        table_path, constructor):
+                    state.depth = 1
+                key = None
+                constructor = None
+            elif value == "}":
+                if len(path) > 0:
+                    path.pop()
+                    indices.pop()
+                key = None
+            elif value == "[":
+                expect_key = True
+            elif value == "]":
+                expect_key = False
+            elif value == "," or value == ";":
+                key = None
+
+    if name is not None:
+        yield (tuple(path) + (entry_key(),), None,
+               _SCALAR_NAMES.get(name, name))
+
+
+class ToolInfo(object):
+    """
+    A tool found in a comp file.
+    """
+
+    def __init__(self, name, tool_type, group=None):
+        self.name = name
+        self.type = tool_type
+        # name of the group or macro holding the tool, if any
+        self.group = group
+        self.clips = []
+        self.global_in = None
+        self.global_out = None
+        self.pass_through = False
+
+    def __repr__(self):
+        return "<ToolInfo %s %s>" % (self.type, self.name)
+
+
+class CompInfo(object):
+    """
+    What was read from a comp file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.global_range = None
+        self.render_range = None
+        self.tools = []
+
+    @property
+    def loaders(self):
+        return [tool for tool in self.tools if tool.type == "Loader"]
+
+    @property
+    def savers(self):
+        return [tool for tool in self.tools if tool.type == "Saver"]
+
+    def expand_path(self, clip):
+        """
+        Turns a clip path relative to the comp, starting with 'Comp:', into
+        an absolute path. Other paths are returned as they are.
+        """
+        if self.path and clip.startswith(_COMP_PATH_MAP):
+            relative_path = clip[len(_COMP_PATH_MAP):].lstrip("/\\")
+            return os.path.normpath(
+                os.path.join(os.path.dirname(self.path), relative_path))
+        return clip
+
+    def __repr__(self):
+        return "<CompInfo %s, %d tools>" % (self.path, len(self.tools))
+
+
+def _range(values):
+    if len(values) == 2:
+        return (int(values[0]), int(values[1]))
+    return None
+
+
+def _read_comp(lines, info, state=None):
+    """
+    Fills the :class:`CompInfo` from the lines of a comp file, yielding
+    (tool, clip) as each clip is read, while the tokenizer state still
+    gives the position of the clip in its line.
+    """
+    # (depth of the tool table, tool) of the tools being read, groups hold
+    # their own tools
+    open_tools = []
+    ranges = {"GlobalRange": [], "RenderRange": []}
+
+    def skip_table(table_path, constructor):
+        depth = len(table_path)
+        if depth == 2:
+            return table_path[1] not in _COMP_TABLES
+        if depth > 2 and table_path[-2] == "Tools":
+            return constructor not in _MEDIA_TOOLS + _GROUP_TOOLS
+        return table_path[-1] == "ViewInfo"
+
+    for (value_path, constructor, value) in iter_comp_values(
+            lines, skip_table, state):
+        depth = len(value_path)
+        while open_tools and depth <= open_tools[-1][0]:
+            open_tools.pop()
+
+        if (constructor is not None and depth >= 2 and
+                value_path[-2] == "Tools"):
+            group = open_tools[-1][1].name if open_tools else None
+            tool = ToolInfo(value_path[-1], constructor, group)
+            info.tools.append(tool)
+            open_tools.append((depth, tool))
+            continue
+
+        if constructor is not None or value is None:
+            continue
+
+        if not open_tools:
+            # comp level values: Composition { GlobalRange = { 1, 100 } }
+            if depth == 3 and value_path[1] in ranges:
+                ranges[value_path[1]].append(value)
+            continue
+
+        (tool_depth, tool) = open_tools[-1]
+        key_path = value_path[tool_depth:]
+
+        if key_path[-1] == "Filename" and (
+                (key_path[0] == "Clips" and len(key_path) == 3) or
+                key_path[:3] == ("Inputs", "Clip", "Value")):
+            tool.clips.append(value)
+            yield (tool, value)
+        elif key_path == ("Inputs", "GlobalIn", "Value"):
+            tool.global_in = int(value)
+        elif key_path == ("Inputs", "GlobalOut", "Value"):
+            tool.global_out = int(value)
+        elif key_path == ("PassThrough",):
+            tool.pass_through = bool(value)
+
+    info.global_range = _range(ranges["GlobalRange"])
+    info.render_range = _range(ranges["RenderRange"])
+
+
+def read_comp(lines, path=None):
+    """
+    Reads the tools, their clips and ranges, and the comp ranges from the
+    lines of a comp file.
+
+    :param lines: Iterable over the lines of the comp file.
+    :param path: Path of the comp file, used to expand relative clips.
+    :returns: :class:`CompInfo`
+    """
+    info = CompInfo(path)
+    for _ in _read_comp(lines, info):
+        pass
+    return info
+
+
+def parse_comp(path):
+    """
+    Reads the tools, their clips and ranges, and the comp ranges of a comp
+    file, streaming the file.
+
+    :param path: Path of the comp file.
+    :returns: :class:`CompInfo`
+    """
+    with open(path, "r") as comp_file:
+        return read_comp(comp_file, path)
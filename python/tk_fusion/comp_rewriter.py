@@ -0,0 +1,428 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Rewrites the clips of the Loaders and Savers of .comp files without Fusion.
+
+The comp is streamed through the comp parser, which gives the position of
+each clip in its line, and written line by line to a temporary file that
+replaces the comp once complete. Only the clips are changed, the rest of
+the file is written back as it was read.
+
+Runs from the command line, on many comps in parallel:
+
+    python -m tk_fusion.comp_rewriter /projects/show/sequences \\
+        --remap /mnt/old_storage=/mnt/new_storage --latest
+
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+
+import tank
+
+from .comp_parser import CompInfo, _TokenState, _read_comp
+from .path_mapping import PathMapper, create_path_mapper
+from .reference_report import FolderListings, find_versions
+from .template_resolver import TemplateResolver
+
+
+# extension of the comps searched in folders
+COMP_EXTENSION = ".comp"
+
+def _quote(value):
+    return '"%s"' % (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+
+
+class ClipRule(object):
+    """
+    Base class of the rules rewriting the clips of a comp.
+
+    Rules are pickled to the worker processes when rewriting comps in
+    parallel, anything they cannot pickle has to be created lazily.
+    """
+
+    tool_types = ("Loader", "Saver")
+
+    def __init__(self, tool_types=None):
+        if tool_types is not None:
+            self.tool_types = tuple(tool_types)
+
+    def applies_to(self, tool):
+        return tool.type in self.tool_types
+
+    def rewrite(self, clip, info):
+        """
+        Returns the new clip, or the clip itself to leave it unchanged.
+
+        :param clip: Clip as written in the comp.
+        :param info: :class:`CompInfo` of the comp read so far, giving its
+                     path.
+        """
+        raise NotImplementedError
+
+
+class RootRemap(ClipRule):
+    """
+    Moves the clips found under a root to another root, whatever their
+    separators and case.
+    """
+
+    def __init__(self, mappings, tool_types=None):
+        """
+        :param mappings: List of (old root, new root), the first matching
+                         root is used.
+        """
+        super(RootRemap, self).__init__(tool_types)
+        self.mappings = list(mappings)
+        self._path_mapper = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_path_mapper"] = None
+        return state
+
+    def get_path_mapper(self):
+        if self._path_mapper is None:
+            self._path_mapper = PathMapper(self.mappings)
+        return self._path_mapper
+
+    def rewrite(self, clip, info):
+        return self.get_path_mapper().translate(clip)
+
+
+class PlatformRoots(RootRemap):
+    """
+    Moves the clips found under the roots of the pipeline configuration, on
+    any platform, to the roots of one platform.
+    """
+
+    def __init__(self, config_path, platform=None, mappings=None,
+                 tool_types=None):
+        """
+        :param config_path: Path inside the project, used to load its
+                            toolkit configuration.
+        :param platform: Target platform, as given by sys.platform,
+                         defaults to the current one.
+        :param mappings: List of other (old root, new root).
+        """
+        super(PlatformRoots, self).__init__(mappings or [], tool_types)
+        self.config_path = config_path
+        self.platform = platform
+
+    def get_path_mapper(self):
+        if self._path_mapper is None:
+            self._path_mapper = create_path_mapper(
+                tank.sgtk_from_path(self.config_path), self.platform,
+                self.mappings)
+        return self._path_mapper
+
+
+class VersionUp(ClipRule):
+    """
+    Sets the version of the clips matching a template, to the latest one
+    found on disk or to a given one. Only the version in the clip changes,
+    its root and its 'Comp:' prefix are kept.
+    """
+
+    def __init__(self, config_path, version=None, tool_types=None):
+        """
+        :param config_path: Path inside the project, used to load its
+                            toolkit configuration.
+        :param version: Version set, None for the latest version on disk.
+        """
+        super(VersionUp, self).__init__(tool_types)
+        self.config_path = config_path
+        self.version = version
+        self._resolver = None
+        self._listings = None
+        self._path_mapper = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_resolver"] = None
+        state["_listings"] = None
+        state["_path_mapper"] = None
+        return state
+
+    def rewrite(self, clip, info):
+        if self._resolver is None:
+            tk = tank.sgtk_from_path(self.config_path)
+            self._resolver = TemplateResolver(tk)
+            self._listings = FolderListings()
+            self._path_mapper = create_path_mapper(tk)
+
+        path = self._path_mapper.translate(info.expand_path(clip))
+        try:
+            (template, fields) = \
+                self._resolver.template_and_fields_from_path(path)
+        except tank.TankError:
+            return clip
+        if template is None or "version" not in fields:
+            return clip
+
+        version = self.version
+        if version is None:
+            versions = find_versions(template, fields, self._listings)
+            if not versions:
+                return clip
+            version = max(versions)
+        if version == fields["version"]:
+            return clip
+
+        return _replace_version(clip, path, template, fields["version"],
+                                version)
+
+
+def _replace_version(clip, path, template, old_version, new_version):
+    """
+    Returns the clip with its version tokens changed, the rest of the clip
+    is kept as written, with its root and its 'Comp:' prefix.
+
+    :param clip: Clip as written in the comp.
+    :param path: Absolute path of the clip, matching the template.
+    """
+    key = template.keys["version"]
+    pattern = re.compile(
+        r"(?<!\d)%s(?!\d)" % re.escape(key.str_from_value(old_version)))
+    # the version is only known to be those tokens when the path has as
+    # many as the template, a 'Comp:' clip does not show the ones of the
+    # comp folder
+    if len(pattern.findall(path)) != template.definition.count("{version}"):
+        return clip
+    new_token = key.str_from_value(new_version)
+    return pattern.sub(lambda match: new_token, clip)
+
+
+def rewrite_comp_lines(lines, out, rules, path=None):
+    """
+    Writes the lines of a comp to out, with the clips rewritten.
+
+    :param lines: Iterable over the lines of the comp.
+    :param out: File like object the lines are written to.
+    :param rules: List of :class:`ClipRule`, applied in order.
+    :param path: Path of the comp, used to expand relative clips.
+    :returns: List of (tool name, old clip, new clip) changes.
+    """
+    info = CompInfo(path)
+    state = _TokenState()
+    changes = []
+    # line being read and its (start, end, text) edits
+    current = [None, []]
+
+    def flush():
+        (line, edits) = current
+        if line is None:
+            return
+        for (start, end, text) in reversed(edits):
+            line = line[:start] + text + line[end:]
+        out.write(line)
+
+    def feed():
+        for line in lines:
+            flush()
+            current[0] = line
+            current[1] = []
+            yield line
+        flush()
+        current[0] = None
+
+    for (tool, clip) in _read_comp(feed(), info, state):
+        if state.span is None:
+            # long strings are not used for clips
+            continue
+        new_clip = clip
+        for rule in rules:
+            if rule.applies_to(tool):
+                new_clip = rule.rewrite(new_clip, info)
+        if new_clip != clip:
+            (start, end) = state.span
+            current[1].append((start, end, _quote(new_clip)))
+            changes.append((tool.name, clip, new_clip))
+
+    return changes
+
+
+def rewrite_comp(path, rules, output_path=None, dry_run=False):
+    """
+    Rewrites the clips of a comp file.
+
+    The comp is written to a temporary file next to the output, which then
+    replaces the output, so an interrupted rewrite never leaves a partial
+    comp. Nothing is written when no clip changes.
+
+    :param path: Path of the comp.
+    :param rules: List of :class:`ClipRule`, applied in order.
+    :param output_path: Path the comp is written to, defaults to the comp.
+    :param dry_run: Only returns the changes, without writing.
+    :returns: List of (tool name, old clip, new clip) changes.
+    """
+    if dry_run:
+        with open(path, "rb") as comp_file:
+            with open(os.devnull, "wb") as null_file:
+                return rewrite_comp_lines(comp_file, null_file, rules, path)
+
+    output_path = output_path or path
+    (handle, temp_path) = tempfile.mkstemp(
+        prefix=".%s." % os.path.basename(output_path),
+        dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with os.fdopen(handle, "wb") as temp_file:
+            with open(path, "rb") as comp_file:
+                changes = rewrite_comp_lines(comp_file, temp_file, rules, path)
+
+        if changes:
+            # keep the permissions of the original comp
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+            # renaming over an existing file fails on Windows
+            if sys.platform == "win32" and os.path.exists(output_path):
+                os.remove(output_path)
+            os.rename(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return changes
+
+
+# rules and options of the worker processes, set once by the pool
+_worker_options = {}
+
+
+def _init_worker(rules, dry_run):
+    _worker_options["rules"] = rules
+    _worker_options["dry_run"] = dry_run
+
+
+def _rewrite_worker(path):
+    try:
+        changes = rewrite_comp(
+            path, _worker_options["rules"], dry_run=_worker_options["dry_run"])
+    except (IOError, OSError, ValueError) as e:
+        return (path, [], str(e))
+    return (path, changes, None)
+
+
+def rewrite_comps(paths, rules, processes=None, dry_run=False):
+    """
+    Rewrites the clips of many comps in a pool of processes.
+
+    :param paths: List of comp paths.
+    :param rules: List of :class:`ClipRule`, applied in order.
+    :param processes: Number of processes, defaults to the number of cores.
+    :param dry_run: Only returns the changes, without writing.
+    :returns: Iterator over (comp path, changes, error message or None), in
+              the order the comps are done.
+    """
+    pool = multiprocessing.Pool(
+        processes or multiprocessing.cpu_count(),
+        initializer=_init_worker, initargs=(rules, dry_run))
+    try:
+        for result in pool.imap_unordered(_rewrite_worker, paths, chunksize=4):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def find_comp_files(paths):
+    """
+    Returns the comps given, and the comps found under the folders given.
+    """
+    comps = []
+    for path in paths:
+        if not os.path.isdir(path):
+            comps.append(path)
+            continue
+        for (folder, _, file_names) in os.walk(path):
+            comps.extend(
+                os.path.join(folder, file_name) for file_name in file_names
+                if file_name.lower().endswith(COMP_EXTENSION))
+    return sorted(comps)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rewrites the clips of the Loaders and Savers of comps.")
+    parser.add_argument(
+        "paths", nargs="+", help="Comps, or folders searched for comps.")
+    parser.add_argument(
+        "--remap", action="append", default=[], metavar="OLD=NEW",
+        help="Moves the clips under the OLD root to the NEW root.")
+    parser.add_argument(
+        "--map-roots", default=None, metavar="PLATFORM",
+        help="Moves the clips under the roots of the pipeline configuration "
+             "to the roots of PLATFORM: win32, darwin or linux2.")
+    parser.add_argument(
+        "--latest", action="store_true",
+        help="Sets the Loaders to the latest version of their media.")
+    parser.add_argument(
+        "--saver-version", type=int, default=None,
+        help="Sets the version of the Saver outputs.")
+    parser.add_argument(
+        "--config-path", default=None,
+        help="Path in the project, used to load its toolkit configuration. "
+             "Defaults to the first path given.")
+    parser.add_argument(
+        "--processes", type=int, default=None,
+        help="Number of comps rewritten at the same time.")
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Lists the changes without writing the comps.")
+    args = parser.parse_args(argv)
+
+    mappings = [mapping.split("=", 1) for mapping in args.remap]
+    if any(len(mapping) != 2 for mapping in mappings):
+        parser.error("--remap expects OLD=NEW.")
+
+    rules = []
+    config_path = args.config_path or args.paths[0]
+    if args.map_roots:
+        rules.append(PlatformRoots(config_path, args.map_roots, mappings))
+    elif mappings:
+        rules.append(RootRemap(mappings))
+    if args.latest:
+        rules.append(VersionUp(config_path, tool_types=("Loader",)))
+    if args.saver_version is not None:
+        rules.append(VersionUp(
+            config_path, args.saver_version, tool_types=("Saver",)))
+    if not rules:
+        parser.error("Nothing to do, give --remap, --map-roots, --latest "
+                     "or --saver-version.")
+
+    comps = find_comp_files(args.paths)
+    changed = 0
+    failed = 0
+    for (path, changes, error) in rewrite_comps(
+            comps, rules, args.processes, args.dry_run):
+        if error is not None:
+            failed += 1
+            sys.stderr.write("Could not rewrite '%s': %s\n" % (path, error))
+            continue
+        if changes:
+            changed += 1
+        for (tool_name, old_clip, new_clip) in changes:
+            sys.stdout.write("%s: %s '%s' -> '%s'\n" % (
+                path, tool_name, old_clip, new_clip))
+
+    sys.stderr.write("%d comps %s, %d failed, out of %d.\n" % (
+        changed, "to change" if args.dry_run else "changed", failed,
+        len(comps)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # run from the package so the worker processes can import the functions
+    from tk_fusion.comp_rewriter import main
+    sys.exit(main())
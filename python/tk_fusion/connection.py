@@ -0,0 +1,82 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Shared connection to the running Fusion.
+
+"""
+
+import threading
+import time
+
+
+# how long a connection is trusted without being checked, in seconds
+HEALTH_CHECK_INTERVAL = 2.0
+
+
+class FusionConnection(object):
+    """
+    Hands out the scripting connection to Fusion.
+
+    The connection is only opened the first time it is asked for, and is
+    then shared by the engine, the Shotgun panel and the hooks through
+    ``engine.fusion``. It is checked at most every HEALTH_CHECK_INTERVAL
+    seconds with a cheap attribute read and opened again if Fusion stopped
+    answering, so a restarted Fusion does not leave dead handles behind.
+    """
+
+    def __init__(self, app_name="Fusion"):
+        self._app_name = app_name
+        self._handle = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns a live connection to Fusion.
+
+        :raises: RuntimeError if Fusion cannot be reached.
+        """
+        with self._lock:
+            now = time.time()
+            if self._handle is not None:
+                if now - self._checked_at < HEALTH_CHECK_INTERVAL:
+                    return self._handle
+                if self._is_alive(self._handle):
+                    self._checked_at = now
+                    return self._handle
+
+            self._handle = self._connect()
+            self._checked_at = now
+            return self._handle
+
+    def reset(self):
+        """
+        Drops the current connection, the next call to :meth:`get` opens a
+        new one.
+        """
+        with self._lock:
+            self._handle = None
+
+    def _connect(self):
+        import BlackmagicFusion as bmd
+
+        handle = bmd.scriptapp(self._app_name)
+        if handle is None:
+            raise RuntimeError(
+                "Could not connect to %s, is it running?" % self._app_name)
+        return handle
+
+    @staticmethod
+    def _is_alive(handle):
+        try:
+            return handle.GetAttrs("FUSIONS_Version") is not None
+        except Exception:
+            return False
@@ -0,0 +1,144 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Automatic context switching following the comp that is active in Fusion.
+
+"""
+
+import tank
+from tank.platform import qt
+
+from .fusion_attrs import comp_path
+from .lazy_qt import LazyQtClass
+from .lru_cache import LRUCache
+
+
+# how often the active comp is checked, in milliseconds
+POLL_INTERVAL = 500
+
+# how long the active comp has to stay the same before the context is
+# switched, in milliseconds. Avoids switching for every comp the artist
+# cycles through.
+DEBOUNCE_INTERVAL = 400
+
+# number of comp paths whose context is remembered
+CONTEXT_CACHE_SIZE = 64
+
+_MISSING = object()
+
+
+class ContextWatcher(LazyQtClass):
+    """
+    Watches the active comp and its file name, which change when a comp is
+    loaded, saved under a new name or activated, and switches the engine to
+    the context of that comp.
+
+    Fusion does not notify Python of these events, so the active comp path
+    is polled, which costs two attribute reads. Contexts are resolved
+    through an LRU cache keyed by the comp path, switching back to a comp
+    that was already open does not resolve its context again.
+
+    The watcher is a QObject, it can only be created once the engine set up
+    Qt.
+    """
+
+    qt_base_class = "QtCore.QObject"
+    # comp_changed is emitted with the path of the comp the artist settled
+    # on, empty for an untitled comp
+    qt_signals = {"comp_changed": (str,)}
+
+    def __init__(self, engine, parent=None):
+        super(ContextWatcher, self).__init__(parent)
+        self._engine = engine
+        self._contexts = LRUCache(CONTEXT_CACHE_SIZE)
+        self._comp_path = None
+
+        self._poll_timer = qt.QtCore.QTimer(self)
+        self._poll_timer.setInterval(POLL_INTERVAL)
+        self._poll_timer.timeout.connect(self._poll)
+
+        self._debounce_timer = qt.QtCore.QTimer(self)
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.setInterval(DEBOUNCE_INTERVAL)
+        self._debounce_timer.timeout.connect(self._switch_context)
+
+    def start(self):
+        """
+        Starts watching the active comp.
+        """
+        self._comp_path = self._current_comp_path()
+        self._poll_timer.start()
+
+    def stop(self):
+        """
+        Stops watching the active comp.
+        """
+        self._poll_timer.stop()
+        self._debounce_timer.stop()
+
+    def context_from_path(self, path):
+        """
+        Returns the context for the given comp path, or None if the path is
+        not part of the pipeline.
+        """
+        context = self._contexts.get(path, _MISSING)
+        if context is not _MISSING:
+            return context
+
+        try:
+            context = self._engine.sgtk.context_from_path(
+                path, previous_context=self._engine.context)
+        except tank.TankError as e:
+            self._engine.logger.debug(
+                "No context for '%s': %s", path, e)
+            context = None
+
+        # a context without a project means the path is outside of the
+        # project folders
+        if context is not None and context.project is None:
+            context = None
+
+        self._contexts.set(path, context)
+        return context
+
+    def _current_comp_path(self):
+        try:
+            comp = self._engine.fusion.GetCurrentComp()
+            if comp is None:
+                return None
+            return comp_path(comp) or None
+        except Exception:
+            # Fusion may be closing or busy
+            return None
+
+    def _poll(self):
+        path = self._current_comp_path()
+        if path != self._comp_path:
+            self._comp_path = path
+            # restart the countdown, only the comp the artist settles on
+            # switches the context
+            self._debounce_timer.start()
+
+    def _switch_context(self):
+        path = self._comp_path
+        self.comp_changed.emit(path or "")
+        if not path:
+            # untitled comp, keep the current context
+            return
+
+        context = self.context_from_path(path)
+        if context is None or context == self._engine.context:
+            return
+
+        self._engine.logger.debug(
+            "Active comp changed to '%s', switching context to %s.",
+            path, context)
+        tank.platform.change_context(context)
@@ -0,0 +1,128 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Frame range of a comp and of its Loaders and Savers.
+
+"""
+
+from .fusion_attrs import get_attrs
+
+
+# sets the comp ranges and moves the Loaders and Savers in a single script
+# run, as one undo step, and returns "done" once the changes are made
+_SET_FRAME_RANGE_SCRIPT = """
+comp:Lock()
+comp:StartUndo("Set Frame Range")
+local done = pcall(function()
+    comp:SetAttrs({
+        COMPN_GlobalStart = %(in_frame)d,
+        COMPN_GlobalEnd = %(out_frame)d,
+        COMPN_RenderStart = %(head_in_frame)d,
+        COMPN_RenderEnd = %(tail_out_frame)d,
+    })
+    if %(sync_tools)s then
+        local time = comp.CurrentTime
+        for _, loader in pairs(comp:GetToolList(false, "Loader")) do
+            local length = loader.GlobalOut[time] - loader.GlobalIn[time]
+            loader.GlobalIn[time] = %(head_in_frame)d
+            loader.GlobalOut[time] = %(head_in_frame)d + length
+        end
+        for _, saver in pairs(comp:GetToolList(false, "Saver")) do
+            saver:SetAttrs({
+                TOOLNT_EnabledRegion_Start = %(head_in_frame)d,
+                TOOLNT_EnabledRegion_End = %(tail_out_frame)d,
+            })
+        end
+    end
+end)
+comp:EndUndo(true)
+comp:Unlock()
+if done then
+    return "done"
+end
+return "failed"
+"""
+
+
+def get_frame_range(comp):
+    """
+    Returns the global frame range of the comp.
+
+    :param comp: Fusion comp.
+    :returns: Tuple (in frame, out frame).
+    """
+    frame_range = get_attrs(comp, "COMPN_GlobalStart", "COMPN_GlobalEnd")
+    return (int(frame_range["COMPN_GlobalStart"]),
+            int(frame_range["COMPN_GlobalEnd"]))
+
+
+def set_frame_range(comp, in_frame, out_frame, head_in_frame=None,
+                    tail_out_frame=None, sync_tools=False):
+    """
+    Sets the global and render ranges of the comp.
+
+    The playback range is set to the cut range and the render range to the
+    range including the handles. When sync_tools is set, the Loaders are
+    moved to start at the first frame of the render range, keeping their
+    length, and the Savers are limited to the render range. This retimes
+    the Loaders and Savers set up by hand, it is off by default.
+
+    All the changes are made by one script run inside Fusion, with the comp
+    locked and as a single undo step.
+
+    :param comp: Fusion comp.
+    :param in_frame: First frame of the cut.
+    :param out_frame: Last frame of the cut.
+    :param head_in_frame: First frame to render, defaults to in_frame.
+    :param tail_out_frame: Last frame to render, defaults to out_frame.
+    :param sync_tools: Whether the Loaders and Savers are updated too.
+    """
+    if head_in_frame is None:
+        head_in_frame = in_frame
+    if tail_out_frame is None:
+        tail_out_frame = out_frame
+
+    values = {
+        "in_frame": int(in_frame),
+        "out_frame": int(out_frame),
+        "head_in_frame": int(head_in_frame),
+        "tail_out_frame": int(tail_out_frame),
+        "sync_tools": "true" if sync_tools else "false",
+    }
+
+    if comp.Execute(_SET_FRAME_RANGE_SCRIPT % values) == "done":
+        return
+
+    # the script could not run or failed half way, having unlocked the
+    # comp, make the same changes from Python
+    comp.Lock()
+    comp.StartUndo("Set Frame Range")
+    try:
+        comp.SetAttrs({
+            "COMPN_GlobalStart": in_frame,
+            "COMPN_GlobalEnd": out_frame,
+            "COMPN_RenderStart": head_in_frame,
+            "COMPN_RenderEnd": tail_out_frame,
+        })
+        if sync_tools:
+            time = comp.CurrentTime
+            for loader in comp.GetToolList(False, "Loader").values():
+                length = loader.GlobalOut[time] - loader.GlobalIn[time]
+                loader.GlobalIn[time] = head_in_frame
+                loader.GlobalOut[time] = head_in_frame + length
+            for saver in comp.GetToolList(False, "Saver").values():
+                saver.SetAttrs({
+                    "TOOLNT_EnabledRegion_Start": head_in_frame,
+                    "TOOLNT_EnabledRegion_End": tail_out_frame,
+                })
+    finally:
+        comp.EndUndo(True)
+        comp.Unlock()
@@ -0,0 +1,280 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Background transfer of the frames rendered to a local scratch folder to
+their network location.
+
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from tank.util.filesystem import ensure_folder_exists
+
+
+# number of frames copied at the same time
+TRANSFER_WORKERS = 4
+
+# how many times a frame transfer is attempted before giving up
+MAX_ATTEMPTS = 3
+
+# pause before trying a failed transfer again, multiplied by the attempt
+RETRY_DELAY = 2.0
+
+# suffix of the network file while it is being copied
+_PARTIAL_SUFFIX = ".part"
+
+
+class _Transfer(object):
+    def __init__(self, source, destination, sequence):
+        self.source = source
+        self.destination = destination
+        self.sequence = sequence
+        self.attempts = 0
+
+
+class FrameTransferPool(object):
+    """
+    Pool of threads moving rendered frames to the network.
+
+    A frame is copied next to its destination under a temporary name, its
+    size checked against the local frame, then renamed, so a frame on the
+    network is always complete. The local frame is removed once moved.
+    Failed transfers are attempted again a few times.
+
+    Transfers are grouped by sequence, usually the network clip of a Saver,
+    so callers can tell when all the frames of a sequence are on the
+    network.
+    """
+
+    def __init__(self, workers=TRANSFER_WORKERS, logger=None,
+                 keep_sources=False, on_sequence_done=None):
+        """
+        :param workers: Number of frames copied at the same time.
+        :param logger: Logger receiving the failed transfers.
+        :param keep_sources: Copy the frames instead of moving them.
+        :param on_sequence_done: Callable called with a sequence once all
+                                 its frames are moved or failed to be, from
+                                 a transfer thread.
+        """
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._logger = logger
+        self._keep_sources = keep_sources
+        self._on_sequence_done = on_sequence_done
+        # sequence -> number of frames queued or being moved
+        self._pending = {}
+        # local frames queued or being moved
+        self._queued_sources = set()
+        self.failed = []
+
+        self._threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, source, destination, sequence=None):
+        """
+        Queues a frame to be moved.
+
+        :param source: Path of the local frame.
+        :param destination: Path of the frame on the network.
+        :param sequence: Sequence the frame belongs to, defaults to the
+                         destination.
+        :returns: False if the frame was already queued.
+        """
+        sequence = sequence or destination
+        with self._lock:
+            if source in self._queued_sources:
+                return False
+            self._queued_sources.add(source)
+            self._pending[sequence] = self._pending.get(sequence, 0) + 1
+        self._queue.put(_Transfer(source, destination, sequence))
+        return True
+
+    def submit_many(self, frames, sequence):
+        """
+        Queues the frames of a sequence at once, the sequence is not seen as
+        done before all of them are moved.
+
+        :param frames: List of (source, destination) paths.
+        :param sequence: Sequence the frames belong to.
+        :returns: Number of frames queued, the frames already queued being
+                  left out.
+        """
+        with self._lock:
+            frames = [
+                (source, destination) for (source, destination) in frames
+                if source not in self._queued_sources
+            ]
+            for (source, _) in frames:
+                self._queued_sources.add(source)
+            if frames:
+                self._pending[sequence] = \
+                    self._pending.get(sequence, 0) + len(frames)
+        for (source, destination) in frames:
+            self._queue.put(_Transfer(source, destination, sequence))
+        return len(frames)
+
+    def pending(self, sequence=None):
+        """
+        Returns the number of frames still to be moved, for a sequence or
+        for all of them.
+        """
+        with self._lock:
+            if sequence is None:
+                return sum(self._pending.values())
+            return self._pending.get(sequence, 0)
+
+    def is_done(self, sequence):
+        """
+        Whether all the frames queued for the sequence have been moved, or
+        failed to be.
+        """
+        return self.pending(sequence) == 0
+
+    def pop_failed(self, sequence):
+        """
+        Returns the transfers of the sequence that failed, forgetting them.
+        """
+        with self._lock:
+            failed = [
+                transfer for transfer in self.failed
+                if transfer.sequence == sequence
+            ]
+            self.failed = [
+                transfer for transfer in self.failed
+                if transfer.sequence != sequence
+            ]
+        return failed
+
+    def wait(self, sequence=None, timeout=None):
+        """
+        Waits until the frames of a sequence, or all the frames, are moved.
+
+        :returns: True if there is nothing left to move.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.pending(sequence):
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def _work(self):
+        while True:
+            transfer = self._queue.get()
+            try:
+                self._move(transfer)
+            except Exception as e:
+                if transfer.attempts < MAX_ATTEMPTS:
+                    self._log("Could not move '%s', trying again: %s",
+                              transfer.source, e)
+                    self._retry_later(transfer)
+                    continue
+                self._log("Could not move '%s' to '%s', giving up: %s",
+                          transfer.source, transfer.destination, e)
+                with self._lock:
+                    self.failed.append(transfer)
+            self._finish(transfer)
+
+    def _retry_later(self, transfer):
+        timer = threading.Timer(
+            RETRY_DELAY * transfer.attempts, self._queue.put, [transfer])
+        timer.daemon = True
+        timer.start()
+
+    def _finish(self, transfer):
+        with self._lock:
+            self._queued_sources.discard(transfer.source)
+            self._pending[transfer.sequence] -= 1
+            done = not self._pending[transfer.sequence]
+            if done:
+                del self._pending[transfer.sequence]
+        if done and self._on_sequence_done is not None:
+            try:
+                self._on_sequence_done(transfer.sequence)
+            except Exception as e:
+                self._log("Error once '%s' was transferred: %s",
+                          transfer.sequence, e)
+
+    def _move(self, transfer):
+        transfer.attempts += 1
+
+        ensure_folder_exists(os.path.dirname(transfer.destination))
+        partial = transfer.destination + _PARTIAL_SUFFIX
+        shutil.copyfile(transfer.source, partial)
+
+        size = os.path.getsize(transfer.source)
+        copied_size = os.path.getsize(partial)
+        if copied_size != size:
+            os.remove(partial)
+            raise IOError("%d bytes copied out of %d" % (copied_size, size))
+
+        # renaming over an existing file fails on Windows
+        if os.path.exists(transfer.destination):
+            os.remove(transfer.destination)
+        os.rename(partial, transfer.destination)
+        if not self._keep_sources:
+            os.remove(transfer.source)
+
+    def _log(self, msg, *args):
+        if self._logger is not None:
+            self._logger.warning(msg, *args)
+
+
+def _clip_regex(clip):
+    # Fusion inserts the frame number before the extension of the clip
+    (base, ext) = os.path.splitext(os.path.basename(clip))
+    return re.compile(r"^%s(\d*)%s$" % (re.escape(base), re.escape(ext)))
+
+
+def transfer_rendered_frames(pool, local_clip, network_clip, frames=None):
+    """
+    Queues the frames rendered so far for a Saver rendering locally.
+
+    :param pool: :class:`FrameTransferPool`
+    :param local_clip: Clip of the Saver, in the scratch folder.
+    :param network_clip: Clip the frames are moved to.
+    :param frames: Frame numbers to queue, None to queue all the frames
+                   found. Frames still being rendered must be left out.
+    :returns: Number of frames queued.
+    """
+    folder = os.path.dirname(local_clip)
+    if not os.path.isdir(folder):
+        return 0
+
+    regex = _clip_regex(local_clip)
+    (network_base, network_ext) = os.path.splitext(network_clip)
+
+    queued = 0
+    for file_name in os.listdir(folder):
+        match = regex.match(file_name)
+        if match is None:
+            continue
+        if frames is not None and (
+                not match.group(1) or int(match.group(1)) not in frames):
+            continue
+        destination = "%s%s%s" % (network_base, match.group(1), network_ext)
+        if pool.submit(os.path.join(folder, file_name), destination,
+                       network_clip):
+            queued += 1
+    return queued
@@ -0,0 +1,224 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Checks of the frames of rendered sequences, finding the empty and truncated
+frames left by crashed renders.
+
+"""
+
+import mmap
+import os
+import struct
+
+from multiprocessing.pool import ThreadPool
+
+
+# number of frames checked at the same time
+VERIFY_WORKERS = 16
+
+# frames smaller than this fraction of the median frame size are reported
+SIZE_OUTLIER_RATIO = 0.25
+
+_EXR_MAGIC = b"\x76\x2f\x31\x01"
+_EXR_TILED = 0x200
+_EXR_MULTIPART = 0x1000
+_EXR_LONG_NAMES = 0x400
+
+# scan lines per chunk of each EXR compression
+_EXR_LINES_PER_CHUNK = {
+    0: 1,     # none
+    1: 1,     # rle
+    2: 1,     # zips
+    3: 16,    # zip
+    4: 32,    # piz
+    5: 16,    # pxr24
+    6: 32,    # b44
+    7: 32,    # b44a
+    8: 32,    # dwaa
+    9: 256,   # dwab
+}
+
+_DPX_MAGICS = {b"SDPX": ">", b"XPDS": "<"}
+
+_PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+_PNG_END = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+
+class FrameProblem(object):
+    """
+    Problem found with a frame.
+    """
+
+    def __init__(self, path, message, is_error=True):
+        self.path = path
+        self.message = message
+        # False for the frames that only look suspicious
+        self.is_error = is_error
+
+    def __str__(self):
+        return "%s: %s" % (os.path.basename(self.path), self.message)
+
+
+def _read_c_string(data, offset, end):
+    stop = data.find(b"\0", offset, end)
+    if stop < 0:
+        raise ValueError("unterminated header")
+    return (data[offset:stop], stop + 1)
+
+
+def _check_exr(data, size):
+    if data[:4] != _EXR_MAGIC:
+        return "not an EXR file"
+    (flags,) = struct.unpack("<I", data[4:8])
+    # the header attributes, up to the null byte ending them
+    offset = 8
+    data_window = None
+    compression = 0
+    try:
+        while True:
+            (name, offset) = _read_c_string(data, offset, size)
+            if not name:
+                break
+            (_, offset) = _read_c_string(data, offset, size)
+            (length,) = struct.unpack("<i", data[offset:offset + 4])
+            offset += 4
+            value = data[offset:offset + length]
+            offset += length
+            if offset > size:
+                raise ValueError("truncated header")
+            if name == b"dataWindow":
+                data_window = struct.unpack("<iiii", value)
+            elif name == b"compression":
+                compression = ord(value[:1])
+    except (ValueError, struct.error):
+        return "truncated header"
+
+    if flags & (_EXR_TILED | _EXR_MULTIPART) or data_window is None:
+        # only scan line images have a chunk count known from the header
+        return None
+    lines = _EXR_LINES_PER_CHUNK.get(compression)
+    if lines is None:
+        return None
+    height = data_window[3] - data_window[1] + 1
+    chunk_count = (height + lines - 1) // lines
+
+    # the offsets of the chunks are written last, a crashed render leaves
+    # them null
+    table_end = offset + 8 * chunk_count
+    if table_end > size:
+        return "truncated chunk table"
+    offsets = struct.unpack("<%dQ" % chunk_count, data[offset:table_end])
+    if not offsets or min(offsets) == 0:
+        return "incomplete chunk table"
+    last_chunk = max(offsets)
+    if last_chunk + 8 > size:
+        return "truncated, chunks past the end of the file"
+    (_, chunk_size) = struct.unpack("<ii", data[last_chunk:last_chunk + 8])
+    if last_chunk + 8 + chunk_size > size:
+        return "truncated, last chunk incomplete"
+    return None
+
+
+def _check_dpx(data, size):
+    order = _DPX_MAGICS.get(data[:4])
+    if order is None:
+        return "not a DPX file"
+    if size < 20:
+        return "truncated header"
+    (image_offset,) = struct.unpack(order + "I", data[4:8])
+    (file_size,) = struct.unpack(order + "I", data[16:20])
+    if file_size and size < file_size:
+        return "truncated, %d of %d bytes" % (size, file_size)
+    if image_offset >= size:
+        return "truncated, no image data"
+    return None
+
+
+def _check_png(data, size):
+    if data[:8] != _PNG_MAGIC:
+        return "not a PNG file"
+    if data[size - len(_PNG_END):size] != _PNG_END:
+        return "truncated, no end chunk"
+    return None
+
+
+_CHECKS = {
+    ".exr": _check_exr,
+    ".dpx": _check_dpx,
+    ".png": _check_png,
+}
+
+
+def verify_frame(path):
+    """
+    Checks the header and the end of a frame, read through a memory map so
+    only the pages needed are read.
+
+    :param path: Path of the frame.
+    :returns: Tuple (size, error message or None).
+    """
+    check = _CHECKS.get(os.path.splitext(path)[1].lower())
+    try:
+        with open(path, "rb") as frame_file:
+            size = os.fstat(frame_file.fileno()).st_size
+            if size == 0:
+                return (0, "empty file")
+            if check is None:
+                return (size, None)
+            data = mmap.mmap(
+                frame_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return (size, check(data, size))
+            finally:
+                data.close()
+    except (IOError, OSError, ValueError) as e:
+        return (0, "could not be read: %s" % e)
+
+
+def verify_frames(paths, workers=VERIFY_WORKERS,
+                  outlier_ratio=SIZE_OUTLIER_RATIO):
+    """
+    Checks every frame of a sequence in a pool of threads.
+
+    Frames that are empty, cannot be read or have a broken header or end are
+    errors. Frames much smaller than the others are reported as suspicious,
+    as a black or empty frame compresses to a small file too.
+
+    :param paths: Paths of the frames.
+    :param workers: Number of frames checked at the same time.
+    :param outlier_ratio: Fraction of the median frame size under which a
+                          frame is suspicious, None to not compare the sizes.
+    :returns: List of :class:`FrameProblem`, in frame order.
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+
+    pool = ThreadPool(min(workers, len(paths)))
+    try:
+        results = pool.map(verify_frame, paths, chunksize=8)
+    finally:
+        pool.close()
+        pool.join()
+
+    problems = []
+    sizes = sorted(size for (size, error) in results if error is None)
+    threshold = None
+    if outlier_ratio is not None and len(sizes) > 2:
+        threshold = sizes[len(sizes) // 2] * outlier_ratio
+    for (path, (size, error)) in zip(paths, results):
+        if error is not None:
+            problems.append(FrameProblem(path, error))
+        elif threshold is not None and size < threshold:
+            problems.append(FrameProblem(
+                path, "%d bytes, much smaller than the other frames" % size,
+                is_error=False))
+    return problems
@@ -0,0 +1,126 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Targeted reads of comp attributes and preferences.
+
+Calling GetAttrs() or GetPrefs() without argument sends the whole attribute
+or preference table across the scripting bridge. The functions below only
+fetch the named entries, many entries being read by a single Lua script run
+inside Fusion, which returns them.
+
+"""
+
+# fewer entries are read one by one, compiling and running the script costs
+# more than a couple of direct reads
+QUERY_SCRIPT_MIN_NAMES = 3
+
+_QUERY_SCRIPT = """
+local values = {}
+for _, name in ipairs({%s}) do
+    values[name] = comp:%s(name)
+end
+return values
+"""
+
+
+def _lua_string(value):
+    return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _query(comp, method, names):
+    """
+    Reads the named entries with the given comp method, in one script run
+    when there are many.
+    """
+    if len(names) >= QUERY_SCRIPT_MIN_NAMES:
+        script = _QUERY_SCRIPT % (
+            ", ".join(_lua_string(name) for name in names),
+            method)
+        values = comp.Execute(script)
+        if values is not None:
+            return dict((name, values.get(name)) for name in names)
+
+    # few entries, or the script could not run
+    getter = getattr(comp, method)
+    return dict((name, getter(name)) for name in names)
+
+
+def get_attrs(comp, *names):
+    """
+    Returns the named attributes of the comp.
+
+    :param comp: Fusion comp.
+    :param names: Attribute names, like 'COMPN_GlobalStart'.
+    :returns: Dictionary of attribute name to value, None for the
+              attributes the comp does not have.
+    """
+    return _query(comp, "GetAttrs", names)
+
+
+def get_attr(obj, name, default=None):
+    """
+    Returns a single attribute of a comp or a tool.
+
+    :param obj: Fusion comp or tool.
+    :param name: Attribute name, like 'TOOLS_Name'.
+    :param default: Value returned if the attribute is not set.
+    """
+    value = obj.GetAttrs(name)
+    if value is None:
+        return default
+    return value
+
+
+def get_prefs(comp, *paths):
+    """
+    Returns the named preferences of the comp.
+
+    :param comp: Fusion comp.
+    :param paths: Dotted preference paths, like 'Comp.FrameFormat.Width'.
+    :returns: Dictionary of preference path to value, None for the unknown
+              preferences.
+    """
+    return _query(comp, "GetPrefs", paths)
+
+
+def get_pref(comp, path, default=None):
+    """
+    Returns a single preference of the comp.
+
+    :param comp: Fusion comp.
+    :param path: Dotted preference path, like 'Comp.FrameFormat.Width'.
+    :param default: Value returned if the preference is not set.
+    """
+    value = comp.GetPrefs(path)
+    if value is None:
+        return default
+    return value
+
+
+def comp_path(comp):
+    """
+    Returns the file path of the comp, an empty string for an untitled
+    comp.
+    """
+    path = get_attr(comp, "COMPS_FileName", "")
+    if isinstance(path, unicode):
+        path = path.encode("utf-8")
+    return path
+
+
+def tool_clip(tool):
+    """
+    Returns the clip path of a Loader or Saver, None if it has no clip.
+    """
+    clip = get_attr(tool, "TOOLST_Clip_Name")
+    if not clip:
+        return None
+    return clip.values()[0]
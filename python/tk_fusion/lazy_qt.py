@@ -0,0 +1,72 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Qt base classes given to the widgets and watchers of the package on first
+use.
+
+The engine sets up Qt after init_engine, and the package may be imported
+before that or without UI, on render nodes and by the command line tools.
+The classes needing Qt are plain classes until they are first created,
+when a subclass with their Qt base class and signals is defined.
+
+"""
+
+from tank.platform import qt
+
+
+# class -> its subclass with the Qt base class
+_qt_subclasses = {}
+
+
+class LazyQtClass(object):
+    """
+    Base class of the classes whose Qt base class is only resolved when they
+    are first created.
+
+    Subclasses name their Qt base class, like ``"QtCore.QObject"``, and
+    their signals as a dictionary of signal name to the tuple of its
+    argument types.
+    """
+
+    qt_base_class = "QtCore.QObject"
+    qt_signals = {}
+    _lazy_qt_base = None
+
+    def __new__(cls, *args, **kwargs):
+        qt_cls = _qt_subclass(cls)
+        # the Qt class makes the instance, the arguments go to __init__
+        return super(LazyQtClass, qt_cls).__new__(qt_cls)
+
+
+def _qt_subclass(cls):
+    if getattr(cls, "_lazy_qt_base", None) is not None:
+        # already the subclass with the Qt base class
+        return cls
+    qt_cls = _qt_subclasses.get(cls)
+    if qt_cls is not None:
+        return qt_cls
+
+    (module_name, class_name) = cls.qt_base_class.split(".")
+    qt_module = getattr(qt, module_name, None)
+    if qt_module is None or qt.QtCore is None:
+        raise RuntimeError(
+            "Qt is not set up, %s cannot be created without UI." %
+            cls.__name__)
+
+    qt_base = getattr(qt_module, class_name)
+    attributes = dict(
+        (name, qt.QtCore.Signal(*arg_types))
+        for (name, arg_types) in cls.qt_signals.items())
+    attributes["_lazy_qt_base"] = qt_base
+    attributes["__module__"] = cls.__module__
+    qt_cls = _qt_subclasses[cls] = type(
+        cls.__name__, (cls, qt_base), attributes)
+    return qt_cls
@@ -0,0 +1,427 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Local copies of the media read by the Loaders, kept in a cache folder of
+limited size.
+
+"""
+
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from .frame_transfer import FrameTransferPool
+from .fusion_attrs import get_attr, tool_clip
+from .savers import local_output_path
+from .sequence_manifest import find_sequence, sequence_key
+
+
+# number of files copied at the same time
+CACHE_WORKERS = 2
+
+# file of the cache folder listing the media cached
+INDEX_FILE_NAME = "media_cache_index.json"
+
+# comp data key of the Loaders reading a cached copy, with their network clip
+_CACHED_MEDIA_DATA = "sgtk_cached_media"
+
+
+def sequence_files(clip):
+    """
+    Returns the paths of the files of the sequence of a Loader clip, the
+    clip itself for a movie or a still.
+    """
+    if sequence_key(clip) is None:
+        return [clip] if os.path.isfile(clip) else []
+    sequence = find_sequence(clip)
+    return sequence.files() if sequence is not None else []
+
+
+class _CacheEntry(object):
+    def __init__(self, clip, local_clip, files=None, size=0, last_used=0.0):
+        self.clip = clip
+        self.local_clip = local_clip
+        # (network file, local file) of the sequence
+        self.files = files or []
+        self.size = size
+        self.last_used = last_used
+        self.complete = False
+
+
+class MediaCache(object):
+    """
+    Copies the media of the Loaders to a local folder in the background.
+
+    The network folders are recreated under the cache folder. Each file is
+    copied under a temporary name and its size checked before it is renamed,
+    and a sequence is only complete once every one of its files is. When the
+    cache would grow past its budget, the least recently used sequences are
+    removed, except the ones used since the cache was created, which open
+    comps may still read. Sequences which would only fit by removing those
+    are not cached, the cache never grows past its budget.
+
+    The complete sequences are listed in an index file of the cache folder,
+    so they are found again by the next sessions.
+    """
+
+    def __init__(self, root, budget, workers=CACHE_WORKERS, logger=None,
+                 on_cached=None):
+        """
+        :param root: Cache folder.
+        :param budget: Maximum size of the cache, in bytes.
+        :param workers: Number of files copied at the same time.
+        :param logger: Logger receiving the progress messages.
+        :param on_cached: Callable called with the network clip and the
+                          local clip of each sequence once copied, from a
+                          copy thread.
+        """
+        self.root = root
+        self.budget = budget
+        self._logger = logger
+        self._on_cached = on_cached
+        self._lock = threading.RLock()
+        # network clip -> entry, least recently used first
+        self._entries = OrderedDict()
+        # network clips used by this session, never evicted
+        self._in_use = set()
+        # network clips too large to be cached
+        self._too_large = set()
+        self._pool = FrameTransferPool(
+            workers, logger, keep_sources=True,
+            on_sequence_done=self._sequence_done)
+        self._load_index()
+
+    @property
+    def size(self):
+        """
+        Size of the sequences cached or being copied, in bytes.
+        """
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def local_clip(self, clip):
+        """
+        Returns the path of the local copy of a network clip.
+        """
+        return local_output_path(self.root, clip)
+
+    def get(self, clip):
+        """
+        Returns the local copy of a network clip if it is complete, None
+        otherwise, marking it as used.
+        """
+        with self._lock:
+            entry = self._entries.get(clip)
+            if entry is None or not entry.complete:
+                return None
+            if not os.path.exists(entry.local_clip):
+                # removed behind our back
+                del self._entries[clip]
+                return None
+            self._touch(entry)
+            return entry.local_clip
+
+    def request(self, clip):
+        """
+        Returns the local copy of a network clip if it is complete, or
+        starts copying it in the background and returns None.
+        """
+        local_clip = self.get(clip)
+        if local_clip is not None:
+            return local_clip
+
+        with self._lock:
+            if clip in self._entries or clip in self._too_large:
+                # being copied, or never cached
+                return None
+            entry = self._entries[clip] = _CacheEntry(
+                clip, self.local_clip(clip), last_used=time.time())
+            self._in_use.add(clip)
+
+        # listing the sequence on the network may take a while
+        thread = threading.Thread(target=self._queue, args=(entry,))
+        thread.daemon = True
+        thread.start()
+        return None
+
+    def _queue(self, entry):
+        files = sequence_files(entry.clip)
+        try:
+            size = sum(os.path.getsize(path) for path in files)
+        except OSError as e:
+            files = []
+            self._log("Could not read '%s': %s", entry.clip, e)
+
+        if not files:
+            self._forget(entry)
+            return
+        if size > self.budget:
+            self._log("'%s' is larger than the media cache, it is not "
+                      "cached.", entry.clip)
+            self._forget(entry)
+            with self._lock:
+                self._too_large.add(entry.clip)
+            return
+
+        with self._lock:
+            entry.size = size
+            entry.files = [
+                (path, self.local_clip(path)) for path in files]
+            self._evict(self.budget)
+            is_full = self.size > self.budget
+        if is_full:
+            # tried again the next time it is requested
+            self._log("The media cache is full of media in use, '%s' is not "
+                      "cached.", entry.clip)
+            self._forget(entry)
+            return
+
+        self._log("Caching '%s', %d files, %.1f MB.", entry.clip,
+                  len(files), size / 1048576.0)
+        self._pool.submit_many(entry.files, entry.clip)
+
+    def _sequence_done(self, clip):
+        with self._lock:
+            entry = self._entries.get(clip)
+        if entry is None:
+            return
+
+        failed = self._pool.pop_failed(clip)
+        if failed or not self._verify(entry):
+            self._log("Could not cache '%s'.", clip)
+            self._remove(entry)
+            return
+
+        with self._lock:
+            entry.complete = True
+            self._save_index()
+        self._log("'%s' is cached in '%s'.", clip, entry.local_clip)
+        if self._on_cached is not None:
+            self._on_cached(clip, entry.local_clip)
+
+    @staticmethod
+    def _verify(entry):
+        # every file of the sequence is there, with the size of the original
+        for (path, local_path) in entry.files:
+            try:
+                if os.path.getsize(local_path) != os.path.getsize(path):
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _evict(self, budget):
+        # called with the lock held, the entries are least recently used
+        # first
+        size = self.size
+        for entry in list(self._entries.values()):
+            if size <= budget:
+                break
+            if not entry.complete or entry.clip in self._in_use:
+                continue
+            size -= entry.size
+            self._remove(entry)
+
+    def _remove(self, entry):
+        with self._lock:
+            self._forget(entry)
+            for (_, local_path) in entry.files:
+                try:
+                    os.remove(local_path)
+                except OSError:
+                    pass
+            self._save_index()
+
+    def _forget(self, entry):
+        with self._lock:
+            if self._entries.get(entry.clip) is entry:
+                del self._entries[entry.clip]
+            self._in_use.discard(entry.clip)
+
+    def _touch(self, entry):
+        entry.last_used = time.time()
+        self._in_use.add(entry.clip)
+        # move it to the most recently used end
+        del self._entries[entry.clip]
+        self._entries[entry.clip] = entry
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.root, INDEX_FILE_NAME)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, "r") as index_file:
+                index = json.load(index_file)
+        except (IOError, ValueError):
+            return
+
+        records = sorted(
+            index.items(), key=lambda item: item[1].get("last_used", 0))
+        for (clip, record) in records:
+            entry = _CacheEntry(
+                clip, record["local_clip"],
+                [tuple(files) for files in record["files"]],
+                record["size"], record["last_used"])
+            entry.complete = True
+            if os.path.exists(entry.local_clip):
+                self._entries[clip] = entry
+
+    def _save_index(self):
+        # called with the lock held
+        index = dict(
+            (entry.clip, {
+                "local_clip": entry.local_clip,
+                "files": entry.files,
+                "size": entry.size,
+                "last_used": entry.last_used,
+            })
+            for entry in self._entries.values() if entry.complete
+        )
+        temp_path = self._index_path + ".part"
+        try:
+            if not os.path.isdir(self.root):
+                os.makedirs(self.root)
+            with open(temp_path, "w") as index_file:
+                json.dump(index, index_file)
+            if os.path.exists(self._index_path):
+                os.remove(self._index_path)
+            os.rename(temp_path, self._index_path)
+        except (IOError, OSError) as e:
+            self._log("Could not save the media cache index: %s", e)
+
+    def _log(self, msg, *args):
+        if self._logger is not None:
+            self._logger.debug(msg, *args)
+
+
+def read_cached_media(comp):
+    """
+    Returns the Loaders of the comp reading a cached copy.
+
+    :param comp: Fusion comp.
+    :returns: Dictionary of Loader name to its network clip.
+    """
+    return dict(comp.GetData(_CACHED_MEDIA_DATA) or {})
+
+
+def read_loader_clips(comp):
+    """
+    Returns the clips of the Loaders of the comp, the network clip for the
+    Loaders reading a cached copy.
+
+    :param comp: Fusion comp.
+    :returns: Dictionary of Loader name to clip.
+    """
+    clips = {}
+    for tool in comp.GetToolList(False, "Loader").values():
+        clip = tool_clip(tool)
+        if clip:
+            clips[get_attr(tool, "TOOLS_Name")] = clip
+    clips.update(read_cached_media(comp))
+    return clips
+
+
+def forget_cached_media(comp, loader_names):
+    """
+    Forgets that Loaders read a cached copy, once pointed to another clip.
+
+    :param comp: Fusion comp.
+    :param loader_names: Names of the Loaders.
+    """
+    cached_media = read_cached_media(comp)
+    if any(name in cached_media for name in loader_names):
+        for name in loader_names:
+            cached_media.pop(name, None)
+        comp.SetData(_CACHED_MEDIA_DATA, cached_media or None)
+
+
+def switch_loader_clips(comp, clips, undo_name="Switch Cached Media",
+                        keep_modified=False):
+    """
+    Points Loaders to other clips, keeping their frame range and trims, in
+    a single undo step.
+
+    :param comp: Fusion comp.
+    :param clips: Dictionary of Loader name to a tuple (new clip, network
+                  clip), the network clip being None when the Loader goes
+                  back to the network.
+    :param undo_name: Name of the undo step, None to not add one.
+    :param keep_modified: Whether a comp without changes is left without
+                          changes, for the switches the artist did not ask
+                          for.
+    """
+    if not clips:
+        return
+    cached_media = read_cached_media(comp)
+    modified = get_attr(comp, "COMPB_Modified", True)
+
+    comp.Lock()
+    if undo_name is not None:
+        comp.StartUndo(undo_name)
+    try:
+        for (name, (clip, network_clip)) in clips.items():
+            loader = comp.FindTool(name)
+            if loader is None:
+                continue
+            time_now = comp.CurrentTime
+            global_in = loader.GlobalIn[time_now]
+            global_out = loader.GlobalOut[time_now]
+            trim_in = loader.ClipTimeStart[time_now]
+            trim_out = loader.ClipTimeEnd[time_now]
+            loader.Clip = clip
+            loader.GlobalIn = global_in
+            loader.GlobalOut = global_out
+            loader.ClipTimeStart = trim_in
+            loader.ClipTimeEnd = trim_out
+            if network_clip is None:
+                cached_media.pop(name, None)
+            else:
+                cached_media[name] = network_clip
+        comp.SetData(_CACHED_MEDIA_DATA, cached_media or None)
+    finally:
+        if undo_name is not None:
+            comp.EndUndo(True)
+        comp.Unlock()
+        if keep_modified and not modified:
+            comp.SetAttrs({"COMPB_Modified": False})
+
+
+def save_comp(comp, path):
+    """
+    Saves the comp with the Loaders reading a cached copy pointed back to
+    the network, so the comps saved and published never read the cache of
+    this machine. The Loaders read the cached copy again once saved, the
+    comp staying unmodified.
+
+    Fusion's own Save does not go through here, a comp saved with it keeps
+    the clips of the local cache of this machine.
+
+    :param comp: Fusion comp.
+    :param path: Path the comp is saved to.
+    """
+    cached_clips = {}
+    for (name, network_clip) in read_cached_media(comp).items():
+        loader = comp.FindTool(name)
+        if loader is not None:
+            cached_clips[name] = (tool_clip(loader), network_clip)
+    switch_loader_clips(comp, dict(
+        (name, (network_clip, None))
+        for (name, (_, network_clip)) in cached_clips.items()),
+        undo_name=None)
+    try:
+        comp.Save(path)
+    finally:
+        switch_loader_clips(comp, cached_clips, undo_name=None,
+                            keep_modified=True)
@@ -9,7 +9,7 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 """
-Menu handling for Natron
+Menu handling for Fusion
 
 """
 
@@ -18,16 +18,43 @@ import sys
 import os
 import unicodedata
 
-from tank.platform.qt import QtGui, QtCore
+from tank.platform import qt
 
 
 __author__ = "Diego Garcia Huerta"
 __email__ = "diegogh2000@gmail.com"
 
 
+class _MenuEntry(object):
+    """
+    Description of a single item of the menu tree. The key identifies the
+    item across rebuilds so its QAction or QMenu can be reused.
+    """
+
+    MENU = "menu"
+    ACTION = "action"
+    SEPARATOR = "separator"
+
+    def __init__(self, kind, key, title=None, command_name=None,
+                 callback=None, tooltip=None):
+        self.kind = kind
+        self.key = key
+        self.title = title
+        self.command_name = command_name
+        self.callback = callback
+        self.tooltip = tooltip
+        self.children = []
+
+
 class MenuGenerator(object):
     """
-    Menu generation functionality for Maya
+    Menu generation functionality for Fusion
+
+    The menu is not rebuilt from scratch on every context change, instead the
+    new set of commands is compared with the existing menu tree and only the
+    actions that changed are created or removed. Command enable callbacks are
+    evaluated when a menu is about to be shown, and cached until the context
+    changes.
     """
 
     def __init__(self, engine, menu_name):
@@ -37,187 +64,291 @@ class MenuGenerator(object):
         self._handle = None
         self._ui_cache = []
 
-    # @property
-    # def menu_handle(self):
-    #     self._handle = get_or_create_shotgun_menu(self._menu_name)
-    #     return self._handle
-
-    # def create_menu(self, disabled=False):
-    #     """
-    #     Render the entire Shotgun menu.
-    #     In order to have commands enable/disable themselves based on the
-    #     enable_callback, re-create the menu items every time.
-    #     """
-    #     self.menu_handle.clear()
-
-    #     if disabled:
-    #         self.menu_handle.addMenu("Sgtk is disabled.")
-    #         return
-
-    #     # now add the context item on top of the main menu
-    #     self._context_menu = self._add_context_menu()
-
-    #     # add menu divider
-    #     self._add_divider(self.menu_handle)
-
-    #     # now enumerate all items and create menu objects for them
-    #     menu_items = []
-    #     for (cmd_name, cmd_details) in self._engine.commands.items():
-    #         self._engine.log_debug("engine command: %s : %s" %
-    #                                (cmd_name, cmd_details))
-    #         menu_items.append(AppCommand(cmd_name, self, cmd_details))
-
-    #     # sort list of commands in name order
-    #     menu_items.sort(key=lambda x: x.name)
-
-    #     # now add favourites
-    #     for fav in self._engine.get_setting("menu_favourites"):
-    #         app_instance_name = fav["app_instance"]
-    #         menu_name = fav["name"]
-
-    #         # scan through all menu items
-    #         for cmd in menu_items:
-    #             if (cmd.get_app_instance_name() == app_instance_name and
-    #                     cmd.name == menu_name):
-    #                 # found our match!
-    #                 cmd.add_command_to_menu(self.menu_handle)
-    #                 # mark as a favourite item
-    #                 cmd.favourite = True
-
-    #     # add menu divider
-    #     self._add_divider(self.menu_handle)
-
-    #     # now go through all of the menu items.
-    #     # separate them out into various sections
-    #     commands_by_app = {}
-
-    #     for cmd in menu_items:
-    #         if cmd.get_type() == "context_menu":
-    #             # context menu!
-    #             cmd.add_command_to_menu(self._context_menu)
-
-    #         else:
-    #             # normal menu
-    #             app_name = cmd.get_app_name()
-    #             if app_name is None:
-    #                 # un-parented app
-    #                 app_name = "Other Items"
-    #             if not app_name in commands_by_app:
-    #                 commands_by_app[app_name] = []
-    #             commands_by_app[app_name].append(cmd)
-
-    #     # now add all apps to main menu
-    #     self._add_app_menu(commands_by_app)
-
-    # def _add_divider(self, parent_menu):
-    #     divider = QtGui.QAction(parent_menu)
-    #     divider.setSeparator(True)
-    #     parent_menu.addAction(divider)
-    #     return divider
-
-    # def _add_sub_menu(self, menu_name, parent_menu):
-    #     sub_menu = QtGui.QMenu(title=menu_name, parent=parent_menu)
-    #     parent_menu.addMenu(sub_menu)
-    #     return sub_menu
-
-    # def _add_menu_item(self, name, parent_menu, callback, properties=None):
-    #     action = QtGui.QAction(name, parent_menu)
-    #     parent_menu.addAction(action)
-    #     action.triggered.connect(callback)
-
-    #     if properties:
-    #         if "tooltip" in properties:
-    #             action.setTooltip(properties["tooltip"])
-    #             action.setStatustip(properties["tooltip"])
-    #         if "enable_callback" in properties:
-    #             action.setEnabled(properties["enable_callback"]())
-
-    #     return action
-
-    # def _add_context_menu(self):
-    #     """
-    #     Adds a context menu which displays the current context
-    #     """
-
-    #     ctx = self._engine.context
-    #     ctx_name = str(ctx)
-
-    #     # create the menu object
-    #     # the label expects a unicode object so we cast it to support when the
-    #     # context may contain info with non-ascii characters
-
-    #     ctx_menu = self._add_sub_menu(ctx_name, self.menu_handle)
-
-    #     self._add_menu_item("Jump to Shotgun", ctx_menu, self._jump_to_sg)
-
-    #     # Add the menu item only when there are some file system locations.
-    #     if ctx.filesystem_locations:
-    #         self._add_menu_item("Jump to File System",
-    #                             ctx_menu, self._jump_to_fs)
-
-    #     # divider (apps may register entries below this divider)
-    #     self._add_divider(ctx_menu)
-
-    #     return ctx_menu
-
-    # def _jump_to_sg(self):
-    #     """
-    #     Jump to shotgun, launch web browser
-    #     """
-    #     url = self._engine.context.shotgun_url
-    #     QtGui.QDesktopServices.openUrl(QtCore.QUrl(url))
-
-    # def _jump_to_fs(self):
-    #     """
-    #     Jump from context to FS
-    #     """
-    #     # launch one window for each location on disk
-    #     paths = self._engine.context.filesystem_locations
-    #     for disk_location in paths:
-
-    #         # get the setting
-    #         system = sys.platform
-
-    #         # run the app
-    #         if system == "linux2":
-    #             cmd = 'xdg-open "%s"' % disk_location
-    #         elif system == "darwin":
-    #             cmd = 'open "%s"' % disk_location
-    #         elif system == "win32":
-    #             cmd = 'cmd.exe /C start "Folder" "%s"' % disk_location
-    #         else:
-    #             raise Exception("Platform '%s' is not supported." % system)
-
-    #         exit_code = os.system(cmd)
-    #         if exit_code != 0:
-    #             self._engine.logger.error("Failed to launch '%s'!", cmd)
-
-    # def _add_app_menu(self, commands_by_app):
-    #     """
-    #     Add all apps to the main menu, process them one by one.
-    #     """
-    #     for app_name in sorted(commands_by_app.keys()):
-    #         if len(commands_by_app[app_name]) > 1:
-    #             # more than one menu entry fort his app
-    #             # make a sub menu and put all items in the sub menu
-    #             app_menu = self._add_sub_menu(app_name, self.menu_handle)
-
-    #             # get the list of menu cmds for this app
-    #             cmds = commands_by_app[app_name]
-    #             # make sure it is in alphabetical order
-    #             cmds.sort(key=lambda x: x.name)
-
-    #             for cmd in cmds:
-    #                 cmd.add_command_to_menu(app_menu)
-    #         else:
-    #             # this app only has a single entry.
-    #             # display that on the menu
-    #             # todo: Should this be labelled with the name of the app
-    #             # or the name of the menu item? Not sure.
-    #             cmd_obj = commands_by_app[app_name][0]
-    #             if not cmd_obj.favourite:
-    #                 # skip favourites since they are already on the menu
-    #                 cmd_obj.add_command_to_menu(self.menu_handle)
+        self._actions = {}
+        self._sub_menus = {}
+        self._menu_commands = {}
+        self._context = None
+        self._enabled_cache = {}
+
+    @property
+    def menu_handle(self):
+        if self._handle is None:
+            self._handle = qt.QtGui.QMenu(self._menu_name)
+            self._handle.aboutToShow.connect(
+                lambda: self._update_enabled_state(None))
+        return self._handle
+
+    def create_menu(self, disabled=False):
+        """
+        Render the entire Shotgun menu, or bring the existing one up to date
+        with the current context and commands.
+        """
+        context = self._engine.context
+        if context != self._context:
+            # enable callback results are only valid for a given context
+            self._context = context
+            self._enabled_cache = {}
+
+        if disabled:
+            entries = [_MenuEntry(_MenuEntry.ACTION, ("disabled",),
+                                  "Sgtk is disabled.")]
+        else:
+            entries = self._build_entries()
+
+        seen = set()
+        self._menu_commands = {}
+        self._sync_menu(None, self.menu_handle, entries, seen)
+
+        # discard anything that is not part of the menu anymore
+        for key in set(self._actions) - seen:
+            self._actions.pop(key).deleteLater()
+        for key in set(self._sub_menus) - seen:
+            self._sub_menus.pop(key).deleteLater()
+
+    def _build_entries(self):
+        """
+        Describes the menu tree for the current context and commands.
+
+        :returns: List of :class:`_MenuEntry` for the top level menu.
+        """
+        entries = []
+
+        # now add the context item on top of the main menu
+        context_entry = self._context_entry()
+        entries.append(context_entry)
+
+        # add menu divider
+        entries.append(_MenuEntry(_MenuEntry.SEPARATOR, ("separator", 0)))
+
+        # now enumerate all items and create menu objects for them
+        menu_items = []
+        for command in self._engine.command_registry.commands:
+            menu_items.append(AppCommand(command.name, self, {
+                "properties": command.properties,
+                "callback": command.callback,
+            }))
+
+        # sort list of commands in name order
+        menu_items.sort(key=lambda x: x.name)
+
+        # now add favourites
+        favourites = set()
+        for fav in self._engine.get_setting("menu_favourites", []):
+            favourites.add((fav["app_instance"], fav["name"]))
+
+        for cmd in menu_items:
+            if (cmd.get_app_instance_name(), cmd.name) in favourites:
+                # found our match!
+                cmd.add_command_to_entries(entries, ("favourite",))
+                # mark as a favourite item
+                cmd.favourite = True
+
+        # add menu divider
+        entries.append(_MenuEntry(_MenuEntry.SEPARATOR, ("separator", 1)))
+
+        # now go through all of the menu items.
+        # separate them out into various sections
+        commands_by_app = {}
+
+        for cmd in menu_items:
+            if cmd.get_type() == "context_menu":
+                # context menu!
+                cmd.add_command_to_entries(context_entry.children,
+                                           context_entry.key)
+
+            else:
+                # normal menu
+                app_name = cmd.get_app_name()
+                if app_name is None:
+                    # un-parented app
+                    app_name = "Other Items"
+                commands_by_app.setdefault(app_name, []).append(cmd)
+
+        # now add all apps to main menu
+        self._add_app_entries(entries, commands_by_app)
+
+        return entries
+
+    def _context_entry(self):
+        """
+        Describes the context menu which displays the current context
+        """
+        ctx = self._engine.context
+
+        # the key does not depend on the context so the same sub menu is
+        # reused, only its title changes
+        ctx_entry = _MenuEntry(_MenuEntry.MENU, ("context",), str(ctx))
+
+        ctx_entry.children.append(
+            _MenuEntry(_MenuEntry.ACTION, ("context", "jump_to_sg"),
+                       "Jump to Shotgun", callback=self._jump_to_sg))
+
+        # Add the menu item only when there are some file system locations.
+        if ctx.filesystem_locations:
+            ctx_entry.children.append(
+                _MenuEntry(_MenuEntry.ACTION, ("context", "jump_to_fs"),
+                           "Jump to File System", callback=self._jump_to_fs))
+
+        # divider (apps may register entries below this divider)
+        ctx_entry.children.append(
+            _MenuEntry(_MenuEntry.SEPARATOR, ("context", "separator")))
+
+        return ctx_entry
+
+    def _add_app_entries(self, entries, commands_by_app):
+        """
+        Add all apps to the main menu, process them one by one.
+        """
+        for app_name in sorted(commands_by_app.keys()):
+            if len(commands_by_app[app_name]) > 1:
+                # more than one menu entry fort his app
+                # make a sub menu and put all items in the sub menu
+                app_entry = _MenuEntry(_MenuEntry.MENU, ("app", app_name),
+                                       app_name)
+                entries.append(app_entry)
+
+                # get the list of menu cmds for this app
+                cmds = commands_by_app[app_name]
+                # make sure it is in alphabetical order
+                cmds.sort(key=lambda x: x.name)
+
+                for cmd in cmds:
+                    cmd.add_command_to_entries(app_entry.children,
+                                               app_entry.key)
+            else:
+                # this app only has a single entry.
+                # display that on the menu
+                cmd_obj = commands_by_app[app_name][0]
+                if not cmd_obj.favourite:
+                    # skip favourites since they are already on the menu
+                    cmd_obj.add_command_to_entries(entries, ("top",))
+
+    def _sync_menu(self, menu_key, menu, entries, seen):
+        """
+        Makes the given QMenu hold the actions described by the entries,
+        reusing the actions and sub menus created by a previous build.
+        """
+        wanted = []
+        commands = []
+
+        for entry in entries:
+            seen.add(entry.key)
+
+            if entry.kind == _MenuEntry.MENU:
+                sub_menu = self._sub_menus.get(entry.key)
+                if sub_menu is None:
+                    sub_menu = self._add_sub_menu(entry.key, entry.title,
+                                                  menu)
+                elif sub_menu.title() != entry.title:
+                    sub_menu.setTitle(entry.title)
+
+                self._sync_menu(entry.key, sub_menu, entry.children, seen)
+                wanted.append(sub_menu.menuAction())
+                continue
+
+            action = self._actions.get(entry.key)
+            if action is None:
+                if entry.kind == _MenuEntry.SEPARATOR:
+                    action = self._add_divider(menu)
+                else:
+                    action = self._add_menu_item(entry, menu)
+                self._actions[entry.key] = action
+
+            if entry.kind == _MenuEntry.ACTION:
+                tooltip = entry.tooltip or ""
+                if action.toolTip() != tooltip:
+                    action.setToolTip(tooltip)
+                    action.setStatusTip(tooltip)
+                if entry.command_name:
+                    commands.append((action, entry.command_name))
+
+            wanted.append(action)
+
+        self._menu_commands[menu_key] = commands
+
+        # only touch the menu when its actions or their order changed,
+        # re-adding existing actions does not construct new ones
+        if menu.actions() != wanted:
+            for action in menu.actions():
+                menu.removeAction(action)
+            menu.addActions(wanted)
+
+    def _add_divider(self, parent_menu):
+        divider = qt.QtGui.QAction(parent_menu)
+        divider.setSeparator(True)
+        return divider
+
+    def _add_sub_menu(self, menu_key, menu_name, parent_menu):
+        sub_menu = qt.QtGui.QMenu(menu_name, parent_menu)
+        sub_menu.aboutToShow.connect(
+            lambda: self._update_enabled_state(menu_key))
+        self._sub_menus[menu_key] = sub_menu
+        return sub_menu
+
+    def _add_menu_item(self, entry, parent_menu):
+        action = qt.QtGui.QAction(entry.title, parent_menu)
+
+        if entry.command_name:
+            # commands are looked up when triggered, so the action stays valid
+            # when the apps are reloaded by a context change
+            command_name = entry.command_name
+            action.triggered.connect(
+                lambda checked=False:
+                    self._engine.command_registry.execute(command_name))
+        elif entry.callback:
+            callback = entry.callback
+            action.triggered.connect(lambda checked=False: callback())
+
+        return action
+
+    def _update_enabled_state(self, menu_key):
+        """
+        Evaluates the enable callbacks of the commands in the given menu.
+        Results are cached until the context changes.
+        """
+        registry = self._engine.command_registry
+
+        for (action, command_name) in self._menu_commands.get(menu_key, []):
+            if command_name not in self._enabled_cache:
+                enabled = True
+                command = registry.get(command_name)
+                if command and "enable_callback" in command.properties:
+                    enabled = bool(command.properties["enable_callback"]())
+                self._enabled_cache[command_name] = enabled
+
+            action.setEnabled(self._enabled_cache[command_name])
+
+    def _jump_to_sg(self):
+        """
+        Jump to shotgun, launch web browser
+        """
+        url = self._engine.context.shotgun_url
+        qt.QtGui.QDesktopServices.openUrl(qt.QtCore.QUrl(url))
+
+    def _jump_to_fs(self):
+        """
+        Jump from context to FS
+        """
+        # launch one window for each location on disk
+        paths = self._engine.context.filesystem_locations
+        for disk_location in paths:
+
+            # get the setting
+            system = sys.platform
+
+            # run the app
+            if system == "linux2":
+                cmd = 'xdg-open "%s"' % disk_location
+            elif system == "darwin":
+                cmd = 'open "%s"' % disk_location
+            elif system == "win32":
+                cmd = 'cmd.exe /C start "Folder" "%s"' % disk_location
+            else:
+                raise Exception("Platform '%s' is not supported." % system)
+
+            exit_code = os.system(cmd)
+            if exit_code != 0:
+                self._engine.logger.error("Failed to launch '%s'!", cmd)
 
 
 class AppCommand(object):
@@ -251,12 +382,7 @@ class AppCommand(object):
         app_instance = self.properties["app"]
         engine = app_instance.engine
 
-        for (app_instance_name, app_instance_obj) in engine.apps.items():
-            if app_instance_obj == app_instance:
-                # found our app!
-                return app_instance_name
-
-        return None
+        return engine.command_registry.get_app_instance_name(app_instance)
 
     def get_documentation_url_str(self):
         """
@@ -279,26 +405,34 @@ class AppCommand(object):
         """
         return self.properties.get("type", "default")
 
-    def add_command_to_menu(self, menu):
+    def add_command_to_entries(self, entries, parent_key):
         """
-        Adds an app command to the menu
+        Adds an app command to the given list of menu entries
         """
 
         # create menu sub-tree if need to:
         # Support menu items seperated by '/'
-        parent_menu = menu
+        parent_entries = entries
+        key = parent_key
 
         parts = self.name.split("/")
         for item_label in parts[:-1]:
+            key = key + (item_label,)
             # see if there is already a sub-menu item
-            sub_menu = self._find_sub_menu_item(parent_menu, item_label)
-            if sub_menu:
-                # already have sub menu
-                parent_menu = sub_menu
-            else:
-                parent_menu = self.parent._add_sub_menu(
-                    item_label, parent_menu)
-
-        # self._execute_deferred)
-        self.parent._add_menu_item(
-            parts[-1], parent_menu, self.callback, self.properties)
+            sub_menu = None
+            for entry in parent_entries:
+                if entry.kind == _MenuEntry.MENU and entry.key == key:
+                    sub_menu = entry
+                    break
+            if sub_menu is None:
+                sub_menu = _MenuEntry(_MenuEntry.MENU, key, item_label)
+                parent_entries.append(sub_menu)
+            parent_entries = sub_menu.children
+
+        parent_entries.append(_MenuEntry(
+            _MenuEntry.ACTION,
+            key + (self.name,),
+            parts[-1],
+            command_name=self.name,
+            tooltip=self.properties.get("tooltip"),
+        ))
@@ -0,0 +1,128 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Translation of the paths saved on one platform to another.
+
+"""
+
+import re
+import sys
+
+
+def _normalize(path):
+    return path.replace("\\", "/").rstrip("/")
+
+
+def _platform_root(platform_roots, platform):
+    root = platform_roots.get(platform)
+    if root is None and platform.startswith("linux"):
+        # the key depends on the version of python the core runs with
+        root = platform_roots.get("linux2") or platform_roots.get("linux")
+    return root
+
+
+class PathMapper(object):
+    """
+    Replaces the root of the paths found under one of a set of roots.
+
+    All the source roots are compiled into a single regular expression,
+    longest root first, so a path is translated with one match and one
+    dictionary lookup whatever the number of roots. Roots are matched
+    whatever their separators and case, and only on whole path components.
+    """
+
+    def __init__(self, mappings):
+        """
+        :param mappings: List of (source root, target root). The first
+                         mapping of a source root wins.
+        """
+        # lower case source root -> (target root, target separator)
+        self._targets = {}
+        for (source, target) in mappings:
+            key = _normalize(source).lower()
+            if not key or key in self._targets:
+                continue
+            target = target.rstrip("\\/")
+            separator = "\\" if "\\" in target or target.endswith(":") else "/"
+            self._targets[key] = (target, separator)
+
+        prefixes = sorted(self._targets, key=len, reverse=True)
+        self._regex = None
+        if prefixes:
+            self._regex = re.compile(
+                r"^(?:%s)(?=/|$)" % "|".join(
+                    re.escape(prefix) for prefix in prefixes),
+                re.IGNORECASE)
+
+    def __len__(self):
+        return len(self._targets)
+
+    def translate(self, path, separator=None):
+        """
+        Translates a path.
+
+        :param path: Path to translate.
+        :param separator: Separator of the path returned, defaults to the
+                          separator of the target root for the translated
+                          paths, and leaves the others as they are.
+        :returns: The translated path, the path itself if it is not under
+                  one of the roots.
+        """
+        normalized = path.replace("\\", "/")
+        match = self._regex.match(normalized) if self._regex else None
+        if match is None:
+            if separator is None or separator == "/":
+                return normalized if separator else path
+            return normalized.replace("/", separator)
+
+        (target, target_separator) = self._targets[match.group().lower()]
+        translated = target.replace("\\", "/") + normalized[match.end():]
+        separator = separator or target_separator
+        if separator != "/":
+            translated = translated.replace("/", separator)
+        return translated
+
+    def translate_all(self, paths, separator=None):
+        """
+        Translates a list of paths.
+
+        :returns: List of the translated paths, in the same order.
+        """
+        translate = self.translate
+        return [translate(path, separator) for path in paths]
+
+
+def create_path_mapper(tk, platform=None, mappings=None):
+    """
+    Creates a :class:`PathMapper` translating the paths under the roots of
+    the pipeline configuration, saved on any platform, to the roots of a
+    platform.
+
+    :param tk: Toolkit API instance.
+    :param platform: Target platform, as given by sys.platform, defaults to
+                     the current one.
+    :param mappings: List of other (source root, target root), like an old
+                     storage, tried before the roots of the configuration.
+    :returns: :class:`PathMapper`
+    """
+    platform = platform or sys.platform
+    mappings = list(mappings or [])
+
+    data_roots = tk.pipeline_configuration.get_all_platform_data_roots()
+    for platform_roots in data_roots.values():
+        target = _platform_root(platform_roots, platform)
+        if not target:
+            continue
+        for source in platform_roots.values():
+            if source:
+                mappings.append((source, target))
+
+    return PathMapper(mappings)
@@ -0,0 +1,210 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Read-ahead of the first frames of the Loaders of a comp, so the first
+playback does not wait on the network.
+
+"""
+
+import os
+import re
+import sys
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from .comp_parser import parse_comp
+from .media_cache import sequence_files
+
+
+# number of files read ahead at the same time
+PREFETCH_WORKERS = 4
+
+# number of frames of each Loader read ahead
+PREFETCH_FRAMES = 24
+
+# size of the reads used when the OS cannot be asked to read ahead
+_READ_SIZE = 1024 * 1024
+
+# posix_fadvise advice asking the OS to read a file ahead
+_POSIX_FADV_WILLNEED = 3
+
+_FRAME_RE = re.compile(r"(\d+)\D*$")
+
+
+def _libc_fadvise():
+    # os.posix_fadvise only exists from python 3.3
+    if hasattr(os, "posix_fadvise"):
+        return os.posix_fadvise
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        fadvise = libc.posix_fadvise
+    except (OSError, AttributeError):
+        return None
+    fadvise.argtypes = [
+        ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong, ctypes.c_int]
+    return fadvise
+
+
+_fadvise = _libc_fadvise()
+
+
+def warm_file(path, cancelled=None):
+    """
+    Gets a file into the OS page cache, asking the OS to read it ahead when
+    it can, reading it otherwise.
+
+    :param path: Path of the file.
+    :param cancelled: Callable returning True to stop reading.
+    """
+    with open(path, "rb") as media_file:
+        if _fadvise is not None:
+            _fadvise(media_file.fileno(), 0, 0, _POSIX_FADV_WILLNEED)
+            return
+        while media_file.read(_READ_SIZE):
+            if cancelled is not None and cancelled():
+                return
+
+
+def _frame_number(path):
+    match = _FRAME_RE.search(os.path.basename(path))
+    return int(match.group(1)) if match else 0
+
+
+class MediaPrefetcher(object):
+    """
+    Reads ahead the first frames of the Loaders of one comp at a time, in a
+    bounded pool of threads.
+
+    The Loaders and their clips are read from the saved comp file, so the
+    read-ahead can start while Fusion is still loading the comp. Frames are
+    queued Loader by Loader, the first frames of every Loader before the
+    next ones, until the memory budget is used. Prefetching another comp
+    cancels the read-ahead of the previous one.
+    """
+
+    def __init__(self, frames=PREFETCH_FRAMES, budget=None,
+                 workers=PREFETCH_WORKERS, logger=None):
+        """
+        :param frames: Number of frames of each Loader read ahead.
+        :param budget: Maximum number of bytes read ahead for a comp, None
+                       for no limit.
+        :param workers: Number of files read at the same time.
+        :param logger: Logger receiving the progress messages.
+        """
+        self.frames = frames
+        self.budget = budget
+        self._logger = logger
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # bumped for every comp, the work of older comps is dropped
+        self._generation = 0
+        self.comp_path = None
+
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+
+    def prefetch(self, path):
+        """
+        Reads ahead the media of a comp in the background, cancelling the
+        read-ahead of the previous comp.
+
+        :param path: Path of the saved comp.
+        """
+        with self._lock:
+            if path == self.comp_path:
+                return
+            self._generation += 1
+            generation = self._generation
+            self.comp_path = path
+
+        # reading the comp and listing the sequences may take a while
+        thread = threading.Thread(
+            target=self._queue_comp, args=(path, generation))
+        thread.daemon = True
+        thread.start()
+
+    def cancel(self):
+        """
+        Stops the read-ahead of the current comp.
+        """
+        with self._lock:
+            self._generation += 1
+            self.comp_path = None
+
+    def _is_cancelled(self, generation):
+        return generation != self._generation
+
+    def _queue_comp(self, path, generation):
+        try:
+            info = parse_comp(path)
+        except (IOError, OSError, ValueError) as e:
+            self._log("Could not read the Loaders of '%s': %s", path, e)
+            return
+
+        sequences = []
+        for loader in info.loaders:
+            if loader.pass_through:
+                continue
+            for clip in loader.clips:
+                if self._is_cancelled(generation):
+                    return
+                files = sorted(sequence_files(info.expand_path(clip)),
+                               key=_frame_number)
+                sequences.append(files[:self.frames])
+
+        # the first frames of every Loader first
+        queued = 0
+        used = 0
+        for index in range(self.frames):
+            for files in sequences:
+                if index >= len(files):
+                    continue
+                if self._is_cancelled(generation):
+                    return
+                try:
+                    size = os.path.getsize(files[index])
+                except OSError:
+                    continue
+                if self.budget is not None and used + size > self.budget:
+                    self._log("Read-ahead budget of '%s' reached after %d "
+                              "files.", path, queued)
+                    return
+                used += size
+                queued += 1
+                self._queue.put((generation, files[index]))
+
+        self._log("Reading ahead %d files, %.1f MB, of '%s'.",
+                  queued, used / 1048576.0, path)
+
+    def _work(self):
+        while True:
+            (generation, path) = self._queue.get()
+            if self._is_cancelled(generation):
+                continue
+            try:
+                warm_file(path, lambda: self._is_cancelled(generation))
+            except (IOError, OSError) as e:
+                self._log("Could not read ahead '%s': %s", path, e)
+
+    def _log(self, msg, *args):
+        if self._logger is not None:
+            self._logger.debug(msg, *args)
@@ -0,0 +1,360 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Background generation of reduced resolution proxies of the media loaded.
+
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from tank.util.filesystem import ensure_folder_exists
+
+from .fusion_attrs import _lua_string
+from .media_cache import read_loader_clips
+from .render_dispatcher import DEFAULT_CHUNK_SIZE, RenderDispatcher, is_movie
+from .sequence_manifest import find_sequence
+
+
+# resolution divisors of the proxies made, the Loaders use the first one
+PROXY_SCALES = (2, 4)
+
+# file of each proxy folder with the fingerprint of its source
+FINGERPRINT_FILE_NAME = "proxy_fingerprint.json"
+
+# Fusion file formats, by extension
+_FORMAT_IDS = {
+    ".exr": "OpenEXRFormat",
+    ".dpx": "DPXFormat",
+    ".cin": "CineonFormat",
+    ".png": "PNGFormat",
+    ".tif": "TiffFormat",
+    ".tiff": "TiffFormat",
+    ".jpg": "JpegFormat",
+    ".jpeg": "JpegFormat",
+    ".tga": "TargaFormat",
+}
+
+# frame number padding of the Savers
+_PADDING = 4
+
+_SEQUENCE_RE = re.compile(r"^(.*?)(\d+)$")
+
+_PROXY_COMP = """Composition {
+	CurrentTime = %(first)d,
+	RenderRange = { %(first)d, %(last)d, },
+	GlobalRange = { %(first)d, %(last)d, },
+	Tools = ordered() {
+		Loader1 = Loader {
+			Clips = {
+				Clip {
+					ID = "Clip1",
+					Filename = %(source)s,
+					%(source_format)s
+					StartFrame = %(first)d,
+					Length = %(length)d,
+					LengthSetManually = true,
+					TrimIn = 0,
+					TrimOut = %(trim_out)d,
+					GlobalStart = %(first)d,
+					GlobalEnd = %(last)d
+				}
+			},
+			Inputs = {
+				MissingFrames = Input { Value = 1, },
+			},
+		},
+%(outputs)s
+	},
+}
+"""
+
+_PROXY_OUTPUT = """		Scale%(scale)d = Scale {
+			Inputs = {
+				XSize = Input { Value = %(size)s, },
+				Input = Input { SourceOp = "Loader1", Source = "Output", },
+			},
+		},
+		Saver%(scale)d = Saver {
+			Inputs = {
+				Clip = Input {
+					Value = Clip {
+						Filename = %(clip)s,
+						%(format)s
+						Saving = true,
+					},
+				},
+				CreateDir = Input { Value = 1, },
+				Input = Input { SourceOp = "Scale%(scale)d", Source = "Output", },
+			},
+		},
+"""
+
+
+def _format_entry(ext):
+    format_id = _FORMAT_IDS.get(ext.lower())
+    return "FormatID = %s," % _lua_string(format_id) if format_id else ""
+
+
+def source_fingerprint(files):
+    """
+    Returns a fingerprint of the files of a source sequence, from their
+    names, sizes and modification times, without reading them.
+    """
+    digest = hashlib.sha1()
+    for path in files:
+        stat = os.stat(path)
+        digest.update(("%s:%d:%d\n" % (
+            os.path.basename(path), stat.st_size,
+            int(stat.st_mtime))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _ProxyJob(object):
+    def __init__(self, source_clip, root_folder, scales):
+        self.source_clip = source_clip
+        # folder of each proxy
+        self.folders = dict(
+            (scale, os.path.join(root_folder, "proxy_1_%d" % scale))
+            for scale in scales)
+        (base, self.ext) = os.path.splitext(os.path.basename(source_clip))
+        match = _SEQUENCE_RE.match(base)
+        # stills and movies have no frame number, and no proxies
+        self.is_sequence = match is not None
+        self.prefix = match.group(1) if match else base
+
+    def frame_pattern(self, scale):
+        return os.path.join(self.folders[scale], "%s%%0%dd%s" % (
+            self.prefix, _PADDING, self.ext))
+
+    def saver_clip(self, scale):
+        # Fusion adds the frame number before the extension
+        return os.path.join(self.folders[scale], self.prefix + self.ext)
+
+    def proxy_clip(self, scale, first_frame):
+        return self.frame_pattern(scale) % first_frame
+
+
+class ProxyGenerator(object):
+    """
+    Makes reduced resolution proxies of image sequences in the background.
+
+    Sequences are handled one at a time by a background thread. A small comp
+    scaling the sequence to each proxy resolution is rendered in chunks by a
+    pool of render processes, see :class:`RenderDispatcher`. Each proxy
+    folder keeps the fingerprint of the source it was made from. Proxies
+    whose fingerprint matches the current source, with all their frames,
+    are used again without rendering.
+    """
+
+    def __init__(self, command_builder, scales=PROXY_SCALES, workers=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, logger=None, on_ready=None):
+        """
+        :param command_builder: Callable returning the command line rendering
+                                a chunk, see :func:`render_node_command`.
+        :param scales: Resolution divisors of the proxies.
+        :param workers: Number of render processes, defaults to the number
+                        of cores.
+        :param chunk_size: Number of frames per render process.
+        :param logger: Logger receiving the progress messages.
+        :param on_ready: Callable called with the source clip and a
+                         dictionary of scale to proxy clip once the proxies
+                         are ready, from the background thread.
+        """
+        self.scales = tuple(scales)
+        self._command_builder = command_builder
+        self._workers = workers
+        self._chunk_size = chunk_size
+        self._logger = logger
+        self._on_ready = on_ready
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._dispatcher = None
+
+        thread = threading.Thread(target=self._work)
+        thread.daemon = True
+        thread.start()
+
+    def request(self, source_clip, root_folder):
+        """
+        Queues the proxies of a sequence to be made, or found again.
+
+        :param source_clip: Path of the first frame of the sequence.
+        :param root_folder: Folder the proxy folders are made in, kept apart
+                            from the source and publish folders.
+        :returns: False if the sequence was already queued or cannot have
+                  proxies.
+        """
+        job = _ProxyJob(source_clip, root_folder, self.scales)
+        if is_movie(source_clip) or not job.is_sequence:
+            return False
+        with self._lock:
+            if source_clip in self._queued:
+                return False
+            self._queued.add(source_clip)
+        self._queue.put(job)
+        return True
+
+    def cancel(self):
+        """
+        Stops the proxy being rendered.
+        """
+        dispatcher = self._dispatcher
+        if dispatcher is not None:
+            dispatcher.cancel()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._make_proxies(job)
+            except Exception as e:
+                self._log("Could not make the proxies of '%s': %s",
+                          job.source_clip, e)
+            with self._lock:
+                self._queued.discard(job.source_clip)
+
+    def _make_proxies(self, job):
+        sequence = find_sequence(job.source_clip)
+        if sequence is None:
+            return
+        (first, last) = sequence.frame_range
+        fingerprint = source_fingerprint(sequence.files())
+
+        if not self._proxies_match(job, fingerprint, first, last):
+            if not self._render(job, first, last):
+                return
+            for folder in job.folders.values():
+                with open(os.path.join(
+                        folder, FINGERPRINT_FILE_NAME), "w") as info_file:
+                    json.dump({
+                        "source": job.source_clip,
+                        "fingerprint": fingerprint,
+                        "first": first,
+                        "last": last,
+                    }, info_file)
+
+        if self._on_ready is not None:
+            self._on_ready(job.source_clip, dict(
+                (scale, job.proxy_clip(scale, first))
+                for scale in self.scales))
+
+    @staticmethod
+    def _proxies_match(job, fingerprint, first, last):
+        for (scale, folder) in job.folders.items():
+            try:
+                with open(os.path.join(
+                        folder, FINGERPRINT_FILE_NAME), "r") as info_file:
+                    info = json.load(info_file)
+            except (IOError, ValueError):
+                return False
+            if (info.get("fingerprint") != fingerprint or
+                    info.get("first") != first or info.get("last") != last):
+                return False
+            pattern = job.frame_pattern(scale)
+            if not all(os.path.exists(pattern % frame)
+                       for frame in range(first, last + 1)):
+                return False
+        return True
+
+    def _render(self, job, first, last):
+        outputs = []
+        for scale in self.scales:
+            ensure_folder_exists(job.folders[scale])
+            # a proxy made from another source must not be reused
+            fingerprint_path = os.path.join(
+                job.folders[scale], FINGERPRINT_FILE_NAME)
+            if os.path.exists(fingerprint_path):
+                os.remove(fingerprint_path)
+            outputs.append(_PROXY_OUTPUT % {
+                "scale": scale,
+                "size": repr(1.0 / scale),
+                "clip": _lua_string(job.saver_clip(scale)),
+                "format": _format_entry(job.ext),
+            })
+
+        temp_folder = tempfile.mkdtemp(prefix="sgtk_proxy_")
+        try:
+            comp_path = os.path.join(temp_folder, "proxy.comp")
+            with open(comp_path, "w") as comp_file:
+                comp_file.write(_PROXY_COMP % {
+                    "first": first,
+                    "last": last,
+                    "length": last - first + 1,
+                    "trim_out": last - first,
+                    "source": _lua_string(job.source_clip),
+                    "source_format": _format_entry(job.ext),
+                    "outputs": "".join(outputs),
+                })
+
+            self._log("Making the proxies of '%s'.", job.source_clip)
+            self._dispatcher = RenderDispatcher(
+                comp_path, first, last, self._command_builder,
+                dict(("Saver%d" % scale, job.frame_pattern(scale))
+                     for scale in self.scales),
+                chunk_size=self._chunk_size, workers=self._workers,
+                logger=self._logger)
+            return self._dispatcher.run()
+        finally:
+            self._dispatcher = None
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+    def _log(self, msg, *args):
+        if self._logger is not None:
+            self._logger.info(msg, *args)
+
+
+def set_loader_proxies(comp, source_clip, proxy_clip, path_mapper=None):
+    """
+    Sets the proxy clip of the Loaders of the comp reading a source clip.
+
+    :param comp: Fusion comp.
+    :param source_clip: Clip the proxy was made from.
+    :param proxy_clip: Path of the first frame of the proxy.
+    :param path_mapper: :class:`PathMapper` translating the Loader clips
+                        before comparing them.
+    :returns: Number of Loaders updated.
+    """
+    clips = read_loader_clips(comp)
+    names = list(clips.keys())
+    paths = list(clips.values())
+    if path_mapper is not None:
+        paths = path_mapper.translate_all(paths)
+    source = os.path.normcase(os.path.normpath(source_clip))
+    loaders = [
+        name for (name, path) in zip(names, paths)
+        if os.path.normcase(os.path.normpath(path)) == source
+    ]
+    if not loaders:
+        return 0
+
+    comp.Lock()
+    comp.StartUndo("Set Loader Proxies")
+    try:
+        for name in loaders:
+            loader = comp.FindTool(name)
+            if loader is not None:
+                loader.ProxyFilename = proxy_clip
+    finally:
+        comp.EndUndo(True)
+        comp.Unlock()
+    return len(loaders)
@@ -0,0 +1,385 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Report of the Loaders of many comps reading an old version of their media.
+
+The comps found in the work and publish areas are read without Fusion by a
+pool of processes, then the media of each Loader is matched to a template
+and its latest version looked up on disk. The folders are listed once and
+the listings shared by all the lookups, so a plate read by a thousand comps
+costs a single listing.
+
+Runs from the command line with the toolkit core on the python path:
+
+    python -m tk_fusion.reference_report /projects/show/sequences/sq010 \\
+        --output sq010_references.csv
+
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import re
+import sys
+
+from multiprocessing.pool import ThreadPool
+
+import tank
+
+from .comp_parser import parse_comp
+from .lru_cache import LRUCache
+from .path_mapping import create_path_mapper
+from .template_resolver import TemplateResolver
+
+
+# templates of the comps scanned by default
+COMP_TEMPLATES_PATTERN = r"^fusion_.*_(work|publish)$"
+
+# number of folder listings kept in memory
+LISTING_CACHE_SIZE = 65536
+
+# number of folders listed at the same time
+LISTING_THREADS = 16
+
+REPORT_COLUMNS = (
+    "comp", "loader", "path", "version", "latest_version", "latest_path")
+
+# stand-in values of the version and frame keys, replaced by patterns to
+# match the names on disk
+_VERSION_SENTINEL = 987654321
+_FRAME_SENTINEL = 876543219
+
+_SEPARATORS_RE = re.compile(r"[\\/]+")
+
+
+class FolderListings(object):
+    """
+    Names found in folders, listed once and shared between threads.
+    """
+
+    def __init__(self, cache_size=LISTING_CACHE_SIZE):
+        self._cache = LRUCache(cache_size)
+
+    def list(self, folder):
+        """
+        Returns the names found in the folder, an empty tuple if it does not
+        exist.
+        """
+        names = self._cache.get(folder)
+        if names is None:
+            try:
+                names = tuple(os.listdir(folder))
+            except OSError:
+                names = ()
+            self._cache.set(folder, names)
+        return names
+
+
+def _component_regex(component):
+    # the version and frame stand-ins are matched by any number
+    regex = re.escape(component)
+    regex = regex.replace(str(_VERSION_SENTINEL), r"(?P<version>\d+)", 1)
+    regex = regex.replace(str(_VERSION_SENTINEL), r"(?P=version)")
+    regex = regex.replace(str(_FRAME_SENTINEL), r"-?\d+")
+    return re.compile("^%s$" % regex, re.IGNORECASE)
+
+
+def find_versions(template, fields, listings):
+    """
+    Finds the versions of a path available on disk.
+
+    :param template: Template of the path, with a 'version' key.
+    :param fields: Fields of the path.
+    :param listings: :class:`FolderListings`
+    :returns: Set of version numbers.
+    """
+    fields = dict(fields)
+    fields["version"] = _VERSION_SENTINEL
+    for (name, key) in template.keys.items():
+        if isinstance(key, tank.templatekey.SequenceKey):
+            fields[name] = _FRAME_SENTINEL
+    path = template.apply_fields(fields)
+
+    parts = _SEPARATORS_RE.split(path)
+    dynamic = [
+        index for (index, part) in enumerate(parts)
+        if str(_VERSION_SENTINEL) in part or str(_FRAME_SENTINEL) in part
+    ]
+    if not dynamic:
+        return set()
+
+    # (folder, version) candidates, the folders above the first version or
+    # frame number are shared by all the versions
+    candidates = [("/".join(parts[:dynamic[0]]) or "/", None)]
+    for part in parts[dynamic[0]:]:
+        regex = _component_regex(part)
+        next_candidates = []
+        for (folder, version) in candidates:
+            for name in listings.list(folder):
+                match = regex.match(name)
+                if match is None:
+                    continue
+                found = match.groupdict().get("version")
+                if found is not None:
+                    found = int(found)
+                    if version is not None and found != version:
+                        continue
+                else:
+                    found = version
+                next_candidates.append(("%s/%s" % (folder, name), found))
+        candidates = next_candidates
+        if not candidates:
+            break
+
+    return set(version for (_, version) in candidates if version is not None)
+
+
+class Reference(object):
+    """
+    Media read by a Loader of a comp.
+    """
+
+    def __init__(self, comp, loader, path):
+        self.comp = comp
+        self.loader = loader
+        self.path = path
+        self.version = None
+        self.latest_version = None
+        self.latest_path = None
+
+    @property
+    def is_out_of_date(self):
+        return (self.version is not None and
+                self.latest_version is not None and
+                self.latest_version > self.version)
+
+    def as_row(self):
+        return [
+            self.comp, self.loader, self.path,
+            "" if self.version is None else self.version,
+            "" if self.latest_version is None else self.latest_version,
+            self.latest_path or "",
+        ]
+
+
+def _read_comp_references(path):
+    """
+    Reads the Loader clips of a comp, run in the worker processes.
+
+    :returns: Tuple (path, [(loader name, clip)], error message or None).
+    """
+    try:
+        info = parse_comp(path)
+    except (IOError, OSError, ValueError) as e:
+        return (path, [], str(e))
+    clips = []
+    for loader in info.loaders:
+        for clip in loader.clips:
+            clips.append((loader.name, info.expand_path(clip)))
+    return (path, clips, None)
+
+
+def find_comps(tk, folders, templates_pattern=COMP_TEMPLATES_PATTERN):
+    """
+    Finds the comps of the work and publish areas under the folders.
+
+    :param tk: Toolkit API instance.
+    :param folders: Folders to search, like a sequence or a shot folder.
+    :param templates_pattern: Regular expression matching the names of the
+                              templates of the comps.
+    :returns: Sorted list of comp paths.
+    """
+    regex = re.compile(templates_pattern)
+    templates = [
+        template for (name, template) in tk.templates.items()
+        if regex.match(name)
+    ]
+
+    roots = [os.path.normcase(os.path.abspath(folder)) for folder in folders]
+    comps = set()
+    for folder in folders:
+        context = tk.context_from_path(folder)
+        for template in templates:
+            # narrow the search to the entities of the folder when known
+            fields = context.as_template_fields(template)
+            for path in tk.paths_from_template(template, fields):
+                normalized = os.path.normcase(os.path.abspath(path))
+                if any(normalized == root or
+                       normalized.startswith(root.rstrip(os.sep) + os.sep)
+                       for root in roots):
+                    comps.add(path)
+    return sorted(comps)
+
+
+def resolve_latest_versions(tk, references, threads=LISTING_THREADS,
+                            listings=None, path_mapper=None):
+    """
+    Sets the current and latest versions of the references whose path
+    matches a template with a version.
+
+    References to the same media, whatever the frame, are looked up once.
+
+    :param tk: Toolkit API instance.
+    :param references: List of :class:`Reference`.
+    :param threads: Number of lookups run at the same time.
+    :param listings: :class:`FolderListings` shared with other calls.
+    :param path_mapper: :class:`PathMapper` translating the paths saved on
+                        other platforms, defaults to the roots of the
+                        pipeline configuration.
+    """
+    resolver = TemplateResolver(tk)
+    listings = listings or FolderListings()
+    path_mapper = path_mapper or create_path_mapper(tk)
+    paths = path_mapper.translate_all(
+        [reference.path for reference in references])
+
+    # media, without its version and frame -> references
+    media = {}
+    for (reference, path) in zip(references, paths):
+        try:
+            (template, fields) = \
+                resolver.template_and_fields_from_path(path)
+        except tank.TankError:
+            continue
+        if template is None or "version" not in fields:
+            continue
+        reference.version = fields["version"]
+
+        key_fields = dict(
+            (name, value) for (name, value) in fields.items()
+            if name != "version" and not isinstance(
+                template.keys.get(name), tank.templatekey.SequenceKey))
+        key = (template.name, tuple(sorted(key_fields.items())))
+        media.setdefault(key, (template, fields, []))[2].append(reference)
+
+    def lookup(entry):
+        (template, fields, media_references) = entry
+        versions = find_versions(template, fields, listings)
+        if not versions:
+            return
+        latest_version = max(versions)
+        latest_fields = dict(fields, version=latest_version)
+        latest_path = template.apply_fields(latest_fields)
+        for reference in media_references:
+            reference.latest_version = latest_version
+            reference.latest_path = latest_path
+
+    pool = ThreadPool(threads)
+    try:
+        pool.map(lookup, list(media.values()))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def scan_comps(tk, comps, processes=None, threads=LISTING_THREADS,
+               log=None):
+    """
+    Reads the Loaders of the comps in a pool of processes and looks up the
+    latest version of their media.
+
+    :param tk: Toolkit API instance.
+    :param comps: List of comp paths.
+    :param processes: Number of processes reading the comps, defaults to the
+                      number of cores.
+    :param threads: Number of folder lookups run at the same time.
+    :param log: Callable receiving progress messages.
+    :returns: Tuple (list of :class:`Reference`, {comp path: error}).
+    """
+    references = []
+    errors = {}
+
+    pool = multiprocessing.Pool(processes or multiprocessing.cpu_count())
+    try:
+        for (index, (path, clips, error)) in enumerate(
+                pool.imap_unordered(_read_comp_references, comps,
+                                    chunksize=4)):
+            if error is not None:
+                errors[path] = error
+            for (loader, clip) in clips:
+                references.append(Reference(path, loader, clip))
+            if log is not None and (index + 1) % 500 == 0:
+                log("%d/%d comps read." % (index + 1, len(comps)))
+    finally:
+        pool.close()
+        pool.join()
+
+    resolve_latest_versions(tk, references, threads)
+    references.sort(key=lambda reference: (reference.comp, reference.loader))
+    return (references, errors)
+
+
+def write_report(references, report_path, out_of_date_only=True):
+    """
+    Writes the references to a CSV file.
+
+    :returns: Number of rows written.
+    """
+    rows = [
+        reference.as_row() for reference in references
+        if reference.is_out_of_date or not out_of_date_only
+    ]
+    with open(report_path, "wb") as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(REPORT_COLUMNS)
+        writer.writerows(rows)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Reports the Loaders of the comps reading an old "
+                    "version of their media.")
+    parser.add_argument(
+        "folders", nargs="+",
+        help="Folders searched for comps, like a sequence or a shot.")
+    parser.add_argument(
+        "-o", "--output", default="fusion_references.csv",
+        help="Path of the CSV report.")
+    parser.add_argument(
+        "--all", action="store_true",
+        help="Report all the references, not only the out of date ones.")
+    parser.add_argument(
+        "--templates", default=COMP_TEMPLATES_PATTERN,
+        help="Regular expression matching the templates of the comps.")
+    parser.add_argument(
+        "--processes", type=int, default=None,
+        help="Number of processes reading the comps.")
+    parser.add_argument(
+        "--threads", type=int, default=LISTING_THREADS,
+        help="Number of folders listed at the same time.")
+    args = parser.parse_args(argv)
+
+    def log(msg):
+        sys.stderr.write(msg + "\n")
+
+    tk = tank.sgtk_from_path(args.folders[0])
+    comps = find_comps(tk, args.folders, args.templates)
+    log("%d comps found." % len(comps))
+
+    (references, errors) = scan_comps(
+        tk, comps, args.processes, args.threads, log)
+    for (path, error) in sorted(errors.items()):
+        log("Could not read '%s': %s" % (path, error))
+
+    rows = write_report(references, args.output, not args.all)
+    out_of_date = sum(1 for reference in references
+                      if reference.is_out_of_date)
+    log("%d Loaders in %d comps, %d out of date, %d rows written to '%s'." % (
+        len(references), len(comps), out_of_date, rows, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    # run from the package so the worker processes can import the functions
+    from tk_fusion.reference_report import main
+    sys.exit(main())
@@ -0,0 +1,240 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Check that the volumes the Savers of a comp write to have room for the
+render.
+
+"""
+
+import os
+import sys
+import threading
+import time
+
+from .fusion_attrs import get_attrs, get_prefs
+from .savers import read_local_outputs, read_saver_clips
+
+
+# bytes per pixel of an uncompressed frame and expected compression ratio,
+# by output format. The bit depths are the ones of the Shotgun Saver
+# outputs: 10 bit DPX, 16 bit half float EXR, 8 bit PNG.
+FORMAT_ESTIMATES = {
+    ".dpx": (4.0, 1.0),    # 10 bit RGB packed in 32 bits, uncompressed
+    ".exr": (8.0, 0.6),    # RGBA half float, zip or piz compressed
+    ".png": (4.0, 0.5),    # RGBA 8 bit, deflate compressed
+    ".tif": (8.0, 0.8),
+    ".tiff": (8.0, 0.8),
+    ".jpg": (3.0, 0.1),
+    ".jpeg": (3.0, 0.1),
+    ".mov": (0.6, 1.0),    # around ProRes 422 HQ
+    ".mp4": (0.1, 1.0),
+}
+
+# estimate for the formats not listed above
+DEFAULT_ESTIMATE = (8.0, 1.0)
+
+# share of the estimate kept free on top of it, the estimates are rough
+SAFETY_MARGIN = 0.1
+
+# how long to wait for a volume to report its free space, in seconds
+VOLUME_TIMEOUT = 10.0
+
+
+def estimate_output_size(path, width, height, frame_count):
+    """
+    Estimates the size in bytes of an output sequence.
+
+    :param path: Path of the output, its extension gives the format.
+    :param width: Frame width in pixels.
+    :param height: Frame height in pixels.
+    :param frame_count: Number of frames rendered.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    (bytes_per_pixel, compression_ratio) = \
+        FORMAT_ESTIMATES.get(ext, DEFAULT_ESTIMATE)
+    return int(width * height * bytes_per_pixel * compression_ratio *
+               frame_count)
+
+
+def _existing_folder(folder):
+    # the output folders may not exist yet, use the closest existing parent
+    while folder and not os.path.isdir(folder):
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            break
+        folder = parent
+    return folder
+
+
+def free_space(folder):
+    """
+    Returns the space available to the user on the volume of the folder,
+    in bytes.
+
+    :raises OSError: If the volume could not be queried.
+    """
+    if sys.platform == "win32":
+        import ctypes
+        free_bytes = ctypes.c_ulonglong(0)
+        if not ctypes.windll.kernel32.GetDiskFreeSpaceExW(
+                ctypes.c_wchar_p(folder), ctypes.pointer(free_bytes),
+                None, None):
+            # the free space is unknown, not zero
+            raise ctypes.WinError()
+        return free_bytes.value
+
+    stats = os.statvfs(folder)
+    return stats.f_bavail * stats.f_frsize
+
+
+class VolumeCheck(object):
+    """
+    Space needed by a render on one volume.
+    """
+
+    def __init__(self, folder):
+        # an existing folder of the volume, used to query it
+        self.folder = folder
+        self.outputs = []
+        self.required = 0
+        # None until the volume answered
+        self.available = None
+        self.error = None
+
+    @property
+    def has_room(self):
+        """
+        Whether the volume has room for the estimate and the safety margin.
+        Volumes that could not be queried are given the benefit of the
+        doubt.
+        """
+        if self.available is None:
+            return True
+        return self.available >= self.required * (1.0 + SAFETY_MARGIN)
+
+    def __repr__(self):
+        return "<VolumeCheck %s %d/%s>" % (
+            self.folder, self.required, self.available)
+
+
+def _volume_key(folder):
+    if sys.platform == "win32":
+        return os.path.splitdrive(os.path.abspath(folder))[0].lower() or folder
+    return os.stat(folder).st_dev
+
+
+class _FolderQuery(object):
+    def __init__(self, folder):
+        self.folder = folder
+        self.outputs = []
+        # filled in by the query thread
+        self.existing_folder = None
+        self.volume_key = None
+        self.available = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.existing_folder = _existing_folder(self.folder)
+            if not self.existing_folder:
+                return
+            self.volume_key = _volume_key(self.existing_folder)
+            self.available = free_space(self.existing_folder)
+        except (OSError, AttributeError, ValueError) as e:
+            self.error = e
+
+
+def check_volumes(outputs, width, height, frame_count):
+    """
+    Sums the estimated size of the outputs per volume and queries the free
+    space of the volumes in parallel, a slow network volume does not hold
+    the others.
+
+    Every file system access, finding the volume of an output folder
+    included, is made by the query threads, so a volume that does not
+    answer only holds its own thread, for :data:`VOLUME_TIMEOUT` seconds at
+    most.
+
+    :param outputs: List of output paths.
+    :param width: Frame width in pixels.
+    :param height: Frame height in pixels.
+    :param frame_count: Number of frames rendered.
+    :returns: List of :class:`VolumeCheck`, one per volume.
+    """
+    queries = {}
+    for path in outputs:
+        folder = os.path.dirname(path)
+        if not folder:
+            continue
+        query = queries.get(folder)
+        if query is None:
+            query = queries[folder] = _FolderQuery(folder)
+        query.outputs.append(path)
+
+    threads = []
+    for query in queries.values():
+        thread = threading.Thread(target=query.run)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    deadline = time.time() + VOLUME_TIMEOUT
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.time()))
+
+    volumes = {}
+    for query in queries.values():
+        if query.volume_key is None and query.existing_folder == "":
+            # no part of the path exists
+            continue
+        # the folders that did not answer are volumes of their own, with an
+        # unknown free space
+        key = query.volume_key
+        if key is None:
+            key = query.folder
+        volume = volumes.get(key)
+        if volume is None:
+            volume = volumes[key] = VolumeCheck(
+                query.existing_folder or query.folder)
+        if volume.available is None:
+            volume.available = query.available
+            volume.error = query.error
+        volume.outputs.extend(query.outputs)
+        volume.required += sum(
+            estimate_output_size(path, width, height, frame_count)
+            for path in query.outputs)
+
+    return list(volumes.values())
+
+
+def check_render_capacity(comp):
+    """
+    Checks that the volumes the Savers of the comp write to have room for
+    the render range, at the comp resolution.
+
+    The Savers rendering to a local scratch folder need room both in the
+    scratch folder and on the network.
+
+    :param comp: Fusion comp.
+    :returns: List of :class:`VolumeCheck`, one per volume.
+    """
+    frame_range = get_attrs(comp, "COMPN_RenderStart", "COMPN_RenderEnd")
+    frame_count = int(frame_range["COMPN_RenderEnd"] -
+                      frame_range["COMPN_RenderStart"]) + 1
+
+    frame_format = get_prefs(
+        comp, "Comp.FrameFormat.Width", "Comp.FrameFormat.Height")
+    width = int(frame_format["Comp.FrameFormat.Width"])
+    height = int(frame_format["Comp.FrameFormat.Height"])
+
+    outputs = list(read_saver_clips(comp).values())
+    outputs.extend(read_local_outputs(comp)[1].values())
+
+    return check_volumes(outputs, width, height, frame_count)
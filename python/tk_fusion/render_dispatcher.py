@@ -0,0 +1,336 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Local render of a comp split in chunks of frames, rendered in parallel.
+
+"""
+
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+
+from .fusion_attrs import comp_path, get_attr, get_attrs
+from .savers import (
+    local_output_path, read_local_outputs, read_saver_clips)
+
+
+# frames rendered by each render process
+DEFAULT_CHUNK_SIZE = 10
+
+# how many times a failed chunk is queued again before giving up
+MAX_RETRIES = 2
+
+# how often the render processes are checked, in seconds
+POLL_INTERVAL = 0.5
+
+# outputs written to a single file, which cannot be rendered in chunks
+MOVIE_EXTENSIONS = (".mov", ".mp4", ".avi")
+
+
+def is_movie(path):
+    """
+    Whether the path is a movie, written to a single file.
+    """
+    return os.path.splitext(path)[1].lower() in MOVIE_EXTENSIONS
+
+
+def render_node_command(executable):
+    """
+    Returns a command builder running a chunk with the given Fusion or
+    FusionRenderNode executable.
+
+    :param executable: Path to the executable.
+    :returns: Callable taking the comp path and the first and last frames of
+              a chunk, and returning the command line to run.
+    """
+    def build(path, start_frame, end_frame):
+        return [
+            executable, path,
+            "-render",
+            "-start", str(start_frame),
+            "-end", str(end_frame),
+            "-quit",
+        ]
+    return build
+
+
+class RenderChunk(object):
+    """
+    A range of frames rendered by one process.
+    """
+
+    def __init__(self, start_frame, end_frame):
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.attempts = 0
+
+    @property
+    def frames(self):
+        return range(self.start_frame, self.end_frame + 1)
+
+    def __repr__(self):
+        return "<RenderChunk %d-%d>" % (self.start_frame, self.end_frame)
+
+
+class RenderDispatcher(object):
+    """
+    Renders a saved comp by splitting its frame range in chunks, rendered by
+    a pool of local processes, one per core by default.
+
+    A chunk is complete when its process exits without error and every
+    tracked output has all the frames of the chunk on disk. Failed chunks
+    are queued again up to max_retries times.
+
+    The command run for a chunk is given by command_builder, which makes it
+    possible to use FusionRenderNode, Fusion itself or any stand-in command.
+    """
+
+    def __init__(self, path, start_frame, end_frame, command_builder,
+                 outputs=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None,
+                 max_retries=MAX_RETRIES, logger=None,
+                 on_chunk_complete=None):
+        """
+        :param path: Path of the saved comp to render.
+        :param start_frame: First frame to render.
+        :param end_frame: Last frame to render.
+        :param command_builder: Callable returning the command line rendering
+                                a chunk, see :func:`render_node_command`.
+        :param outputs: Dictionary of Saver name to frame path pattern, like
+                        '/renders/shot_v001.%04d.exr', of the outputs whose
+                        frames are checked. None for an output that is not
+                        checked.
+        :param chunk_size: Number of frames per chunk.
+        :param workers: Number of processes run at the same time, defaults
+                        to the number of cores.
+        :param max_retries: How many times a failed chunk is queued again.
+        :param logger: Logger receiving the progress messages.
+        :param on_chunk_complete: Callable called with each
+                                  :class:`RenderChunk` once rendered, from
+                                  the render thread.
+        """
+        self.path = path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.outputs = dict(outputs or {})
+
+        self._command_builder = command_builder
+        self._workers = workers or multiprocessing.cpu_count()
+        self._max_retries = max_retries
+        self._logger = logger
+        self._on_chunk_complete = on_chunk_complete
+
+        self._queue = [
+            RenderChunk(start, min(start + chunk_size - 1, end_frame))
+            for start in range(start_frame, end_frame + 1, chunk_size)
+        ]
+        self._running = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._cancelled = False
+
+        # Saver name -> set of frames found on disk
+        self.completed_frames = dict(
+            (name, set()) for name in self.outputs)
+        self.completed_chunks = []
+        self.failed_chunks = []
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def succeeded(self):
+        """
+        Whether every chunk was rendered.
+        """
+        return (not self._queue and not self._running and
+                not self.failed_chunks and not self._cancelled)
+
+    def start(self):
+        """
+        Renders the comp in a background thread.
+        """
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Waits for a render started with :meth:`start` to finish.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def cancel(self):
+        """
+        Stops the render, killing the running processes.
+        """
+        with self._lock:
+            self._cancelled = True
+            for process in self._running:
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+
+    def run(self):
+        """
+        Renders all the chunks, returning when they are all complete or
+        have failed too many times.
+
+        :returns: True if every chunk was rendered.
+        """
+        self._log("Rendering '%s' frames %d-%d in %d chunks, %d at a time.",
+                  self.path, self.start_frame, self.end_frame,
+                  len(self._queue), self._workers)
+
+        while True:
+            with self._lock:
+                if self._cancelled:
+                    break
+                while self._queue and len(self._running) < self._workers:
+                    self._launch(self._queue.pop(0))
+                if not self._running:
+                    break
+                finished = [
+                    (process, chunk)
+                    for (process, chunk) in self._running.items()
+                    if process.poll() is not None
+                ]
+                for (process, chunk) in finished:
+                    del self._running[process]
+
+            for (process, chunk) in finished:
+                self._chunk_done(chunk, process.returncode)
+
+            if not finished:
+                time.sleep(POLL_INTERVAL)
+
+        self._log("Render of '%s' done: %d chunks rendered, %d failed.",
+                  self.path, len(self.completed_chunks),
+                  len(self.failed_chunks))
+        return self.succeeded
+
+    def _launch(self, chunk):
+        chunk.attempts += 1
+        command = self._command_builder(
+            self.path, chunk.start_frame, chunk.end_frame)
+        try:
+            with open(os.devnull, "w") as devnull:
+                process = subprocess.Popen(
+                    command, stdout=devnull, stderr=subprocess.STDOUT)
+        except OSError as e:
+            self._log("Chunk %d-%d could not be started: %s",
+                      chunk.start_frame, chunk.end_frame, e)
+            self.failed_chunks.append(chunk)
+            return
+        self._running[process] = chunk
+
+    def _missing_frames(self, chunk):
+        missing = []
+        for (name, pattern) in self.outputs.items():
+            if pattern is None:
+                continue
+            for frame in chunk.frames:
+                if os.path.exists(pattern % frame):
+                    self.completed_frames[name].add(frame)
+                else:
+                    missing.append((name, frame))
+        return missing
+
+    def _chunk_done(self, chunk, return_code):
+        missing = self._missing_frames(chunk)
+        if return_code == 0 and not missing:
+            self.completed_chunks.append(chunk)
+            if self._on_chunk_complete is not None:
+                self._on_chunk_complete(chunk)
+            return
+
+        if return_code != 0:
+            reason = "exited with code %s" % return_code
+        else:
+            reason = "left %d frames missing" % len(missing)
+
+        with self._lock:
+            if chunk.attempts <= self._max_retries and not self._cancelled:
+                self._log("Chunk %d-%d %s, queued again.",
+                          chunk.start_frame, chunk.end_frame, reason)
+                self._queue.append(chunk)
+            else:
+                self._log("Chunk %d-%d %s, giving up.",
+                          chunk.start_frame, chunk.end_frame, reason)
+                self.failed_chunks.append(chunk)
+
+    def _log(self, msg, *args):
+        if self._logger is not None:
+            self._logger.info(msg, *args)
+
+
+def create_render_dispatcher(engine, comp, command_builder, **kwargs):
+    """
+    Creates a dispatcher rendering the render range of the saved comp.
+
+    The frames of the Savers writing to a Shotgun template are checked once
+    rendered. The comp is rendered as a single chunk if one of its Savers
+    writes a movie, which cannot be split.
+
+    :param engine: The Fusion engine.
+    :param comp: Fusion comp, it has to be saved.
+    :param command_builder: Callable returning the command line rendering
+                            a chunk, see :func:`render_node_command`.
+    :param kwargs: Other :class:`RenderDispatcher` parameters.
+    :returns: :class:`RenderDispatcher`
+    """
+    path = comp_path(comp)
+    if not path:
+        raise ValueError("The comp has to be saved before being rendered.")
+    if get_attr(comp, "COMPB_Modified"):
+        engine.logger.warning(
+            "'%s' has unsaved changes, the saved comp is rendered.", path)
+
+    frame_range = get_attrs(comp, "COMPN_RenderStart", "COMPN_RenderEnd")
+    start_frame = int(frame_range["COMPN_RenderStart"])
+    end_frame = int(frame_range["COMPN_RenderEnd"])
+
+    # the frames of the Savers rendering locally are checked in the scratch
+    # folder, their template is found from their network clip
+    (scratch_root, local_outputs) = read_local_outputs(comp)
+
+    outputs = {}
+    has_movie = False
+    clips = read_saver_clips(comp)
+    clips.update(local_outputs)
+    for (saver_name, clip) in clips.items():
+        if is_movie(clip):
+            has_movie = True
+            continue
+        (template, fields) = \
+            engine.template_resolver.template_and_fields_from_path(clip)
+        if template is None:
+            outputs[saver_name] = None
+            continue
+        # without a frame number the template gives the frame pattern
+        fields.pop("SEQ", None)
+        pattern = template.apply_fields(fields)
+        if saver_name in local_outputs:
+            pattern = local_output_path(scratch_root, pattern)
+        outputs[saver_name] = pattern if "%" in pattern else None
+
+    if has_movie:
+        engine.logger.warning(
+            "'%s' writes a movie, it is rendered as a single chunk.", path)
+        kwargs["chunk_size"] = end_frame - start_frame + 1
+
+    kwargs.setdefault("logger", engine.logger)
+    return RenderDispatcher(
+        path, start_frame, end_frame, command_builder, outputs, **kwargs)
@@ -0,0 +1,96 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Start and end of the renders Fusion runs itself, from its Render button or
+its render manager.
+
+"""
+
+from tank.platform import qt
+
+from .fusion_attrs import get_attr
+from .lazy_qt import LazyQtClass
+
+
+# how often the comp is checked for a render, in milliseconds
+POLL_INTERVAL = 1000
+
+# number of polls in a row the comp being rendered may fail to answer
+# before it is taken as closed
+MAX_FAILED_POLLS = 5
+
+
+class RenderMonitor(LazyQtClass):
+    """
+    Watches the active comp for a render, and the comp being rendered until
+    its render ends.
+
+    Fusion does not notify Python of its renders, so the COMPB_Rendering
+    attribute is polled, which costs one attribute read. A render is only
+    seen if it lasts longer than the poll interval.
+
+    The monitor is a QObject, it can only be created once the engine set up
+    Qt.
+    """
+
+    qt_base_class = "QtCore.QObject"
+    # render_started and render_finished are emitted with the comp rendered
+    qt_signals = {"render_started": (object,), "render_finished": (object,)}
+
+    def __init__(self, engine, parent=None):
+        super(RenderMonitor, self).__init__(parent)
+        self._engine = engine
+        # comp being rendered, and the number of polls in a row it did not
+        # answer
+        self._comp = None
+        self._failed_polls = 0
+
+        self._poll_timer = qt.QtCore.QTimer(self)
+        self._poll_timer.setInterval(POLL_INTERVAL)
+        self._poll_timer.timeout.connect(self._poll)
+
+    def start(self):
+        """
+        Starts watching for renders.
+        """
+        self._poll_timer.start()
+
+    def stop(self):
+        """
+        Stops watching for renders.
+        """
+        self._poll_timer.stop()
+        self._comp = None
+        self._failed_polls = 0
+
+    def _poll(self):
+        comp = self._comp
+        try:
+            if comp is None:
+                comp = self._engine.fusion.GetCurrentComp()
+                if comp is None:
+                    return
+            rendering = bool(get_attr(comp, "COMPB_Rendering", False))
+        except Exception:
+            # Fusion may be busy, or the comp being rendered was closed
+            if self._comp is not None:
+                self._failed_polls += 1
+                if self._failed_polls >= MAX_FAILED_POLLS:
+                    self._comp = None
+            return
+
+        self._failed_polls = 0
+        if rendering and self._comp is None:
+            self._comp = comp
+            self.render_started.emit(comp)
+        elif not rendering and self._comp is not None:
+            self._comp = None
+            self.render_finished.emit(comp)
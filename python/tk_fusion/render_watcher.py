@@ -0,0 +1,498 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Live index of the frames rendered to the Saver output folders, updated as
+the frames land.
+
+"""
+
+import os
+import re
+import select
+import struct
+import sys
+import threading
+import time
+
+from .sequence_manifest import get_sequence_scanner, sequence_key
+
+
+# seconds between two checks of the watched folders when they cannot be
+# watched by the OS
+POLL_INTERVAL = 2.0
+
+# seconds after its last frame a sequence is still considered rendering
+WRITING_TIMEOUT = 10.0
+
+# inotify event masks, see inotify(7)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    _IN_CREATE | _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO |
+    _IN_MOVED_FROM | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF |
+    _IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# frame number of a file name, without its extension
+_FRAME_RE = re.compile(r"^(.*?)(\d+)$")
+
+
+class _Inotify(object):
+    """
+    Minimal inotify binding, Linux only.
+    """
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(self._get_errno(), "inotify_init failed")
+
+    def add_watch(self, folder, mask):
+        if not isinstance(folder, bytes):
+            folder = folder.encode(sys.getfilesystemencoding())
+        wd = self._add_watch(self.fd, folder, mask)
+        if wd < 0:
+            errno = self._get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        """
+        Returns the list of (watch descriptor, mask, name) events read
+        within the timeout.
+        """
+        (ready, _, _) = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            (wd, mask, _, length) = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if not isinstance(name, str):
+                name = name.decode(sys.getfilesystemencoding())
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class RenderState(object):
+    """
+    State of a rendered sequence at the time it was asked for.
+    """
+
+    def __init__(self, folder, prefix, ext, padding, first_frame,
+                 last_frame, frame_count, writing_count, last_write):
+        self.folder = folder
+        self.prefix = prefix
+        self.ext = ext
+        self.padding = padding
+        self.first_frame = first_frame
+        self.last_frame = last_frame
+        self.frame_count = frame_count
+        # frames open for writing, with a write event within the last
+        # WRITING_TIMEOUT seconds
+        self.writing_count = writing_count
+        self.last_write = last_write
+
+    @property
+    def missing_count(self):
+        """
+        Number of frames missing between the first and last frames.
+        """
+        if self.frame_count == 0:
+            return 0
+        return self.last_frame - self.first_frame + 1 - self.frame_count
+
+    @property
+    def is_writing(self):
+        """
+        True while frames are written, or were written within the last
+        :data:`WRITING_TIMEOUT` seconds.
+        """
+        return (self.writing_count > 0 or
+                time.time() - self.last_write < WRITING_TIMEOUT)
+
+    def path(self, frame):
+        """
+        Returns the path of a frame of the sequence.
+        """
+        return os.path.join(self.folder, "%s%0*d%s" % (
+            self.prefix, self.padding, frame, self.ext))
+
+
+class _LiveSequence(object):
+    def __init__(self, prefix, ext, padding):
+        self.prefix = prefix
+        self.ext = ext
+        self.padding = padding
+        # frame -> (size, mtime)
+        self.frames = {}
+        # frame open for writing -> time of its last write event, a render
+        # that crashed never closes its frames
+        self.writing = {}
+        self.first = None
+        self.last = None
+        self.last_write = 0.0
+
+    def add(self, frame, size, mtime, digits=None):
+        self.frames[frame] = (size, mtime)
+        self.writing.pop(frame, None)
+        if digits is not None:
+            self.padding = min(self.padding, digits)
+        if self.first is None or frame < self.first:
+            self.first = frame
+        if self.last is None or frame > self.last:
+            self.last = frame
+        self.last_write = max(self.last_write, mtime)
+
+    def remove(self, frame):
+        self.writing.pop(frame, None)
+        if self.frames.pop(frame, None) is None:
+            return
+        if not self.frames:
+            (self.first, self.last) = (None, None)
+        elif frame in (self.first, self.last):
+            self.first = min(self.frames)
+            self.last = max(self.frames)
+
+    def expire_writing(self):
+        now = time.time()
+        for (frame, last_event) in list(self.writing.items()):
+            if now - last_event >= WRITING_TIMEOUT:
+                del self.writing[frame]
+
+    def state(self, folder):
+        return RenderState(
+            folder, self.prefix, self.ext, self.padding, self.first,
+            self.last, len(self.frames), len(self.writing), self.last_write)
+
+
+class RenderWatcher(object):
+    """
+    Keeps an index of the image sequences of a set of folders, updated as
+    frames are written, renamed or removed.
+
+    The folders are watched with inotify on Linux, and checked for changes
+    every :data:`POLL_INTERVAL` seconds elsewhere. Folders that do not exist
+    yet, like the output folder of a Saver that has not rendered, are
+    watched once they appear. The index is seeded from the sequence
+    manifests, and then answers without touching the file system.
+
+    inotify only reports the changes made from this machine on a network
+    file system, which is what local renders and frame transfers are. The
+    frames written by the render farm are seen when the folder is watched
+    again.
+    """
+
+    def __init__(self, scanner=None, poll_interval=POLL_INTERVAL,
+                 logger=None):
+        """
+        :param scanner: :class:`SequenceScanner` seeding the index, defaults
+                        to the scanner of the session.
+        :param poll_interval: Seconds between two checks of the folders
+                              that do not exist yet, or of all the folders
+                              when inotify is not available.
+        :param logger: Logger receiving the errors.
+        """
+        self._scanner = scanner or get_sequence_scanner()
+        self._poll_interval = poll_interval
+        self._logger = logger
+        self._lock = threading.RLock()
+        # folder -> {(prefix, ext): _LiveSequence}
+        self._index = {}
+        # folders to watch, those not watched yet are pending
+        self._folders = set()
+        # folder -> watch descriptor, or folder mtime when polling
+        self._watched = {}
+        self._folder_of_watch = {}
+        self._running = True
+
+        self._inotify = None
+        if sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                self._log("Could not use inotify, folders are polled: %s", e)
+
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def folders(self):
+        """
+        Set of the folders watched.
+        """
+        with self._lock:
+            return set(self._folders)
+
+    def watch(self, folder):
+        """
+        Adds a folder to the folders watched, from the next check of the
+        watcher thread.
+        """
+        with self._lock:
+            self._folders.add(folder)
+
+    def set_folders(self, folders):
+        """
+        Watches the folders, and stops watching the other ones. The new
+        folders are watched from the next check of the watcher thread.
+
+        :param folders: Folders to watch, like the output folders of the
+                        Savers of the open comps.
+        """
+        folders = set(folders)
+        with self._lock:
+            for folder in self._folders - folders:
+                self._stop_watching(folder)
+            self._folders = folders
+
+    def state(self, path):
+        """
+        Returns the state of the sequence of a path, any of its frames or
+        with a frame token.
+
+        :returns: :class:`RenderState`, None if the folder of the path is not
+                  watched or the sequence has no frames.
+        """
+        key = sequence_key(path)
+        if key is None:
+            return None
+        (folder, prefix, ext) = key
+        with self._lock:
+            sequence = self._index.get(folder, {}).get((prefix, ext))
+            if sequence is None:
+                return None
+            sequence.expire_writing()
+            if not (sequence.frames or sequence.writing):
+                return None
+            return sequence.state(folder)
+
+    def gaps(self, path):
+        """
+        Returns the frames missing in the sequence of a path.
+
+        :returns: List of (first, last) frame ranges.
+        """
+        key = sequence_key(path)
+        if key is None:
+            return []
+        (folder, prefix, ext) = key
+        with self._lock:
+            sequence = self._index.get(folder, {}).get((prefix, ext))
+            frames = sorted(sequence.frames) if sequence is not None else []
+        return [
+            (previous + 1, frame - 1)
+            for (previous, frame) in zip(frames, frames[1:])
+            if frame - previous > 1
+        ]
+
+    def is_watched(self, folder):
+        """
+        True if the folder exists and is watched.
+        """
+        with self._lock:
+            return folder in self._watched
+
+    def stop(self):
+        """
+        Stops watching the folders.
+        """
+        with self._lock:
+            self._running = False
+            for folder in list(self._watched):
+                self._stop_watching(folder)
+            self._folders = set()
+
+    def _start_watching(self, folder):
+        # watched before it is scanned so no frame is missed
+        with self._lock:
+            if folder not in self._folders or folder in self._watched:
+                return
+            if self._inotify is not None:
+                try:
+                    wd = self._inotify.add_watch(folder, _WATCH_MASK)
+                except OSError:
+                    # does not exist yet
+                    return
+                self._watched[folder] = wd
+                self._folder_of_watch[wd] = folder
+            else:
+                try:
+                    self._watched[folder] = os.stat(folder).st_mtime
+                except OSError:
+                    return
+        self._seed(folder)
+
+    def _stop_watching(self, folder):
+        # called with the lock held
+        watch = self._watched.pop(folder, None)
+        self._index.pop(folder, None)
+        if self._inotify is not None and watch is not None:
+            self._folder_of_watch.pop(watch, None)
+            self._inotify.rm_watch(watch)
+
+    def _seed(self, folder, rebuild=False):
+        # scanned without the lock, the queries are not held by the file
+        # system. When rebuilding, the index of the folder is replaced by
+        # the scan, the frames it holds may have been removed since
+        sequences = {}
+        for (key, info) in self._scanner.scan(folder).items():
+            sequence = sequences[key] = _LiveSequence(
+                info.prefix, info.ext, info.padding)
+            for (frame, (size, mtime)) in info.frames.items():
+                sequence.add(frame, size, mtime)
+
+        with self._lock:
+            if folder not in self._watched:
+                return
+            # the frames seen since the folder is watched are more recent
+            # than the scan
+            seen_sequences = {} if rebuild else self._index.get(folder, {})
+            for (key, seen) in seen_sequences.items():
+                sequence = sequences.get(key)
+                if sequence is None:
+                    sequences[key] = seen
+                    continue
+                for (frame, (size, mtime)) in seen.frames.items():
+                    sequence.add(frame, size, mtime)
+                sequence.writing.update(seen.writing)
+                sequence.last_write = max(
+                    sequence.last_write, seen.last_write)
+            self._index[folder] = sequences
+
+    def _work(self):
+        last_poll = 0.0
+        while self._running:
+            if self._inotify is not None:
+                try:
+                    events = self._inotify.read_events(self._poll_interval)
+                except (OSError, select.error) as e:
+                    self._log("Could not read the render events: %s", e)
+                    events = []
+                    time.sleep(self._poll_interval)
+                overflow = False
+                with self._lock:
+                    for (wd, mask, name) in events:
+                        if mask & _IN_Q_OVERFLOW:
+                            overflow = True
+                        else:
+                            self._handle_event(wd, mask, name)
+                if overflow:
+                    # events were lost, start again from the file system
+                    for folder in self.folders:
+                        self._scanner.forget(folder)
+                        self._seed(folder, rebuild=True)
+            else:
+                time.sleep(self._poll_interval)
+
+            if time.time() - last_poll >= self._poll_interval:
+                last_poll = time.time()
+                self._poll()
+
+        if self._inotify is not None:
+            self._inotify.close()
+
+    def _poll(self):
+        with self._lock:
+            folders = list(self._folders)
+            watched = dict(self._watched)
+        for folder in folders:
+            if folder not in watched:
+                self._start_watching(folder)
+            elif self._inotify is None:
+                # scanned again when modified
+                try:
+                    mtime = os.stat(folder).st_mtime
+                except OSError:
+                    with self._lock:
+                        self._stop_watching(folder)
+                    continue
+                if mtime != watched[folder]:
+                    with self._lock:
+                        if folder in self._watched:
+                            self._watched[folder] = mtime
+                    self._seed(folder, rebuild=True)
+
+    def _handle_event(self, wd, mask, name):
+        # called with the lock held
+        folder = self._folder_of_watch.get(wd)
+        if folder is None:
+            return
+        if mask & (_IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF):
+            # gone, watched again if it comes back
+            self._watched.pop(folder, None)
+            self._folder_of_watch.pop(wd, None)
+            self._index.pop(folder, None)
+            return
+        if mask & _IN_ISDIR or not name:
+            return
+
+        (root, ext) = os.path.splitext(name)
+        match = _FRAME_RE.match(root)
+        if match is None:
+            return
+        (prefix, digits) = match.groups()
+        frame = int(digits)
+        sequences = self._index.setdefault(folder, {})
+        sequence = sequences.get((prefix, ext))
+        if sequence is None:
+            sequence = sequences[(prefix, ext)] = _LiveSequence(
+                prefix, ext, len(digits))
+
+        if mask & (_IN_DELETE | _IN_MOVED_FROM):
+            sequence.remove(frame)
+        elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+            try:
+                stat = os.stat(os.path.join(folder, name))
+            except OSError:
+                sequence.remove(frame)
+                return
+            sequence.add(frame, stat.st_size, stat.st_mtime, len(digits))
+        elif mask & (_IN_CREATE | _IN_MODIFY):
+            sequence.last_write = time.time()
+            sequence.writing[frame] = sequence.last_write
+
+    def _log(self, msg, *args):
+        if self._logger is not None:
+            self._logger.debug(msg, *args)
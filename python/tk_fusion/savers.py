@@ -0,0 +1,288 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Batch operations on the Shotgun Saver nodes of a comp.
+
+"""
+
+import os
+import re
+
+import tank
+from tank.util.filesystem import ensure_folder_exists
+
+from .fusion_attrs import get_attr, get_prefs, tool_clip
+
+
+# comp data entries of the Savers rendering to a local scratch folder: the
+# scratch folder, and the network clip of each of these Savers
+_SCRATCH_ROOT_DATA = "sgtk_scratch_root"
+_LOCAL_OUTPUTS_DATA = "sgtk_local_outputs"
+
+# collects the clip of every Saver of the comp in a single script run
+_READ_SAVER_CLIPS_SCRIPT = """
+local clips = {}
+for _, tool in pairs(comp:GetToolList(false, "Saver")) do
+    local clip = tool:GetAttrs("TOOLST_Clip_Name")
+    if clip then
+        clips[tool.Name] = clip[1]
+    end
+end
+return clips
+"""
+
+
+def fusion_clip_path(path):
+    """
+    Removes the frame number token from a templated path, Fusion adds the
+    frame numbers to the Saver clip itself.
+    """
+    return re.sub(r'%(\d+)d', '', path)
+
+
+def local_output_path(scratch_root, path):
+    """
+    Returns the path in the local scratch folder standing for a network
+    path, the network folders being recreated under the scratch folder.
+    """
+    relative_path = os.path.splitdrive(path)[1].lstrip("/\\")
+    return os.path.join(scratch_root, relative_path)
+
+
+def read_local_outputs(comp):
+    """
+    Returns the Savers of the comp rendering to a local scratch folder.
+
+    :param comp: Fusion comp.
+    :returns: Tuple (scratch folder, dictionary of Saver name to the network
+              clip the frames are transferred to). The scratch folder is None
+              if no Saver renders locally.
+    """
+    scratch_root = comp.GetData(_SCRATCH_ROOT_DATA)
+    outputs = comp.GetData(_LOCAL_OUTPUTS_DATA)
+    if not scratch_root or not outputs:
+        return (None, {})
+    return (scratch_root, dict(outputs))
+
+
+def _write_local_outputs(comp, scratch_root, outputs):
+    comp.SetData(_SCRATCH_ROOT_DATA, scratch_root if outputs else None)
+    comp.SetData(_LOCAL_OUTPUTS_DATA, outputs or None)
+
+
+def read_output_clips(comp):
+    """
+    Returns the clip every Saver of the comp ends up writing to, that is the
+    network clip for the Savers rendering to a local scratch folder.
+
+    :param comp: Fusion comp.
+    :returns: Dictionary of Saver name to clip path.
+    """
+    clips = read_saver_clips(comp)
+    clips.update(read_local_outputs(comp)[1])
+    return clips
+
+
+def read_saver_clips(comp):
+    """
+    Returns the clip path of every Saver of the comp.
+
+    The clips are gathered and returned by a Lua script run inside Fusion,
+    so reading them costs one bridge call whatever the number of Savers.
+    Falls back to reading the Savers one by one if the script could not
+    run.
+
+    :param comp: Fusion comp.
+    :returns: Dictionary of Saver name to clip path.
+    """
+    clips = comp.Execute(_READ_SAVER_CLIPS_SCRIPT)
+    if clips is not None:
+        return dict(clips)
+
+    clips = {}
+    for saver in comp.GetToolList(False, "Saver").values():
+        clip = tool_clip(saver)
+        if clip:
+            clips[get_attr(saver, "TOOLS_Name")] = clip
+    return clips
+
+
+class SaverChange(object):
+    """
+    A change of the clip of a Saver node.
+    """
+
+    def __init__(self, saver_name, old_path, new_path, old_version,
+                 new_version):
+        self.saver_name = saver_name
+        self.old_path = old_path
+        self.new_path = new_path
+        self.old_version = old_version
+        self.new_version = new_version
+
+    def __repr__(self):
+        return "<SaverChange %s v%03d -> v%03d>" % (
+            self.saver_name, self.old_version, self.new_version)
+
+
+def plan_saver_updates(engine, comp, work_path):
+    """
+    Works out which Savers of the comp write to a version other than the one
+    of the work file. Nothing is changed in the comp, so the result can be
+    reviewed before being applied with :func:`apply_saver_changes`.
+
+    :param engine: The Fusion engine.
+    :param comp: Fusion comp.
+    :param work_path: Path of the comp work file.
+    :returns: List of :class:`SaverChange`, sorted by Saver name.
+    """
+    resolver = engine.template_resolver
+
+    (work_template, work_fields) = \
+        resolver.template_and_fields_from_path(work_path)
+    if work_template is None or "version" not in work_fields:
+        return []
+    work_version = work_fields["version"]
+
+    changes = []
+    for (saver_name, path) in sorted(read_output_clips(comp).items()):
+        (template, fields) = resolver.template_and_fields_from_path(path)
+        if template is None or "version" not in fields:
+            continue
+
+        template_version = fields["version"]
+        if template_version != work_version:
+            fields["version"] = work_version
+            changes.append(SaverChange(
+                saver_name,
+                path,
+                fusion_clip_path(template.apply_fields(fields)),
+                template_version,
+                work_version,
+            ))
+
+    return changes
+
+
+def apply_saver_changes(comp, changes, undo_name="Update Shotgun Savers"):
+    """
+    Applies the Saver changes to the comp, as a single undo step and with
+    the comp locked. The Savers rendering to a local scratch folder are
+    moved to the scratch path of their new network clip.
+
+    :param comp: Fusion comp.
+    :param changes: List of :class:`SaverChange`.
+    """
+    if not changes:
+        return
+
+    (scratch_root, local_outputs) = read_local_outputs(comp)
+
+    comp.Lock()
+    comp.StartUndo(undo_name)
+    try:
+        for change in changes:
+            saver = comp.FindTool(change.saver_name)
+            if saver is None:
+                continue
+            if change.saver_name in local_outputs:
+                local_outputs[change.saver_name] = change.new_path
+                saver.Clip = local_output_path(scratch_root, change.new_path)
+            else:
+                saver.Clip = change.new_path
+    finally:
+        comp.EndUndo(True)
+        comp.Unlock()
+
+    if scratch_root:
+        _write_local_outputs(comp, scratch_root, local_outputs)
+
+
+def create_savers(engine, comp, work_path, ext_types, output_name="output",
+                  scratch_root=None):
+    """
+    Creates a Shotgun Saver for each of the given output types in one go.
+
+    The work file template and the comp frame size are only read once for
+    all the outputs, the output folders are created up front and the Savers
+    are added with the comp locked, as a single undo step.
+
+    With a scratch folder, the Savers render to a local copy of their
+    templated path under that folder, the rendered frames being moved to
+    the templated path by the engine frame transfer pool.
+
+    :param engine: The Fusion engine.
+    :param comp: Fusion comp.
+    :param work_path: Path of the comp work file.
+    :param ext_types: Output types, like 'dpx' or 'exr', as used in the
+                      fusion_<entity type>_render_mono_<type> templates.
+    :param output_name: Value of the output field of the templates.
+    :param scratch_root: Local folder the Savers render to, None to render
+                         straight to the templated paths.
+    :returns: Dictionary of output type to the Saver created for it.
+    """
+    (work_template, fields) = \
+        engine.template_resolver.template_and_fields_from_path(work_path)
+    if work_template is None:
+        raise tank.TankError(
+            "The comp '%s' is not a Shotgun work file." % work_path)
+
+    frame_format = get_prefs(
+        comp, "Comp.FrameFormat.Width", "Comp.FrameFormat.Height")
+    fields['height'] = int(frame_format["Comp.FrameFormat.Height"])
+    fields['width'] = int(frame_format["Comp.FrameFormat.Width"])
+    fields['output'] = output_name
+
+    entity_type = engine.context.entity.get("type").lower()
+
+    outputs = []
+    for ext_type in ext_types:
+        template_name = "fusion_%s_render_mono_%s" % (entity_type, ext_type)
+        template = engine.get_template_by_name(template_name)
+        if template is None:
+            engine.logger.warning(
+                "No template '%s' defined, skipping the %s output.",
+                template_name, ext_type)
+            continue
+        path = template.apply_fields(fields)
+        if scratch_root:
+            render_path = local_output_path(scratch_root, path)
+        else:
+            render_path = path
+        outputs.append((ext_type, path, render_path))
+
+    # Savers are created with CreateDir off, make sure their folders exist
+    for folder in set(os.path.dirname(path) for (_, _, path) in outputs):
+        ensure_folder_exists(folder)
+
+    (_, local_outputs) = read_local_outputs(comp)
+
+    savers = {}
+    comp.Lock()
+    comp.StartUndo("Create Shotgun Savers")
+    try:
+        for (ext_type, path, render_path) in outputs:
+            saver = comp.Saver({"Clip": fusion_clip_path(render_path)})
+            saver.CreateDir = 0
+            saver.SetAttrs({"TOOLS_Name": "shotgun_%s" % ext_type})
+            savers[ext_type] = saver
+            if scratch_root:
+                # Fusion may have renamed the Saver to keep names unique
+                local_outputs[get_attr(saver, "TOOLS_Name")] = \
+                    fusion_clip_path(path)
+    finally:
+        comp.EndUndo(True)
+        comp.Unlock()
+
+    if scratch_root:
+        _write_local_outputs(comp, scratch_root, local_outputs)
+
+    return savers
@@ -0,0 +1,344 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Sequences found in the render and publish folders, scanned once and shared
+by every session through a manifest kept in each folder.
+
+"""
+
+import json
+import os
+import re
+import stat
+import tempfile
+import threading
+import time
+
+from .lru_cache import LRUCache
+
+
+# hidden folder of each scanned folder holding its manifest, writing the
+# manifest there leaves the modification time of the folder untouched
+MANIFEST_FOLDER_NAME = ".sgtk_manifest"
+
+MANIFEST_FILE_NAME = "sequences.json"
+
+MANIFEST_VERSION = 1
+
+# number of folders kept in memory
+SCAN_CACHE_SIZE = 1024
+
+# folders modified more recently than this, in seconds, may still change
+# within the resolution of their modification time, they are not trusted to
+# a manifest
+_SETTLE_TIME = 2.0
+
+# frame number of a file name, without its extension
+_FRAME_RE = re.compile(r"^(.*?)(\d+)$")
+
+# frame number, frame tokens included, of a path without its extension
+_FRAME_TOKEN_RE = re.compile(r"(\d+|#+|%0?\d*d)$")
+
+
+class SequenceInfo(object):
+    """
+    Frames of an image sequence found in a folder.
+    """
+
+    def __init__(self, folder, prefix, ext, padding, frames):
+        """
+        :param folder: Folder of the sequence.
+        :param prefix: File name part before the frame number.
+        :param ext: File extension, with its dot.
+        :param padding: Number of digits of the frame numbers.
+        :param frames: Dictionary of frame number to a tuple (size, mtime)
+                       of the file when the folder was scanned. Frames
+                       written again in place leave the folder untouched,
+                       stat the files for their current size.
+        """
+        self.folder = folder
+        self.prefix = prefix
+        self.ext = ext
+        self.padding = padding
+        self.frames = frames
+
+    @property
+    def frame_numbers(self):
+        """
+        Sorted list of the frame numbers found.
+        """
+        return sorted(self.frames)
+
+    @property
+    def frame_range(self):
+        """
+        Tuple (first frame, last frame).
+        """
+        return (min(self.frames), max(self.frames))
+
+    def path(self, frame):
+        """
+        Returns the path of a frame of the sequence.
+        """
+        return os.path.join(self.folder, "%s%0*d%s" % (
+            self.prefix, self.padding, frame, self.ext))
+
+    def files(self):
+        """
+        Returns the paths of the frames found, in frame order.
+        """
+        return [self.path(frame) for frame in self.frame_numbers]
+
+    def as_dict(self):
+        return {
+            "prefix": self.prefix,
+            "ext": self.ext,
+            "padding": self.padding,
+            "frames": [
+                [frame, size, mtime]
+                for (frame, (size, mtime)) in sorted(self.frames.items())
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, folder, record):
+        return cls(
+            folder, record["prefix"], record["ext"], record["padding"],
+            dict((frame, (size, mtime))
+                 for (frame, size, mtime) in record["frames"]))
+
+
+def sequence_key(path):
+    """
+    Returns the key of the sequence of a path in the folder scans, a tuple
+    (folder, prefix, extension), or None if the path has no frame number.
+
+    The path can be any frame of the sequence, or have a frame token like
+    ``####`` or ``%04d``.
+    """
+    (folder, file_name) = os.path.split(path)
+    (root, ext) = os.path.splitext(file_name)
+    match = _FRAME_TOKEN_RE.search(root)
+    if match is None:
+        return None
+    return (folder, root[:match.start()], ext)
+
+
+class SequenceScanner(object):
+    """
+    Lists the image sequences of folders.
+
+    A folder scanned is described by a manifest, written atomically in a
+    hidden sub folder with the frames, sizes and modification times of its
+    sequences and the modification time of the folder. The manifest is used
+    instead of listing the folder again while the folder has the same
+    modification time, that is until files are added, removed or renamed in
+    it, by any session sharing the folder. Folders are also kept in memory,
+    checked against their modification time on every use. Files written
+    again in place do not change the folder, the sizes and modification
+    times of the frames are only those found by the scan.
+
+    Sessions which cannot write to a folder still read its manifest.
+    """
+
+    def __init__(self, write_manifests=True, cache_size=SCAN_CACHE_SIZE,
+                 logger=None):
+        """
+        :param write_manifests: False to only read the manifests written by
+                                others.
+        :param cache_size: Number of folders kept in memory.
+        :param logger: Logger receiving the manifests errors.
+        """
+        self.write_manifests = write_manifests
+        self.logger = logger
+        # folder -> (folder mtime, {(prefix, ext): SequenceInfo}, False if
+        # the folder was listed before it settled)
+        self._cache = LRUCache(cache_size)
+
+    def scan(self, folder):
+        """
+        Returns the sequences of a folder.
+
+        :param folder: Folder to scan.
+        :returns: Dictionary of (prefix, extension) to :class:`SequenceInfo`,
+                  empty if the folder does not exist.
+        """
+        try:
+            mtime = os.stat(folder).st_mtime
+        except OSError:
+            return {}
+
+        cached = self._cache.get(folder)
+        if cached is not None and cached[0] == mtime:
+            (_, sequences, settled) = cached
+            if settled or time.time() - mtime <= _SETTLE_TIME:
+                return sequences
+            # listed while files could still be added within the resolution
+            # of the folder mtime, listed again now it settled
+            sequences = None
+        else:
+            sequences = self._read_manifest(folder, mtime)
+
+        settled = True
+        if sequences is None:
+            (mtime, sequences) = self._scan(folder)
+            settled = time.time() - mtime > _SETTLE_TIME
+            if self.write_manifests and settled:
+                self._write_manifest(folder, mtime, sequences)
+        self._cache.set(folder, (mtime, sequences, settled))
+        return sequences
+
+    def find(self, path):
+        """
+        Returns the sequence of a path, any of its frames or with a frame
+        token, None if it has no frame number or no frames on disk.
+
+        :returns: :class:`SequenceInfo` or None
+        """
+        key = sequence_key(path)
+        if key is None:
+            return None
+        (folder, prefix, ext) = key
+        return self.scan(folder).get((prefix, ext))
+
+    def frame_range(self, path):
+        """
+        Returns the tuple (first frame, last frame) of the sequence of a
+        path, None if it has no frames on disk.
+        """
+        sequence = self.find(path)
+        return sequence.frame_range if sequence is not None else None
+
+    def forget(self, folder):
+        """
+        Drops the sequences of a folder kept in memory.
+        """
+        self._cache.pop(folder)
+
+    def _scan(self, folder):
+        manifest_folder = os.path.join(folder, MANIFEST_FOLDER_NAME)
+        if self.write_manifests and not os.path.isdir(manifest_folder):
+            # made before the listing, as it changes the folder mtime
+            try:
+                os.mkdir(manifest_folder)
+            except OSError:
+                pass
+
+        try:
+            mtime = os.stat(folder).st_mtime
+            file_names = os.listdir(folder)
+        except OSError:
+            return (0, {})
+
+        sequences = {}
+        for file_name in file_names:
+            (root, ext) = os.path.splitext(file_name)
+            match = _FRAME_RE.match(root)
+            if match is None:
+                continue
+            try:
+                file_stat = os.stat(os.path.join(folder, file_name))
+            except OSError:
+                continue
+            if not stat.S_ISREG(file_stat.st_mode):
+                continue
+            (prefix, digits) = match.groups()
+            sequence = sequences.get((prefix, ext))
+            if sequence is None:
+                sequence = sequences[(prefix, ext)] = SequenceInfo(
+                    folder, prefix, ext, len(digits), {})
+            # unpadded frame numbers have the length of the smallest one
+            sequence.padding = min(sequence.padding, len(digits))
+            sequence.frames[int(digits)] = (
+                file_stat.st_size, int(file_stat.st_mtime))
+        return (mtime, sequences)
+
+    def _read_manifest(self, folder, mtime):
+        manifest_path = os.path.join(
+            folder, MANIFEST_FOLDER_NAME, MANIFEST_FILE_NAME)
+        try:
+            with open(manifest_path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            if (manifest.get("version") != MANIFEST_VERSION or
+                    manifest.get("folder_mtime") != mtime):
+                return None
+            sequences = [
+                SequenceInfo.from_dict(folder, record)
+                for record in manifest["sequences"]
+            ]
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+        return dict(((sequence.prefix, sequence.ext), sequence)
+                    for sequence in sequences)
+
+    def _write_manifest(self, folder, mtime, sequences):
+        manifest_folder = os.path.join(folder, MANIFEST_FOLDER_NAME)
+        manifest_path = os.path.join(manifest_folder, MANIFEST_FILE_NAME)
+        temp_path = None
+        try:
+            (handle, temp_path) = tempfile.mkstemp(
+                prefix=MANIFEST_FILE_NAME + ".", suffix=".part",
+                dir=manifest_folder)
+            with os.fdopen(handle, "w") as manifest_file:
+                json.dump({
+                    "version": MANIFEST_VERSION,
+                    "folder_mtime": mtime,
+                    "sequences": [
+                        sequence.as_dict() for sequence in sequences.values()
+                    ],
+                }, manifest_file)
+            # the manifests may be shared with other platforms
+            os.chmod(temp_path, 0o664)
+            if os.name == "nt" and os.path.exists(manifest_path):
+                os.remove(manifest_path)
+            os.rename(temp_path, manifest_path)
+        except (IOError, OSError) as e:
+            # read only folders are scanned every time
+            if self.logger is not None:
+                self.logger.debug(
+                    "Could not write the sequence manifest of '%s': %s",
+                    folder, e)
+            if temp_path is not None and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+
+_scanner = None
+_scanner_lock = threading.Lock()
+
+
+def get_sequence_scanner():
+    """
+    Returns the :class:`SequenceScanner` shared by the session.
+    """
+    global _scanner
+    with _scanner_lock:
+        if _scanner is None:
+            _scanner = SequenceScanner()
+        return _scanner
+
+
+def find_sequence(path):
+    """
+    Returns the :class:`SequenceInfo` of a path with the scanner of the
+    session, see :meth:`SequenceScanner.find`.
+    """
+    return get_sequence_scanner().find(path)
+
+
+def sequence_range(path):
+    """
+    Returns the tuple (first frame, last frame) of the sequence of a path
+    with the scanner of the session, None if it has no frames on disk.
+    """
+    return get_sequence_scanner().frame_range(path)
@@ -0,0 +1,183 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Fast lookup of the template matching a path.
+
+"""
+
+import re
+
+import tank
+
+from .lru_cache import LRUCache
+
+
+# number of resolved paths remembered by the resolver
+RESOLVED_PATHS_CACHE_SIZE = 2048
+
+_SEPARATORS_RE = re.compile(r"[\\/]+")
+
+_NO_MATCH = (None, None)
+
+
+def _split_path(path):
+    """
+    Splits a path in its lower case components, whatever the separator.
+    Matching is case insensitive so the trie never rules out a template
+    the toolkit would match on a case insensitive file system.
+    """
+    return [part for part in _SEPARATORS_RE.split(path.lower()) if part]
+
+
+class _TrieNode(object):
+    """
+    Node of the template trie, one per path component.
+    """
+
+    __slots__ = ("static", "dynamic", "templates")
+
+    def __init__(self):
+        # component -> node, for components without keys
+        self.static = {}
+        # (static head, static tail) -> node, for components with keys
+        self.dynamic = {}
+        # templates whose definition ends at this node
+        self.templates = []
+
+
+class TemplateResolver(object):
+    """
+    Replacement for tk.template_from_path that only tests the templates
+    whose static parts match the path.
+
+    The path templates are stored in a trie of path components: components
+    without keys must match exactly, components with keys must start and
+    end with the static text around the keys, which tells apart for
+    instance a dpx and an exr render template. Only the templates reached
+    while walking the path are parsed, and the results are kept in an LRU
+    cache keyed by path.
+
+    Templates the trie cannot describe, like the ones with optional
+    sections, are always tested.
+    """
+
+    def __init__(self, tk, cache_size=RESOLVED_PATHS_CACHE_SIZE):
+        self._tk = tk
+        self._root = _TrieNode()
+        self._unindexed = []
+        self._cache = LRUCache(cache_size)
+
+        for template in tk.templates.values():
+            self._add_template(template)
+
+    def _add_template(self, template):
+        root_path = getattr(template, "root_path", None)
+        definition = template.definition
+
+        if not root_path or "[" in definition:
+            self._unindexed.append(template)
+            return
+
+        node = self._root
+        for part in _split_path(root_path) + _split_path(definition):
+            if "{" not in part:
+                node = node.static.setdefault(part, _TrieNode())
+            else:
+                # keep the static text around the keys of the component
+                head = part[:part.index("{")]
+                tail = part[part.rindex("}") + 1:]
+                node = node.dynamic.setdefault((head, tail), _TrieNode())
+        node.templates.append(template)
+
+    def _candidates(self, path):
+        nodes = [self._root]
+        for part in _split_path(path):
+            next_nodes = []
+            for node in nodes:
+                child = node.static.get(part)
+                if child is not None:
+                    next_nodes.append(child)
+                for ((head, tail), child) in node.dynamic.items():
+                    if (len(part) >= len(head) + len(tail) and
+                            part.startswith(head) and part.endswith(tail)):
+                        next_nodes.append(child)
+            nodes = next_nodes
+            if not nodes:
+                break
+
+        candidates = []
+        for node in nodes:
+            candidates.extend(node.templates)
+        return candidates + self._unindexed
+
+    def _resolve(self, path):
+        cached = self._cache.get(path)
+        if cached is not None:
+            return cached
+
+        matches = []
+        for template in self._candidates(path):
+            try:
+                fields = template.get_fields(path)
+            except tank.TankError:
+                continue
+            matches.append((template, fields))
+
+        if not matches:
+            resolved = _NO_MATCH
+        elif len(matches) == 1:
+            resolved = matches[0]
+        else:
+            # same error as tk.template_from_path, kept in the cache so it is
+            # raised again for the same path
+            resolved = (None, tank.TankError(
+                "%d templates are matching the path '%s'.\n"
+                "The overlapping templates are:\n%s" % (
+                    len(matches), path,
+                    "\n".join(str(match[0]) for match in matches))))
+
+        self._cache.set(path, resolved)
+        return resolved
+
+    def template_from_path(self, path):
+        """
+        Finds a template that describes the given path.
+
+        :param path: Path to test.
+        :returns: Template instance or None if no match could be found.
+        :raises: TankError if several templates match the path.
+        """
+        return self.template_and_fields_from_path(path)[0]
+
+    def template_and_fields_from_path(self, path):
+        """
+        Finds a template that describes the given path along with the fields
+        extracted from the path, saving a second parse of the path.
+
+        :param path: Path to test.
+        :returns: Tuple (template, fields), (None, None) if no match could be
+                  found.
+        :raises: TankError if several templates match the path.
+        """
+        (template, fields) = self._resolve(path)
+        if isinstance(fields, tank.TankError):
+            raise fields
+        if template is None:
+            return _NO_MATCH
+
+        # callers are free to modify the fields
+        return (template, dict(fields))
+
+    def clear_cache(self):
+        """
+        Forgets the paths resolved so far.
+        """
+        self._cache.clear()
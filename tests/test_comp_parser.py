@@ -0,0 +1,315 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Tests of the comp parser, on large comps generated like Fusion saves them.
+
+"""
+
+import imp
+import os
+import shutil
+import tempfile
+import unittest
+
+# the parser is loaded on its own, importing the tk_fusion package needs tank
+comp_parser = imp.load_source("tk_fusion_comp_parser", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "python", "tk_fusion", "comp_parser.py"))
+iter_comp_values = comp_parser.iter_comp_values
+parse_comp = comp_parser.parse_comp
+read_comp = comp_parser.read_comp
+
+
+# number of Loaders, each with a Blur, in the large comps
+LARGE_COMP_LOADERS = 2000
+
+
+def _loader_lines(index, indent="\t\t"):
+    return [
+        '%sLoader%d = Loader {' % (indent, index),
+        '%s\tClips = {' % indent,
+        '%s\t\tClip {' % indent,
+        '%s\t\t\tID = "Clip1",' % indent,
+        '%s\t\t\tFilename = "C:\\\\shots\\\\plate_%d.1001.exr",' % (
+            indent, index),
+        '%s\t\t\tFormatID = "OpenEXRFormat",' % indent,
+        '%s\t\t\tStartFrame = 1001,' % indent,
+        '%s\t\t\tLengthSetManually = true,' % indent,
+        '%s\t\t\tTrimIn = 0,' % indent,
+        '%s\t\t\tTrimOut = 99,' % indent,
+        '%s\t\t\tGlobalStart = 1001,' % indent,
+        '%s\t\t\tGlobalEnd = 1100' % indent,
+        '%s\t\t}' % indent,
+        '%s\t},' % indent,
+        '%s\tCtrlWZoom = false,' % indent,
+        '%s\tPassThrough = %s,' % (indent, "true" if index % 2 else "false"),
+        '%s\tInputs = {' % indent,
+        '%s\t\t["Gamut.SLogVersion"] = Input { Value = FuID { "SLog2" }, },'
+        % indent,
+        '%s\t\tGlobalIn = Input { Value = %d, },' % (indent, 1001 + index),
+        '%s\t\tGlobalOut = Input { Value = %d, },' % (indent, 1100 + index),
+        '%s\t},' % indent,
+        '%s\tViewInfo = OperatorInfo { Pos = { %d, -16.5 } },' % (
+            indent, index),
+        '%s},' % indent,
+    ]
+
+
+def _blur_lines(index, indent="\t\t"):
+    return [
+        '%sBlur%d = Blur {' % (indent, index),
+        '%s\tInputs = {' % indent,
+        '%s\t\tXBlurSize = Input { Expression = "time*2 -- { not", },'
+        % indent,
+        '%s\t\tInput = Input {' % indent,
+        '%s\t\t\tSourceOp = "Loader%d",' % (indent, index),
+        '%s\t\t\tSource = "Output",' % indent,
+        '%s\t\t},' % indent,
+        '%s\t},' % indent,
+        '%s\tPassThrough = true,' % indent,
+        '%s\tViewInfo = OperatorInfo { Pos = { 0, 0 } },' % indent,
+        '%s},' % indent,
+    ]
+
+
+def _saver_lines(name, clip, indent="\t\t"):
+    return [
+        '%s%s = Saver {' % (indent, name),
+        '%s\tInputs = {' % indent,
+        '%s\t\tClip = Input {' % indent,
+        '%s\t\t\tValue = Clip {' % indent,
+        '%s\t\t\t\tFilename = "%s",' % (indent, clip),
+        '%s\t\t\t\tFormatID = "OpenEXRFormat",' % indent,
+        '%s\t\t\t\tSaving = true,' % indent,
+        '%s\t\t\t},' % indent,
+        '%s\t\t},' % indent,
+        '%s\t\tComments = Input { Value = [[ { not a table' % indent,
+        '}]], },',
+        '%s\t\tOutputFormat = Input { Value = FuID { "OpenEXRFormat" }, },'
+        % indent,
+        '%s\t},' % indent,
+        '%s},' % indent,
+    ]
+
+
+def _large_comp_lines(loaders=LARGE_COMP_LOADERS):
+    """
+    Returns the lines of a comp with the given number of Loaders, each
+    followed by a Blur, and Savers at the top level and in nested groups.
+    """
+    lines = [
+        'Composition {',
+        '\tCurrentTime = 1001,',
+        '\tRenderRange = { 1001, 1100, },',
+        '\tGlobalRange = { 1001, 1200, },',
+        '\tCurrentID = 42,',
+        '\tPlaybackUpdateMode = 0,',
+        '\tVersion = "Fusion 9.0.2 build 15",',
+        '\tSavedOutputs = 2,',
+        '\tHeldTools = 0,',
+        '\tDisabledTools = 0,',
+        '\tLockedTools = 0,',
+        '\tAudioOffset = 0,',
+        '\tAutoRenderRange = true,',
+        '\tPrefs = {',
+        '\t\tComp = {',
+        '\t\t\tPaths = { Map = { ["Comp:"] = "/not/the/comp", }, },',
+        '\t\t\tFrameFormat = { Rate = 24, GuideRatio = 1.77777777777778, },',
+        '\t\t},',
+        '\t},',
+        '\tTools = ordered() {',
+    ]
+    for index in range(loaders):
+        lines += _loader_lines(index)
+        lines += _blur_lines(index)
+    lines += _saver_lines("Saver0", "Comp:/render/main..exr")
+    lines += [
+        '\t\tGroup1 = GroupOperator {',
+        '\t\t\tInputs = ordered() { Input1 = InstanceInput { '
+        'SourceOp = "Saver1", Source = "Input", }, },',
+        '\t\t\tTools = ordered() {',
+    ]
+    lines += _saver_lines("Saver1", "/renders/group..dpx", "\t\t\t\t")
+    lines += [
+        '\t\t\t\tGroup2 = MacroOperator {',
+        '\t\t\t\t\tTools = ordered() {',
+    ]
+    lines += _loader_lines(loaders, "\t\t\t\t\t\t")
+    lines += [
+        '\t\t\t\t\t},',
+        '\t\t\t\t},',
+        '\t\t\t},',
+        '\t\t},',
+        '-- { a comment with braces',
+        '\t\tSaver3 = Saver { Inputs = { Clip = Input { Value = Clip { '
+        'Filename = "/renders/inline..png", }, }, }, --[[ x { ]]',
+        '\t\t},',
+        '\t},',
+        '\tViews = {',
+        '\t\t{ FrameTypeID = "ChildFrame", Views = ordered() { '
+        'Main = MultiView { Active = "Flow", }, }, },',
+        '\t},',
+        '}',
+    ]
+    return [line + "\n" for line in lines]
+
+
+class TestCompParser(unittest.TestCase):
+    """
+    Tests reading the tools, clips and ranges of generated comps.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_folder = tempfile.mkdtemp()
+        cls.comp_path = os.path.join(cls.temp_folder, "shots", "large.comp")
+        os.makedirs(os.path.dirname(cls.comp_path))
+        with open(cls.comp_path, "w") as comp_file:
+            comp_file.writelines(_large_comp_lines())
+        cls.info = parse_comp(cls.comp_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_folder)
+
+    def _tool(self, name):
+        tools = [tool for tool in self.info.tools if tool.name == name]
+        self.assertEqual(len(tools), 1, name)
+        return tools[0]
+
+    def test_comp_ranges(self):
+        self.assertEqual(self.info.render_range, (1001, 1100))
+        self.assertEqual(self.info.global_range, (1001, 1200))
+
+    def test_tools(self):
+        # the Blurs and the groups are listed too
+        self.assertEqual(
+            len(self.info.tools), 2 * LARGE_COMP_LOADERS + 6)
+        self.assertEqual(len(self.info.loaders), LARGE_COMP_LOADERS + 1)
+        self.assertEqual(
+            [saver.name for saver in self.info.savers],
+            ["Saver0", "Saver1", "Saver3"])
+
+    def test_loader_clips(self):
+        for index in (0, LARGE_COMP_LOADERS // 2, LARGE_COMP_LOADERS - 1):
+            loader = self._tool("Loader%d" % index)
+            self.assertEqual(loader.type, "Loader")
+            self.assertEqual(
+                loader.clips, ["C:\\shots\\plate_%d.1001.exr" % index])
+            self.assertIsNone(loader.group)
+
+    def test_global_in_out(self):
+        for index in (0, LARGE_COMP_LOADERS - 1):
+            loader = self._tool("Loader%d" % index)
+            self.assertEqual(loader.global_in, 1001 + index)
+            self.assertEqual(loader.global_out, 1100 + index)
+        # values of the clip itself are not the tool range
+        saver = self._tool("Saver0")
+        self.assertIsNone(saver.global_in)
+        self.assertIsNone(saver.global_out)
+
+    def test_saver_clips(self):
+        self.assertEqual(
+            self._tool("Saver0").clips, ["Comp:/render/main..exr"])
+        self.assertEqual(self._tool("Saver3").clips, ["/renders/inline..png"])
+
+    def test_groups(self):
+        self.assertEqual(self._tool("Group1").type, "GroupOperator")
+        self.assertEqual(self._tool("Group2").group, "Group1")
+        saver = self._tool("Saver1")
+        self.assertEqual(saver.group, "Group1")
+        self.assertEqual(saver.clips, ["/renders/group..dpx"])
+        loader = self._tool("Loader%d" % LARGE_COMP_LOADERS)
+        self.assertEqual(loader.group, "Group2")
+        self.assertEqual(
+            loader.clips,
+            ["C:\\shots\\plate_%d.1001.exr" % LARGE_COMP_LOADERS])
+        # tools after the groups are back at the top level
+        self.assertIsNone(self._tool("Saver3").group)
+
+    def test_pass_through(self):
+        self.assertTrue(self._tool("Loader1").pass_through)
+        self.assertFalse(self._tool("Loader0").pass_through)
+        # the tools other than Loaders and Savers are not read
+        self.assertFalse(self._tool("Blur0").pass_through)
+
+    def test_comp_path_expansion(self):
+        expected = os.path.normpath(os.path.join(
+            os.path.dirname(self.comp_path), "render", "main..exr"))
+        self.assertEqual(
+            self.info.expand_path("Comp:/render/main..exr"), expected)
+        self.assertEqual(
+            self.info.expand_path("Comp:render\\main..exr".replace(
+                "\\", os.sep)), expected)
+        # other paths are left as they are
+        self.assertEqual(
+            self.info.expand_path("/renders/group..dpx"),
+            "/renders/group..dpx")
+        # without the path of the comp there is nothing to expand against
+        info = read_comp(_large_comp_lines(1))
+        self.assertEqual(
+            info.expand_path("Comp:/render/main..exr"),
+            "Comp:/render/main..exr")
+
+    def test_read_lines(self):
+        info = read_comp(_large_comp_lines(3), self.comp_path)
+        self.assertEqual(
+            [loader.name for loader in info.loaders],
+            ["Loader0", "Loader1", "Loader2", "Loader3"])
+        self.assertEqual(info.render_range, (1001, 1100))
+
+
+class TestIterCompValues(unittest.TestCase):
+    """
+    Tests the values read from nested tables.
+    """
+
+    def test_nested_tables(self):
+        values = list(iter_comp_values([
+            'Composition {\n',
+            '\tTools = ordered() {\n',
+            '\t\tMerge1 = Merge { Inputs = { Blend = Input { Value = 0.5, '
+            '}, }, },\n',
+            '\t},\n',
+            '\tList = { 1, "two", { three = true, }, nil, },\n',
+            '\t["Quoted.Key"] = { [1] = -2.5e3, },\n',
+            '}\n',
+        ]))
+        # the comp itself is the first entry of the file
+        self.assertIn(((1,), "Composition", None), values)
+        self.assertIn(((1, "Tools", "Merge1"), "Merge", None), values)
+        self.assertIn(
+            ((1, "Tools", "Merge1", "Inputs", "Blend", "Value"), None, 0.5),
+            values)
+        self.assertIn(((1, "List", 1), None, 1), values)
+        self.assertIn(((1, "List", 2), None, "two"), values)
+        self.assertIn(((1, "List", 3), None, None), values)
+        self.assertIn(((1, "List", 3, "three"), None, True), values)
+        self.assertIn(((1, "List", 4), None, None), values)
+        self.assertIn(((1, "Quoted.Key"), None, None), values)
+        self.assertIn(((1, "Quoted.Key", 1), None, -2500), values)
+
+    def test_skip_table(self):
+        lines = [
+            'Composition {\n',
+            '\tViewInfo = { Pos = { 1, 2 }, Name = "{ x", },\n',
+            '\tKept = 1,\n',
+            '}\n',
+        ]
+        values = list(iter_comp_values(
+            lines, lambda path, constructor: path[-1] == "ViewInfo"))
+        self.assertIn(((1, "Kept"), None, 1), values)
+        self.assertFalse(
+            [path for (path, _, _) in values if "Pos" in path])
+
+
+if __name__ == "__main__":
+    unittest.main()
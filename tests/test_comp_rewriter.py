@@ -0,0 +1,136 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Tests of the comp rewriter rules, applied together on the clips of a comp.
+
+"""
+
+import io
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python"))
+
+try:
+    from tk_fusion.comp_rewriter import (  # noqa: E402
+        PlatformRoots, VersionUp, rewrite_comp_lines)
+    from tk_fusion.path_mapping import PathMapper  # noqa: E402
+except ImportError:
+    # the package needs tank
+    PlatformRoots = None
+
+
+class _VersionKey(object):
+
+    def str_from_value(self, value):
+        return "%03d" % value
+
+
+class _Template(object):
+    """
+    Stands for the toolkit template of the comp renders.
+    """
+
+    definition = "shots/{Shot}/renders/{Shot}_v{version}.{SEQ}.exr"
+    keys = {"version": _VersionKey()}
+
+    _regex = re.compile(
+        r"^/mnt/proj/shots/(\w+)/renders/\w+_v(\d{3})\.(\d+)\.exr$")
+
+    def get_fields(self, path):
+        match = self._regex.match(path.replace("\\", "/"))
+        if match is None:
+            return None
+        return {"Shot": match.group(1), "version": int(match.group(2)),
+                "SEQ": int(match.group(3))}
+
+
+class _Resolver(object):
+
+    def __init__(self):
+        self.template = _Template()
+
+    def template_and_fields_from_path(self, path):
+        fields = self.template.get_fields(path)
+        return (self.template if fields else None, fields)
+
+
+def _saver_lines(name, clip):
+    return [
+        '\t\t%s = Saver {\n' % name,
+        '\t\t\tInputs = {\n',
+        '\t\t\t\tClip = Input {\n',
+        '\t\t\t\t\tValue = Clip {\n',
+        '\t\t\t\t\t\tFilename = "%s",\n' % clip.replace("\\", "\\\\"),
+        '\t\t\t\t\t\tSaving = true,\n',
+        '\t\t\t\t\t},\n',
+        '\t\t\t\t},\n',
+        '\t\t\t},\n',
+        '\t\t},\n',
+    ]
+
+
+@unittest.skipIf(PlatformRoots is None, "tank is not available")
+class TestPlatformRootsVersionUp(unittest.TestCase):
+    """
+    Moves the clips to the Linux root and versions them up in one pass.
+    """
+
+    def setUp(self):
+        self.roots = PlatformRoots("/mnt/proj", platform="linux2")
+        self.roots._path_mapper = PathMapper([("P:\\proj", "/mnt/proj")])
+        self.version_up = VersionUp("/mnt/proj", version=5)
+        self.version_up._resolver = _Resolver()
+        self.version_up._listings = {}
+        self.version_up._path_mapper = PathMapper([])
+
+    def _rewrite(self, clips):
+        lines = ['Composition {\n', '\tTools = ordered() {\n']
+        for (index, clip) in enumerate(clips):
+            lines.extend(_saver_lines("Saver%d" % index, clip))
+        lines.extend(['\t},\n', '}\n'])
+        out = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+        changes = rewrite_comp_lines(
+            lines, out, [self.roots, self.version_up],
+            "/mnt/proj/shots/sh010/sh010_comp.comp")
+        return (dict((name, new) for (name, _, new) in changes),
+                out.getvalue())
+
+    def test_platform_root_kept(self):
+        (changes, text) = self._rewrite(
+            ["P:\\proj\\shots\\sh010\\renders\\sh010_v003.1001.exr"])
+        self.assertEqual(
+            changes["Saver0"],
+            "/mnt/proj/shots/sh010/renders/sh010_v005.1001.exr")
+        self.assertIn('"/mnt/proj/shots/sh010/renders/sh010_v005.1001.exr"',
+                      text)
+
+    def test_comp_clip_kept_relative(self):
+        (changes, _) = self._rewrite(["Comp:/renders/sh010_v003.1001.exr"])
+        self.assertEqual(
+            changes["Saver0"], "Comp:/renders/sh010_v005.1001.exr")
+
+    def test_only_version_changes(self):
+        (changes, _) = self._rewrite(
+            ["P:/proj/shots/sh010/renders/sh010_v003.0003.exr",
+             "/mnt/proj/shots/sh010/renders/sh010_v005.1001.exr"])
+        # the frame number spelled like the version is left alone, and a
+        # clip already at the version is not rewritten
+        self.assertEqual(
+            changes, {
+                "Saver0": "/mnt/proj/shots/sh010/renders/sh010_v005.0003.exr"})
+
+
+if __name__ == "__main__":
+    unittest.main()